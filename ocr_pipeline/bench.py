@@ -0,0 +1,483 @@
+"""
+Throughput benchmark for the ocr_pipeline extraction stages.
+
+A deterministic synthetic corpus is generated locally (no downloads):
+text PDFs, image-only PDFs, simulated scans (skewed, speckled page
+images) and mixed PDFs rendered with PyMuPDF, plus EPUB and DOCX files.
+Image and scan PDFs get a <stem>.truth.json with the text of each page.
+Each stage then runs over its part of the corpus in a fresh process, so
+peak RSS is measured per stage:
+
+    pdf_text   engine.pdf_pages over text and mixed PDFs
+    ocr        ocr.ocr_pages over image-only PDFs and scans (OCR cache
+               disabled; skipped if tesseract/poppler are not installed)
+    ocr_preprocess  the same with OCR_PREPROCESS on
+    preprocess ocr_preprocess.preprocess over the pages of the image-only
+               PDFs and scans, rendered at LOW_DPI beforehand
+    epub       engine.epub_pages (streaming, epub_reader.py)
+    epub_ebooklib  the previous ebooklib + BeautifulSoup extractor, for
+                   comparison
+    docx       engine.docx_pages (streaming, docx_reader.py)
+    docx_python_docx  the previous python-docx extractor, for comparison
+    clean      engine.clean over every extracted PDF page
+    quality    quality.score_text over the cleaned pages
+    chunk      chunker.TokenChunker over the cleaned pages
+
+The report is JSON: pages/s, MB/s (input bytes, text bytes for clean,
+quality and chunk, megapixels for preprocess), seconds and peak RSS per
+stage, plus the corpus and host, so two runs can be compared with
+--compare. The OCR stages also report char_accuracy (characters matched
+against the truth text / truth length) and preprocess the share of
+pixels left after cropping.
+
+Usage:
+    python bench.py --out bench_results/today.json
+    python bench.py --out new.json --compare bench_results/today.json
+"""
+
+from pathlib import Path
+import multiprocessing as mp
+import argparse
+import json
+import os
+import platform
+import queue
+import random
+import resource
+import shutil
+import statistics
+import time
+import fitz  # PyMuPDF
+
+CORPUS_VERSION = 3  # bump when the generated corpus changes
+SEED = 1234
+PAGE_WORDS = 350
+REPEAT = 3  # runs per stage; the fastest one is reported
+STAGE_TIMEOUT = float(os.getenv("BENCH_STAGE_TIMEOUT", "3600"))  # seconds per run before it counts as failed
+
+WORDS = (
+    "the of and to in is that for it as with was on be by this are from at or an which "
+    "system data model process value function energy number matrix theory equation result "
+    "method analysis structure network signal field rate order power form state example "
+    "section figure table chapter problem solution particle vector space time law"
+).split()
+
+# -----------------------
+# Synthetic corpus
+# -----------------------
+
+def paragraph(rng, words=80):
+    text = " ".join(rng.choice(WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + "."
+
+def page_text(rng, page_no):
+    """One page of prose with a running header and a page number for clean() to chew on"""
+    paras = [paragraph(rng) for _ in range(PAGE_WORDS // 80)]
+    return "Synthetic Benchmark Book\n\n" + "\n\n".join(paras) + f"\n\n{page_no}"
+
+def scan_image(pix, rng):
+    """A rendered page made to look scanned: rotated a few degrees, with speckle; returns PNG bytes"""
+    import io
+    import numpy as np
+    from PIL import Image
+    image = Image.frombytes("L", (pix.width, pix.height), pix.samples)
+    image = image.rotate(rng.uniform(-3, 3), resample=Image.BILINEAR, fillcolor=255)
+    a = np.asarray(image).astype(np.int16)
+    noise = np.random.default_rng(rng.randrange(1 << 32))
+    a += noise.normal(0, 12, a.shape).astype(np.int16)
+    a[noise.random(a.shape) < 0.002] = 0  # dust
+    out = io.BytesIO()
+    Image.fromarray(a.clip(0, 255).astype(np.uint8)).save(out, "PNG")
+    return out.getvalue()
+
+def write_pdf(path, rng, pages, image_every=0, scan=False):
+    """Text PDF; every image_every-th page is rasterised instead (0 = none, 1 = all), as a scan if scan
+
+    Returns the text of the rasterised pages, for OCR accuracy.
+    """
+    doc = fitz.open()
+    truth = []
+    for i in range(1, pages + 1):
+        page = doc.new_page()
+        text = page_text(rng, i)
+        page.insert_textbox(fitz.Rect(50, 50, 545, 792), text, fontsize=9)
+        if image_every and i % image_every == 0:
+            pix = page.get_pixmap(dpi=150, colorspace=fitz.csGRAY)
+            doc.delete_page(-1)
+            rect = fitz.Rect(0, 0, 595, 842)
+            if scan:
+                doc.new_page().insert_image(rect, stream=scan_image(pix, rng))
+            else:
+                doc.new_page().insert_image(rect, pixmap=pix)
+            truth.append(text)
+    doc.save(path, garbage=3, deflate=True)
+    doc.close()
+    return truth
+
+def write_epub(path, rng, chapters):
+    from ebooklib import epub
+    book = epub.EpubBook()
+    book.set_identifier(f"bench-{path.stem}")
+    book.set_title(path.stem)
+    book.set_language("en")
+    items = []
+    for i in range(1, chapters + 1):
+        body = "".join(f"<p>{paragraph(rng)}</p>" for _ in range(PAGE_WORDS // 80))
+        item = epub.EpubHtml(title=f"Chapter {i}", file_name=f"ch{i:03d}.xhtml", lang="en")
+        item.content = f"<html><body><h1>Chapter {i}</h1>{body}</body></html>"
+        book.add_item(item)
+        items.append(item)
+    book.toc = items
+    book.spine = ["nav"] + items
+    book.add_item(epub.EpubNcx())
+    book.add_item(epub.EpubNav())
+    epub.write_epub(str(path), book)
+
+def write_docx(path, rng, sections):
+    import docx
+    d = docx.Document()
+    for i in range(1, sections + 1):
+        d.add_heading(f"Section {i}", level=1)
+        for _ in range(PAGE_WORDS // 80):
+            d.add_paragraph(paragraph(rng))
+        table = d.add_table(rows=3, cols=3)
+        for row in table.rows:
+            for cell in row.cells:
+                cell.text = rng.choice(WORDS)
+    d.save(path)
+
+def corpus_spec(scale):
+    """(kind, file name, generator args) of every corpus file"""
+    spec = []
+    for i in range(4 * scale):
+        spec.append(("text_pdf", f"text_{i:02d}.pdf", {"pages": 50}))
+    for i in range(2 * scale):
+        spec.append(("image_pdf", f"image_{i:02d}.pdf", {"pages": 4, "image_every": 1}))
+    for i in range(2 * scale):
+        spec.append(("scan_pdf", f"scan_{i:02d}.pdf", {"pages": 4, "image_every": 1, "scan": True}))
+    for i in range(2 * scale):
+        spec.append(("mixed_pdf", f"mixed_{i:02d}.pdf", {"pages": 20, "image_every": 4}))
+    for i in range(3 * scale):
+        spec.append(("epub", f"book_{i:02d}.epub", {"chapters": 30}))
+    for i in range(scale):
+        spec.append(("epub", f"large_{i:02d}.epub", {"chapters": 400}))
+    for i in range(3 * scale):
+        spec.append(("docx", f"doc_{i:02d}.docx", {"sections": 30}))
+    return spec
+
+def truth_path(path):
+    return Path(path).with_suffix(".truth.json")
+
+def build_corpus(corpus_dir, scale=1):
+    """Generate the corpus under corpus_dir unless an identical one is already there"""
+    corpus_dir = Path(corpus_dir)
+    marker = corpus_dir / "corpus.json"
+    key = {"version": CORPUS_VERSION, "seed": SEED, "scale": scale}
+    if marker.exists() and json.loads(marker.read_text(encoding="utf-8")).get("key") == key:
+        return json.loads(marker.read_text(encoding="utf-8"))
+
+    if corpus_dir.exists():
+        shutil.rmtree(corpus_dir)
+    corpus_dir.mkdir(parents=True)
+    print(f"🏗️  Generating benchmark corpus in {corpus_dir}/ ...")
+    files = {}
+    for kind, name, args in corpus_spec(scale):
+        rng = random.Random(f"{SEED}:{name}")
+        path = corpus_dir / name
+        if kind.endswith("_pdf"):
+            truth = write_pdf(path, rng, **args)
+            if kind in ("image_pdf", "scan_pdf"):
+                truth_path(path).write_text(json.dumps(truth), encoding="utf-8")
+        elif kind == "epub":
+            write_epub(path, rng, **args)
+        else:
+            write_docx(path, rng, **args)
+        files.setdefault(kind, []).append(name)
+
+    size = sum((corpus_dir / f).stat().st_size for names in files.values() for f in names)
+    info = {"key": key, "files": files, "bytes": size}
+    marker.write_text(json.dumps(info, indent=2), encoding="utf-8")
+    return info
+
+# -----------------------
+# Stages (each runs in its own process)
+# -----------------------
+
+def consume(pages):
+    """Drain a page generator; returns (pages, chars)"""
+    n = chars = 0
+    for text in pages:
+        n += 1
+        chars += len(text)
+    return n, chars
+
+def extractor_stage(module, name):
+    """Stage that drains module.name(path) for every input file"""
+    def stage(paths):
+        extractor = getattr(__import__(module), name)
+        pages = sum(consume(extractor(p))[0] for p in paths)
+        return pages, sum(p.stat().st_size for p in paths)
+    return stage
+
+def ebooklib_epub_pages(path):
+    """The extractor epub_reader replaced: whole book via ebooklib, one soup per item"""
+    from ebooklib import epub
+    from bs4 import BeautifulSoup
+    book = epub.read_epub(path)
+    for item in book.get_items():
+        if item.get_type() == 9:
+            soup = BeautifulSoup(item.get_content(), "html.parser")
+            yield soup.get_text()
+
+def stage_epub_ebooklib(paths):
+    pages = sum(consume(ebooklib_epub_pages(p))[0] for p in paths)
+    return pages, sum(p.stat().st_size for p in paths)
+
+def python_docx_pages(path):
+    """The extractor docx_reader replaced: full python-docx model, body paragraphs only"""
+    import docx
+    d = docx.Document(path)
+    yield "\n".join(p.text for p in d.paragraphs)
+
+def stage_docx_python_docx(paths):
+    pages = sum(consume(python_docx_pages(p))[0] for p in paths)
+    return pages, sum(p.stat().st_size for p in paths)
+
+def stage_ocr(paths):
+    """OCR every page; the texts are returned for ocr_accuracy"""
+    import ocr
+    import ocr_cache
+    ocr_cache.OCR_CACHE_MAX_MB = 0  # measure OCR, not cache hits
+    texts = {p: list(ocr.ocr_pages(p)) for p in paths}
+    return sum(len(t) for t in texts.values()), sum(p.stat().st_size for p in paths), texts
+
+def stage_ocr_preprocess(paths):
+    import ocr
+    ocr.OCR_PREPROCESS = True
+    return stage_ocr(paths)
+
+def ocr_accuracy(texts):
+    """Share of truth characters OCR got right, whitespace-normalised (untimed)"""
+    from difflib import SequenceMatcher
+    matched = total = 0
+    for path, pages in texts.items():
+        for truth, text in zip(json.loads(truth_path(path).read_text(encoding="utf-8")), pages):
+            truth, text = " ".join(truth.split()), " ".join(text.split())
+            m = SequenceMatcher(None, truth, text, autojunk=False)
+            matched += sum(b.size for b in m.get_matching_blocks())
+            total += len(truth)
+    return {"char_accuracy": round(matched / total, 4) if total else None}
+
+def rendered_pages(paths):
+    """Every page rendered at the OCR's LOW_DPI, as PIL images (no poppler needed)"""
+    from PIL import Image
+    from ocr import LOW_DPI
+    images = []
+    for path in paths:
+        with fitz.open(path) as doc:
+            for page in doc:
+                pix = page.get_pixmap(dpi=LOW_DPI)
+                images.append(Image.frombytes("RGB", (pix.width, pix.height), pix.samples))
+    return images
+
+def stage_preprocess(images):
+    from ocr import LOW_DPI
+    from ocr_preprocess import preprocess
+    out = [preprocess(image, LOW_DPI) for image in images]
+    pixels = sum(i.width * i.height for i in images)
+    return len(images), pixels, {"pixels_kept": round(sum(i.width * i.height for i in out) / pixels, 3)}
+
+def raw_pdf_pages(paths):
+    from engine import pdf_pages
+    return [t for p in paths for t in pdf_pages(p)]
+
+def clean_pdf_pages(paths):
+    from engine import clean
+    return [clean(t) for t in raw_pdf_pages(paths)]
+
+def stage_clean(texts):
+    from engine import clean
+    for t in texts:
+        clean(t)
+    return len(texts), sum(len(t.encode("utf-8")) for t in texts)
+
+def stage_quality(texts):
+    from quality import score_text
+    for t in texts:
+        score_text(t)
+    return len(texts), sum(len(t.encode("utf-8")) for t in texts)
+
+def stage_chunk(texts):
+    from chunker import TokenChunker, get_tokenizer, CHUNK_TOKENIZER, CHUNK_TOKENS, CHUNK_OVERLAP
+    chunker = TokenChunker(get_tokenizer(CHUNK_TOKENIZER), CHUNK_TOKENS, CHUNK_OVERLAP)
+    for i, t in enumerate(texts, start=1):
+        for _ in chunker.feed(t, i):
+            pass
+    for _ in chunker.flush():
+        pass
+    return len(texts), sum(len(t.encode("utf-8")) for t in texts)
+
+# name -> (stage function, corpus kinds it reads, untimed set-up turning paths into its input)
+STAGES = {
+    "pdf_text": (extractor_stage("engine", "pdf_pages"), ("text_pdf", "mixed_pdf"), None),
+    "ocr": (stage_ocr, ("image_pdf", "scan_pdf"), None),
+    "ocr_preprocess": (stage_ocr_preprocess, ("image_pdf", "scan_pdf"), None),
+    "preprocess": (stage_preprocess, ("image_pdf", "scan_pdf"), rendered_pages),
+    "epub": (extractor_stage("engine", "epub_pages"), ("epub",), None),
+    "epub_ebooklib": (stage_epub_ebooklib, ("epub",), None),
+    "docx": (extractor_stage("engine", "docx_pages"), ("docx",), None),
+    "docx_python_docx": (stage_docx_python_docx, ("docx",), None),
+    "clean": (stage_clean, ("text_pdf", "mixed_pdf"), raw_pdf_pages),
+    "quality": (stage_quality, ("text_pdf", "mixed_pdf"), clean_pdf_pages),
+    "chunk": (stage_chunk, ("text_pdf", "mixed_pdf"), clean_pdf_pages),
+}
+
+# Stages whose raw output is scored after the clock stops
+SCORERS = {"ocr": ocr_accuracy, "ocr_preprocess": ocr_accuracy}
+OCR_STAGES = ("ocr", "ocr_preprocess")
+EXTRA_METRICS = ("char_accuracy", "pixels_kept")
+
+PRELOAD = ("engine", "ocr", "ocr_preprocess", "chunker", "quality", "epub_reader", "ebooklib.epub", "bs4", "docx")
+
+def ocr_available():
+    return shutil.which("tesseract") is not None and shutil.which("pdftoppm") is not None
+
+def peak_rss_mb(who):
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(who).ru_maxrss / 1024
+
+def stage_main(name, paths, results):
+    """Child process: run one stage once and report its measurements"""
+    func, _, prepare = STAGES[name]
+    # Imports (PyMuPDF, lxml, ...) are start-up cost, not stage time
+    for module in PRELOAD:
+        __import__(module)
+    arg = prepare(paths) if prepare else paths
+    baseline = peak_rss_mb(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+    pages, nbytes, *output = func(arg)
+    seconds = time.perf_counter() - start
+    metrics = {
+        "seconds": seconds,
+        "pages": pages,
+        "bytes": nbytes,
+        "baseline_rss_mb": round(baseline, 1),
+        "peak_rss_mb": round(peak_rss_mb(resource.RUSAGE_SELF), 1),
+        "children_peak_rss_mb": round(peak_rss_mb(resource.RUSAGE_CHILDREN), 1),
+    }
+    # A third return value is either extra metrics or output for the stage's scorer
+    if output:
+        metrics.update(SCORERS[name](output[0]) if name in SCORERS else output[0])
+    results.put(metrics)
+
+def wait_result(proc, results, timeout=STAGE_TIMEOUT):
+    """The child's measurements, or why there are none (it died or ran out of time)"""
+    deadline = time.time() + timeout
+    while True:
+        try:
+            return results.get(timeout=1.0), None
+        except queue.Empty:
+            pass
+        if not proc.is_alive():
+            try:
+                return results.get(timeout=1.0), None  # sent just before it exited
+            except queue.Empty:
+                return None, f"exit code {proc.exitcode}"
+        if time.time() > deadline:
+            proc.kill()
+            return None, f"timed out after {timeout:.0f}s"
+
+def run_stage(name, paths, repeat=REPEAT):
+    ctx = mp.get_context("spawn")  # a clean interpreter per run, so RSS is this stage's alone
+    runs = []
+    for _ in range(repeat):
+        results = ctx.Queue()
+        proc = ctx.Process(target=stage_main, args=(name, paths, results))
+        proc.start()
+        result, error = wait_result(proc, results)
+        proc.join()
+        if error:
+            return {"failed": error}
+        runs.append(result)
+
+    best = min(runs, key=lambda r: r["seconds"])
+    seconds = best["seconds"]
+    return {
+        **best,
+        "seconds": round(seconds, 4),
+        "median_seconds": round(statistics.median(r["seconds"] for r in runs), 4),
+        "runs": repeat,
+        "pages_per_sec": round(best["pages"] / seconds, 2) if seconds else None,
+        "mb_per_sec": round(best["bytes"] / 1e6 / seconds, 3) if seconds else None,
+        "peak_rss_mb": max(r["peak_rss_mb"] for r in runs),
+    }
+
+# -----------------------
+# Run
+# -----------------------
+
+def host_info():
+    info = {
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpu_count": mp.cpu_count(),
+        "pymupdf": fitz.VersionBind,
+    }
+    if ocr_available():
+        import pytesseract
+        info["tesseract"] = str(pytesseract.get_tesseract_version())
+    return info
+
+def bench(corpus_dir, stages=None, scale=1, repeat=REPEAT):
+    corpus = build_corpus(corpus_dir, scale)
+    report = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": host_info(),
+        "corpus": {"dir": str(corpus_dir), "scale": scale, "bytes": corpus["bytes"],
+                   "files": {k: len(v) for k, v in corpus["files"].items()}},
+        "stages": {}
+    }
+    for name in stages or STAGES:
+        _, kinds, _ = STAGES[name]
+        if name in OCR_STAGES and not ocr_available():
+            report["stages"][name] = {"skipped": "tesseract/poppler not installed"}
+            print(f"⏭️  {name}: skipped (tesseract/poppler not installed)")
+            continue
+        paths = [Path(corpus_dir) / f for k in kinds for f in corpus["files"].get(k, [])]
+        r = run_stage(name, paths, repeat)
+        report["stages"][name] = r
+        if "failed" in r:
+            print(f"❌ {name}: failed ({r['failed']})")
+            continue
+        print(f"⏱️  {name:<16} {r['pages']:>6} pages  {r['seconds']:>8.3f}s  "
+              f"{r['pages_per_sec']:>9} pages/s  {r['mb_per_sec']:>8} MB/s  {r['peak_rss_mb']:>7} MB peak"
+              + "".join(f"  {k} {r[k]}" for k in EXTRA_METRICS if k in r))
+    return report
+
+def compare(report, baseline):
+    """Print speedups of report over a previous report"""
+    print("\n📊 vs baseline (pages/s, >1 is faster):")
+    for name, r in report["stages"].items():
+        b = baseline["stages"].get(name)
+        if not b or "skipped" in r or "skipped" in b or "failed" in r or not b.get("pages_per_sec"):
+            continue
+        print(f"   {name:<16} {r['pages_per_sec'] / b['pages_per_sec']:.2f}x  "
+              f"(peak RSS {b['peak_rss_mb']} → {r['peak_rss_mb']} MB)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the ocr_pipeline stages on a synthetic corpus")
+    parser.add_argument("--corpus", default="bench_corpus", help="where the synthetic corpus is generated")
+    parser.add_argument("--out", help="write the JSON report here")
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), help="stages to run (default: all)")
+    parser.add_argument("--scale", type=int, default=1, help="corpus size multiplier")
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--compare", help="previous report to compare against")
+    args = parser.parse_args()
+
+    report = bench(args.corpus, args.stages, args.scale, args.repeat)
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.out).write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"\n✅ Report → {args.out}")
+    if args.compare:
+        compare(report, json.loads(Path(args.compare).read_text(encoding="utf-8")))
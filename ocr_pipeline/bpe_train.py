@@ -0,0 +1,281 @@
+"""
+Byte-level BPE tokenizer training over processed pipeline outputs.
+
+Tokenization is the stage after extraction, and its only input is what
+the writers produced (book_*.jsonl / book_*.md, per-book or inside
+compressed shards). This tool streams those documents and trains a
+GPT-2 style byte-level BPE vocabulary:
+
+1. Pre-tokenization runs in parallel: worker processes split every
+   chunk or paragraph into words with PRETOKENIZE (GPT-2's pattern, in
+   stdlib re) and return one word-count table per batch of documents.
+   The tables are merged as they arrive, so memory follows the number
+   of distinct words, not the corpus size.
+2. Pair counts are built once over the distinct words, weighted by
+   their counts, together with an index from each pair to the words
+   containing it.
+3. Merges are incremental. The best pair comes off a max-heap with
+   lazy invalidation. Only the words that contain it are rewritten, and
+   only the counts of their neighbouring pairs change. Nothing is
+   recounted between merges.
+
+The output directory gets
+    vocab.json      token (GPT-2 byte-to-unicode form) -> id
+    merges.txt      one merge per line, in order
+    tokenizer.json  HuggingFace tokenizers file: use it as hf:<path>
+                    with the chunker, the token shards or token_stats.py
+    training.json   corpus, settings and timings of the run
+
+Ids 0-255 are the raw bytes, merges follow in order, then the special
+tokens.
+
+Usage:
+    python bpe_train.py processed_dataset_all/*/jsonl --out tokenizer --vocab-size 32000
+"""
+
+from pathlib import Path
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import heapq
+import json
+import os
+import re
+import time
+from tqdm import tqdm
+
+from corpus import output_docs, iter_texts
+
+VOCAB_SIZE = 32000
+MIN_FREQUENCY = 2  # pairs seen fewer times are never merged
+SPECIAL_TOKENS = ["<|endoftext|>"]
+BATCH_DOCS = 16  # documents per worker task
+
+# GPT-2's pre-tokenizer: \p{L} is [^\W\d_], \p{N} is \d
+PRETOKENIZE = re.compile(r"""'(?:[sdmt]|ll|ve|re)| ?[^\W\d_]+| ?\d+| ?(?:[^\s\w]|_)+|\s+(?!\S)|\s+""")
+
+def bytes_to_unicode():
+    """GPT-2's reversible byte -> printable character map, as used by tokenizers' ByteLevel"""
+    printable = list(range(ord("!"), ord("~") + 1)) + list(range(ord("¡"), ord("¬") + 1)) + list(range(ord("®"), ord("ÿ") + 1))
+    chars = printable[:]
+    n = 0
+    for b in range(256):
+        if b not in printable:
+            printable.append(b)
+            chars.append(256 + n)
+            n += 1
+    return dict(zip(printable, map(chr, chars)))
+
+BYTE_CHARS = bytes_to_unicode()
+
+# -----------------------
+# Pre-tokenization (worker processes)
+# -----------------------
+
+def count_words(docs):
+    """Word counts of a batch of output documents"""
+    counts = Counter()
+    for doc in docs:
+        for text in iter_texts(doc):
+            counts.update(PRETOKENIZE.findall(text))
+    return counts
+
+def corpus_word_counts(docs, workers=None, progress=True):
+    """Merged word counts of every document, pre-tokenized in parallel"""
+    batches = [docs[i:i + BATCH_DOCS] for i in range(0, len(docs), BATCH_DOCS)]
+    counts = Counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        bar = tqdm(total=len(docs), desc="Pre-tokenizing", unit="doc", disable=not progress)
+        for batch, batch_counts in zip(batches, pool.map(count_words, batches)):
+            counts.update(batch_counts)
+            bar.update(len(batch))
+        bar.close()
+    return counts
+
+# -----------------------
+# Incremental BPE
+# -----------------------
+
+def merge_word(word, a, b, new):
+    """word with every (a, b) replaced by new, left to right"""
+    out = []
+    i, n = 0, len(word)
+    while i < n:
+        if i < n - 1 and word[i] == a and word[i + 1] == b:
+            out.append(new)
+            i += 2
+        else:
+            out.append(word[i])
+            i += 1
+    return tuple(out)
+
+class BPETrainer:
+    """Byte-level BPE over a word-count table, merging incrementally"""
+
+    def __init__(self, word_counts):
+        self.words = [tuple(w.encode("utf-8")) for w in word_counts]
+        self.counts = list(word_counts.values())
+        self.tokens = [bytes([b]) for b in range(256)]
+        self.ids = {t: i for i, t in enumerate(self.tokens)}
+        self.merges = []
+        self.pairs = defaultdict(int)  # pair -> weighted count
+        self.where = defaultdict(set)  # pair -> indices of the words it may occur in
+        for i, (word, count) in enumerate(zip(self.words, self.counts)):
+            for pair in zip(word, word[1:]):
+                self.pairs[pair] += count
+                self.where[pair].add(i)
+        self.heap = [(-count, pair) for pair, count in self.pairs.items()]
+        heapq.heapify(self.heap)
+
+    def best_pair(self):
+        """Most frequent pair (ties: lowest ids), or None once the heap is empty"""
+        while self.heap:
+            neg, pair = heapq.heappop(self.heap)
+            count = self.pairs.get(pair, 0)
+            if count == -neg:
+                return pair, count
+            # Stale entry: counts of existing pairs only go down, so re-queue the current one
+            if count > 0:
+                heapq.heappush(self.heap, (-count, pair))
+        return None
+
+    def merge(self, pair):
+        """Add the token for pair and rewrite the words containing it"""
+        a, b = pair
+        token = self.tokens[a] + self.tokens[b]
+        new = self.ids.get(token)
+        if new is None:
+            # Different merges can spell the same bytes; they share one id
+            new = self.ids[token] = len(self.tokens)
+            self.tokens.append(token)
+        self.merges.append(pair)
+        grown = set()
+        for i in self.where.pop(pair):
+            word = self.words[i]
+            merged = merge_word(word, a, b, new)
+            if len(merged) == len(word):
+                continue  # the pair left this word in an earlier merge
+            count = self.counts[i]
+            for p in zip(word, word[1:]):
+                self.pairs[p] -= count
+            for p in zip(merged, merged[1:]):
+                self.pairs[p] += count
+                self.where[p].add(i)
+                if new in p:
+                    grown.add(p)
+            self.words[i] = merged
+        del self.pairs[pair]
+        for p in grown:
+            heapq.heappush(self.heap, (-self.pairs[p], p))
+
+    def train(self, n_tokens, min_frequency=MIN_FREQUENCY, progress=True):
+        """Merge until there are n_tokens tokens or no pair occurs min_frequency times"""
+        bar = tqdm(total=n_tokens, initial=len(self.tokens), desc="Merging", unit="token", disable=not progress)
+        while len(self.tokens) < n_tokens:
+            best = self.best_pair()
+            if best is None or best[1] < min_frequency:
+                break
+            self.merge(best[0])
+            bar.update(len(self.tokens) - bar.n)
+        bar.close()
+        return self.merges
+
+# -----------------------
+# Export
+# -----------------------
+
+def token_str(token):
+    return "".join(BYTE_CHARS[b] for b in token)
+
+def export(out_dir, tokens, merges, special_tokens):
+    """Write vocab.json, merges.txt and tokenizer.json; returns their paths"""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    vocab = {token_str(t): i for i, t in enumerate(tokens)}
+    merge_lines = [f"{token_str(tokens[a])} {token_str(tokens[b])}" for a, b in merges]
+    added = [
+        {"id": len(tokens) + i, "content": t, "single_word": False, "lstrip": False,
+         "rstrip": False, "normalized": False, "special": True}
+        for i, t in enumerate(special_tokens)
+    ]
+
+    paths = [out_dir / "vocab.json", out_dir / "merges.txt", out_dir / "tokenizer.json"]
+    paths[0].write_text(json.dumps({**vocab, **{t["content"]: t["id"] for t in added}}, ensure_ascii=False), encoding="utf-8")
+    paths[1].write_text("#version: 0.2\n" + "".join(m + "\n" for m in merge_lines), encoding="utf-8")
+    tokenizer = {
+        "version": "1.0",
+        "truncation": None,
+        "padding": None,
+        "added_tokens": added,
+        "normalizer": None,
+        "pre_tokenizer": {"type": "ByteLevel", "add_prefix_space": False, "trim_offsets": True, "use_regex": True},
+        "post_processor": {"type": "ByteLevel", "add_prefix_space": False, "trim_offsets": False, "use_regex": True},
+        "decoder": {"type": "ByteLevel", "add_prefix_space": False, "trim_offsets": True, "use_regex": True},
+        "model": {
+            "type": "BPE",
+            "dropout": None,
+            "unk_token": None,
+            "continuing_subword_prefix": None,
+            "end_of_word_suffix": None,
+            "fuse_unk": False,
+            "byte_fallback": False,
+            "vocab": vocab,
+            "merges": merge_lines
+        }
+    }
+    paths[2].write_text(json.dumps(tokenizer, ensure_ascii=False), encoding="utf-8")
+    return paths
+
+# -----------------------
+# Run
+# -----------------------
+
+def train_bpe(out_dirs, out, vocab_size=VOCAB_SIZE, min_frequency=MIN_FREQUENCY,
+              special_tokens=SPECIAL_TOKENS, workers=None, progress=True):
+    """Train a byte-level BPE tokenizer on every output under out_dirs; returns the training summary"""
+    n_tokens = vocab_size - len(special_tokens)
+    if n_tokens < 256:
+        raise ValueError(f"vocab_size must be at least {256 + len(special_tokens)}")
+    docs = [d for out_dir in out_dirs for d in output_docs(out_dir)]
+    print(f"🔤 Training a {vocab_size}-token BPE vocabulary on {len(docs)} documents...")
+
+    start = time.perf_counter()
+    word_counts = corpus_word_counts(docs, workers, progress)
+    pretokenize_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    trainer = BPETrainer(word_counts)
+    trainer.train(n_tokens, min_frequency, progress)
+    merge_seconds = time.perf_counter() - start
+
+    paths = export(out, trainer.tokens, trainer.merges, special_tokens)
+    summary = {
+        "corpus": [str(d) for d in out_dirs],
+        "documents": len(docs),
+        "words": sum(word_counts.values()),
+        "distinct_words": len(word_counts),
+        "vocab_size": len(trainer.tokens) + len(special_tokens),
+        "merges": len(trainer.merges),
+        "min_frequency": min_frequency,
+        "special_tokens": special_tokens,
+        "workers": workers or os.cpu_count(),
+        "pretokenize_seconds": round(pretokenize_seconds, 2),
+        "merge_seconds": round(merge_seconds, 2)
+    }
+    (Path(out) / "training.json").write_text(json.dumps(summary, indent=2), encoding="utf-8")
+    if summary["vocab_size"] < vocab_size:
+        print(f"⚠️  Stopped at {summary['vocab_size']} tokens: no pair left with {min_frequency}+ occurrences")
+    print(f"✅ {summary['vocab_size']} tokens in {pretokenize_seconds + merge_seconds:.1f}s → "
+          f"{', '.join(p.name for p in paths)} in {out}/ (use as hf:{paths[2]})")
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train a byte-level BPE tokenizer on pipeline outputs")
+    parser.add_argument("out_dirs", nargs="+", help="directories holding book_*.jsonl / book_*.md outputs or shards")
+    parser.add_argument("--out", default="tokenizer", help="directory for vocab.json, merges.txt and tokenizer.json")
+    parser.add_argument("--vocab-size", type=int, default=VOCAB_SIZE)
+    parser.add_argument("--min-frequency", type=int, default=MIN_FREQUENCY)
+    parser.add_argument("--special", nargs="*", default=SPECIAL_TOKENS, help="special tokens appended to the vocab")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+    train_bpe(args.out_dirs, args.out, args.vocab_size, args.min_frequency, args.special, args.workers)
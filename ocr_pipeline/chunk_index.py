@@ -0,0 +1,178 @@
+"""
+Chunk provenance: a compact offset index next to every JSONL output.
+
+A JSONL chunk on its own says nothing about where it came from. With
+CHUNK_INDEX=1, JsonlChunkWriter also writes
+
+    <name>.pages.txt  the cleaned page texts exactly as chunked, separated by \\f
+    <name>.idx        one JSON header line, then little-endian int64 tables:
+                        pages   (page_no, char_start, byte_start, byte_length)
+                        chunks  (line_start, line_length, char_start, char_end,
+                                 page_start, page_end)
+
+Page offsets point into <name>.pages.txt; a chunk's line offsets point
+into <name>.jsonl and its char offsets into the text of pages.txt, using
+the spans TokenChunker tracks (hard-split sentence pieces get the whole
+sentence's span). The header carries the source file name and its
+SHA-256, so a bad chunk leads straight back to the input and its pages.
+pages.txt is a second copy of the book's cleaned text, which is why the
+index is opt-in.
+
+ChunkIndex reads all three files through mmap: a page, a chunk or the
+source text of a chunk is one slice, with no re-extraction and no JSON
+parsing beyond the line asked for.
+"""
+
+from pathlib import Path
+import json
+import mmap
+import numpy as np
+
+PAGE_FIELDS = ("page_no", "char_start", "byte_start", "byte_length")
+CHUNK_FIELDS = ("line_start", "line_length", "char_start", "char_end", "page_start", "page_end")
+PAGE_BREAK = "\f"
+
+def index_paths(out):
+    """(pages.txt, .idx) sidecars of a JSONL output"""
+    out = Path(out)
+    return out.with_suffix(".pages.txt"), out.with_suffix(".idx")
+
+# -----------------------
+# Writer side
+# -----------------------
+
+class ChunkIndexBuilder:
+    """Collects page and chunk offsets for one document while JsonlChunkWriter writes it"""
+
+    def __init__(self, out, source, digest):
+        self.out = Path(out)
+        self.pages_path, self.idx_path = index_paths(out)
+        self.source = source
+        self.digest = digest
+        self.f = self.pages_path.open("w", encoding="utf-8", newline="")
+        self.pages = []
+        self.chunks = []
+        self.page_chars = {}  # page_no -> char offset of the page in pages.txt
+        self.char_pos = 0
+        self.byte_pos = 0
+        self.line_pos = 0
+
+    def add_page(self, page_no, text):
+        if self.pages:
+            self.f.write(PAGE_BREAK)
+            self.char_pos += 1
+            self.byte_pos += 1
+        n_bytes = len(text.encode("utf-8"))
+        self.f.write(text)
+        self.pages.append((page_no, self.char_pos, self.byte_pos, n_bytes))
+        self.page_chars[page_no] = self.char_pos
+        self.char_pos += len(text)
+        self.byte_pos += n_bytes
+
+    def add_chunk(self, line_length, span):
+        """A chunk line of line_length bytes; span is the chunker's (first_page, start, last_page, end)"""
+        first, start, last, end = span
+        self.chunks.append((
+            self.line_pos, line_length,
+            self.page_chars[first] + start, self.page_chars[last] + end,
+            first, last
+        ))
+        self.line_pos += line_length
+
+    def write(self):
+        """Close pages.txt and write the .idx; returns both paths"""
+        self.f.close()
+        header = json.dumps({
+            "doc_id": self.out.stem,
+            "source": Path(self.source).name,
+            "sha256": self.digest,
+            "jsonl": self.out.name,
+            "pages_txt": self.pages_path.name,
+            "page_fields": PAGE_FIELDS,
+            "chunk_fields": CHUNK_FIELDS,
+            "n_pages": len(self.pages),
+            "n_chunks": len(self.chunks)
+        }).encode("utf-8") + b"\n"
+        pad = -len(header) % 8  # tables start 8-byte aligned
+        with self.idx_path.open("wb") as f:
+            f.write(header + b" " * pad)
+            f.write(np.array(self.pages, dtype="<i8").reshape(-1, len(PAGE_FIELDS)).tobytes())
+            f.write(np.array(self.chunks, dtype="<i8").reshape(-1, len(CHUNK_FIELDS)).tobytes())
+        return [self.pages_path, self.idx_path]
+
+    def abort(self):
+        self.f.close()
+        self.pages_path.unlink(missing_ok=True)
+        self.idx_path.unlink(missing_ok=True)
+
+# -----------------------
+# Reader
+# -----------------------
+
+def map_file(path):
+    with open(path, "rb") as f:
+        if not f.seek(0, 2):
+            return b""  # mmap refuses empty files
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+class ChunkIndex:
+    """Random access to the pages and chunks of one JSONL output through its index"""
+
+    def __init__(self, path):
+        """path is the output (book_*.jsonl) or its .idx"""
+        self.idx_path = Path(path).with_suffix(".idx")
+        self.buf = map_file(self.idx_path)
+        end = self.buf.find(b"\n") + 1
+        self.header = json.loads(self.buf[:end])
+        start = end + (-end % 8)
+        n_pages, n_chunks = self.header["n_pages"], self.header["n_chunks"]
+        self.pages = np.frombuffer(self.buf, dtype="<i8", count=n_pages * len(PAGE_FIELDS), offset=start)
+        self.pages = self.pages.reshape(n_pages, len(PAGE_FIELDS))
+        start += self.pages.nbytes
+        self.chunks = np.frombuffer(self.buf, dtype="<i8", count=n_chunks * len(CHUNK_FIELDS), offset=start)
+        self.chunks = self.chunks.reshape(n_chunks, len(CHUNK_FIELDS))
+        self.jsonl = map_file(self.idx_path.parent / self.header["jsonl"])
+        self.text = map_file(self.idx_path.parent / self.header["pages_txt"])
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def _page_row(self, page_no):
+        rows = np.flatnonzero(self.pages[:, 0] == page_no)
+        if not len(rows):
+            raise KeyError(f"page {page_no} is not in {self.header['doc_id']} (empty source page or dropped)")
+        return self.pages[rows[0]]
+
+    def page(self, page_no):
+        """Cleaned text of one source page"""
+        _, _, start, length = self._page_row(page_no)
+        return self.text[start:start + length].decode("utf-8")
+
+    def chunk(self, i):
+        """Chunk i as written to the JSONL ({"text", "n_tokens"})"""
+        start, length = self.chunks[i, 0], self.chunks[i, 1]
+        return json.loads(self.jsonl[start:start + length])
+
+    def chunk_meta(self, i):
+        return dict(zip(CHUNK_FIELDS, map(int, self.chunks[i])), sha256=self.header["sha256"], source=self.header["source"])
+
+    def source_text(self, i):
+        """The stretch of page text chunk i was built from (page breaks as \\f)"""
+        char_start, char_end = self.chunks[i, 2], self.chunks[i, 3]
+        return self.span_text(char_start, char_end)
+
+    def span_text(self, char_start, char_end):
+        """Text between two character offsets of pages.txt, decoding only the pages involved"""
+        chars = self.pages[:, 1]
+        first = max(int(np.searchsorted(chars, char_start, side="right")) - 1, 0)
+        last = max(int(np.searchsorted(chars, char_end, side="right")) - 1, 0)
+        b0 = self.pages[first, 2]
+        b1 = self.pages[last, 2] + self.pages[last, 3]
+        text = self.text[b0:b1].decode("utf-8")
+        offset = self.pages[first, 1]
+        return text[char_start - offset:char_end - offset]
+
+    def chunks_for_page(self, page_no):
+        """Indices of the chunks that draw on a page"""
+        c = self.chunks
+        return np.flatnonzero((c[:, 4] <= page_no) & (c[:, 5] >= page_no)).tolist()
@@ -0,0 +1,245 @@
+"""
+Tokenizer-aware chunking for the JSONL writer.
+
+TokenChunker packs text into chunks of at most `max_tokens` tokens as
+counted by a pluggable tokenizer, snapping to paragraph boundaries (and
+to sentence boundaries inside paragraphs that are too long on their
+own), with `overlap_tokens` of trailing context repeated at the start
+of the next chunk. It is fed one page at a time and tokenizes
+`batch_pages` pages per tokenizer call. Budgets are counted per
+paragraph/sentence plus the separators joining them, so a chunk never
+exceeds max_tokens when re-tokenized as a whole.
+
+Tokenizers are picked by spec string with get_tokenizer():
+    whitespace                  words (no extra dependency)
+    bytes                       UTF-8 bytes, ids 0-255 (no extra dependency)
+    tiktoken:<encoding>         e.g. tiktoken:cl100k_base  (pip install tiktoken)
+    hf:<tokenizer.json path>    HuggingFace tokenizers file (pip install tokenizers)
+
+Pipeline defaults come from CHUNK_TOKENIZER, CHUNK_TOKENS and CHUNK_OVERLAP.
+"""
+
+import os
+import re
+
+# Install: pip install tiktoken
+try:
+    import tiktoken
+    TIKTOKEN_SUPPORT = True
+except ImportError:
+    TIKTOKEN_SUPPORT = False
+
+# Install: pip install tokenizers
+try:
+    from tokenizers import Tokenizer
+    HF_TOKENIZERS_SUPPORT = True
+except ImportError:
+    HF_TOKENIZERS_SUPPORT = False
+
+CHUNK_TOKENIZER = os.getenv("CHUNK_TOKENIZER", "whitespace")
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "1200"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "0"))
+
+PARAGRAPH_SPLIT = re.compile(r'\n\s*\n')
+SENTENCE_SPLIT = re.compile(r'(?<=[.!?])\s+(?=[A-Z0-9(\[])')
+
+# -----------------------
+# Tokenizers
+# -----------------------
+
+class WhitespaceTokenizer:
+    """Whitespace-separated words; tokens are the words themselves"""
+    name = "whitespace"
+    vocab_size = None
+
+    def encode_batch(self, texts):
+        return [t.split() for t in texts]
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+class ByteTokenizer:
+    """UTF-8 bytes as token ids 0-255"""
+    name = "bytes"
+    vocab_size = 256
+
+    def encode_batch(self, texts):
+        return [list(t.encode("utf-8")) for t in texts]
+
+    def decode(self, tokens):
+        return bytes(tokens).decode("utf-8", errors="replace")
+
+class TiktokenTokenizer:
+    def __init__(self, encoding="cl100k_base"):
+        if not TIKTOKEN_SUPPORT:
+            raise ImportError("tiktoken is not installed (pip install tiktoken)")
+        self.enc = tiktoken.get_encoding(encoding)
+        self.name = f"tiktoken:{encoding}"
+        self.vocab_size = self.enc.n_vocab
+
+    def encode_batch(self, texts):
+        return self.enc.encode_ordinary_batch(texts)
+
+    def decode(self, tokens):
+        return self.enc.decode(tokens)
+
+class HFTokenizer:
+    def __init__(self, path):
+        if not HF_TOKENIZERS_SUPPORT:
+            raise ImportError("tokenizers is not installed (pip install tokenizers)")
+        self.tok = Tokenizer.from_file(str(path))
+        self.name = f"hf:{path}"
+        self.vocab_size = self.tok.get_vocab_size()
+
+    def encode_batch(self, texts):
+        return [e.ids for e in self.tok.encode_batch(texts, add_special_tokens=False)]
+
+    def decode(self, tokens):
+        return self.tok.decode(tokens)
+
+def get_tokenizer(spec):
+    """Build a tokenizer from a spec string like 'tiktoken:cl100k_base'"""
+    kind, _, arg = spec.partition(":")
+    if kind == "whitespace":
+        return WhitespaceTokenizer()
+    if kind == "bytes":
+        return ByteTokenizer()
+    if kind == "tiktoken":
+        return TiktokenTokenizer(arg or "cl100k_base")
+    if kind == "hf":
+        return HFTokenizer(arg)
+    raise ValueError(f"Unknown tokenizer spec: {spec!r}")
+
+# -----------------------
+# Chunkers
+# -----------------------
+
+def chunk(text, size=1200):
+    """Legacy fixed-size word chunks (no boundaries, no overlap)"""
+    words = text.split()
+    for i in range(0, len(words), size):
+        yield " ".join(words[i:i+size])
+
+def split_spans(text, separator):
+    """(piece, start) for the stripped, non-empty pieces of text between separator matches"""
+    pos = 0
+    for m in [*separator.finditer(text), None]:
+        end = m.start() if m else len(text)
+        piece = text[pos:end]
+        stripped = piece.strip()
+        if stripped:
+            yield stripped, pos + len(piece) - len(piece.lstrip())
+        if m:
+            pos = m.end()
+
+class TokenChunker:
+    """Streaming token-budget chunker; feed() pages, then flush() at end of book"""
+
+    def __init__(self, tokenizer, max_tokens=1024, overlap_tokens=128, batch_pages=32):
+        if overlap_tokens >= max_tokens:
+            raise ValueError("overlap_tokens must be smaller than max_tokens")
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.batch_pages = batch_pages
+        self.sep_tokens = dict(zip(("\n\n", " "), tokenizer.encode_batch(["\n\n", " "])))
+        self.pages = []  # (page_no, text) waiting to be tokenized
+        self.current = []  # (text, sep, tokens, (page_no, start, end)) segments of the chunk being built
+        self.current_tokens = 0
+        # Where the last emitted chunk came from: (first_page, start, last_page, end),
+        # character offsets into the text of those pages as fed
+        self.span = None
+
+    def feed(self, text, page_no=None):
+        """Add a page of text; yields (chunk_text, tokens, (first_page, last_page)) for every chunk completed"""
+        if text:
+            self.pages.append((page_no, text))
+        if len(self.pages) >= self.batch_pages:
+            yield from self._drain()
+
+    def flush(self):
+        """Yield everything still buffered, including the final partial chunk"""
+        yield from self._drain()
+        if self.current:
+            yield self._emit(carry=False)
+
+    # -- internals --
+
+    def _segments(self, pages):
+        """Split pages into (text, separator-before, (page_no, start, end)) paragraph segments"""
+        for page_no, page in pages:
+            for para, start in split_spans(page, PARAGRAPH_SPLIT):
+                yield para, "\n\n", (page_no, start, start + len(para))
+
+    def _drain(self):
+        if not self.pages:
+            return
+        segs = list(self._segments(self.pages))
+        self.pages = []
+
+        # One tokenizer call for every paragraph in the batch
+        tokens = self.tokenizer.encode_batch([s for s, _, _ in segs])
+
+        for (text, sep, where), toks in zip(segs, tokens):
+            if len(toks) <= self.max_tokens:
+                yield from self._add(text, sep, toks, where)
+            else:
+                yield from self._add_long(text, where)
+
+    def _add_long(self, text, where):
+        """A paragraph over budget: pack its sentences, hard-splitting any that still don't fit"""
+        page_no, para_start, _ = where
+        spans = list(split_spans(text, SENTENCE_SPLIT))
+        tokens = self.tokenizer.encode_batch([sent for sent, _ in spans])
+        sep = "\n\n"
+        for (sent, start), toks in zip(spans, tokens):
+            where = (page_no, para_start + start, para_start + start + len(sent))
+            if len(toks) <= self.max_tokens:
+                yield from self._add(sent, sep, toks, where)
+            else:
+                # Decoded pieces are not exact substrings: each is placed at its whole sentence
+                for i in range(0, len(toks), self.max_tokens):
+                    piece = toks[i:i + self.max_tokens]
+                    yield from self._add(self.tokenizer.decode(piece), sep, piece, where)
+                    sep = " "
+            sep = " "
+
+    def _total(self, segs):
+        """Tokens in segs joined together, separators included"""
+        return sum(len(seg[2]) for seg in segs) + sum(len(self.sep_tokens[seg[1]]) for seg in segs[1:])
+
+    def _add(self, text, sep, tokens, where):
+        cost = len(tokens) + (len(self.sep_tokens[sep]) if self.current else 0)
+        if self.current and self.current_tokens + cost > self.max_tokens:
+            yield self._emit(carry=True)
+            # The overlap carried over may not leave room for this segment
+            while self.current and self._total(self.current + [(text, sep, tokens, where)]) > self.max_tokens:
+                self.current.pop(0)
+            self.current_tokens = self._total(self.current)
+            cost = len(tokens) + (len(self.sep_tokens[sep]) if self.current else 0)
+        self.current.append((text, sep, tokens, where))
+        self.current_tokens += cost
+
+    def _emit(self, carry):
+        parts = []
+        tokens = []
+        for i, (text, sep, toks, _) in enumerate(self.current):
+            if i:
+                parts.append(sep)
+                tokens.extend(self.sep_tokens[sep])
+            parts.append(text)
+            tokens.extend(toks)
+        first, last = self.current[0][3], self.current[-1][3]
+        out = ("".join(parts), tokens, (first[0], last[0]))
+        self.span = (first[0], first[1], last[0], last[2])
+
+        # Keep whole trailing segments that fit in the overlap budget
+        tail = []
+        if carry and self.overlap_tokens:
+            for seg in reversed(self.current):
+                if self._total([seg] + tail) > self.overlap_tokens:
+                    break
+                tail.insert(0, seg)
+        self.current = tail
+        self.current_tokens = self._total(tail)
+        return out
@@ -0,0 +1,167 @@
+"""
+Columnar, zstd-compressed Parquet output for processed books.
+
+ParquetChunkWriter is an engine writer that emits one row per chunk into
+multi-document Parquet shards, so corpus-wide scans, filtering and stats
+read only the columns they need instead of thousands of small files.
+
+Columns: doc_id, source, title, chunk_no, page_start, page_end, text,
+n_chars, n_words, n_tokens.
+
+Rows are buffered into row groups of ROW_GROUP_ROWS and a shard is
+closed after SHARD_ROWS rows or at the end of the run. Every worker
+process writes its own chunks_<run>-w<worker>-<pid>_NNNN.parquet series. Shards are
+written as .parquet.tmp and renamed once their footer is on disk, so a
+reader never sees a half-written file, and the engine records a book in
+the manifest only after the shard holding its rows has been renamed.
+"""
+
+from pathlib import Path
+import copy
+import os
+import time
+
+from chunker import TokenChunker, get_tokenizer, CHUNK_TOKENIZER, CHUNK_TOKENS, CHUNK_OVERLAP
+from telemetry import timed_iter
+
+# Install: pip install pyarrow
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_SUPPORT = True
+except ImportError:
+    PARQUET_SUPPORT = False
+
+ROW_GROUP_ROWS = 8192
+SHARD_ROWS = 250_000
+COMPRESSION_LEVEL = 6  # zstd
+
+def chunk_schema():
+    return pa.schema([
+        ("doc_id", pa.string()),
+        ("source", pa.string()),
+        ("title", pa.string()),
+        ("chunk_no", pa.int32()),
+        ("page_start", pa.int32()),
+        ("page_end", pa.int32()),
+        ("text", pa.large_string()),
+        ("n_chars", pa.int32()),
+        ("n_words", pa.int32()),
+        ("n_tokens", pa.int32()),
+    ])
+
+class ParquetChunkWriter:
+    format = "parquet"
+    wants_markdown = False
+    reading_order = False
+
+    def __init__(self, out_dir, tokenizer=CHUNK_TOKENIZER, max_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP):
+        if not PARQUET_SUPPORT:
+            raise ImportError("pyarrow is not installed (pip install pyarrow)")
+        self.out_dir = Path(out_dir)
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self.tokenizer = get_tokenizer(tokenizer) if isinstance(tokenizer, str) else tokenizer
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.schema = chunk_schema()
+        self.run_id = time.strftime("%Y%m%d-%H%M%S")
+        self.shard_no = 0
+        self.shard_rows = 0
+        self.pq_writer = None
+        self.rows = {name: [] for name in self.schema.names}
+
+        # Leftovers from a run that died before closing its shard; the manifest
+        # only records documents once their shard is closed, so they run again
+        for tmp in self.out_dir.glob("*.parquet.tmp"):
+            tmp.unlink()
+
+    def config(self):
+        return {
+            "format": self.format,
+            "tokenizer": self.tokenizer.name,
+            "max_tokens": self.max_tokens,
+            "overlap_tokens": self.overlap_tokens
+        }
+
+    def shard_path(self):
+        return self.out_dir / f"chunks_{self.run_id}_{self.shard_no:04d}.parquet"
+
+    def begin(self, doc, name):
+        self.timings = doc.timings
+        self.doc_id = name
+        self.source = doc.source.name
+        self.title = doc.title
+        self.chunk_no = 0
+        self.doc_start = len(self.rows["doc_id"])
+        self.chunker = TokenChunker(self.tokenizer, self.max_tokens, self.overlap_tokens)
+
+    def _add_row(self, text, tokens, pages):
+        r = self.rows
+        r["doc_id"].append(self.doc_id)
+        r["source"].append(self.source)
+        r["title"].append(self.title)
+        r["chunk_no"].append(self.chunk_no)
+        r["page_start"].append(pages[0])
+        r["page_end"].append(pages[1])
+        r["text"].append(text)
+        r["n_chars"].append(len(text))
+        r["n_words"].append(len(text.split()))
+        r["n_tokens"].append(len(tokens))
+        self.chunk_no += 1
+
+    def write_page(self, page):
+        for c in timed_iter(self.chunker.feed(page.text, page.number), self.timings, "chunk"):
+            self._add_row(*c)
+
+    def end(self):
+        for c in timed_iter(self.chunker.flush(), self.timings, "chunk"):
+            self._add_row(*c)
+        path = self.shard_path()
+        if len(self.rows["doc_id"]) >= ROW_GROUP_ROWS:
+            self._flush_rows()
+        return [path]
+
+    def abort(self):
+        # Drop this document's buffered rows; earlier documents stay
+        for col in self.rows.values():
+            del col[self.doc_start:]
+
+    def _flush_rows(self):
+        """Write buffered rows as one row group, rolling to a new shard when full"""
+        if not self.rows["doc_id"]:
+            return
+        if self.pq_writer is None:
+            self.pq_writer = pq.ParquetWriter(
+                str(self.shard_path()) + ".tmp",
+                self.schema,
+                compression="zstd",
+                compression_level=COMPRESSION_LEVEL
+            )
+        table = pa.Table.from_pydict(self.rows, schema=self.schema)
+        self.pq_writer.write_table(table, row_group_size=ROW_GROUP_ROWS)
+        self.shard_rows += table.num_rows
+        self.rows = {name: [] for name in self.schema.names}
+        if self.shard_rows >= SHARD_ROWS:
+            self._close_shard()
+
+    def _close_shard(self):
+        if self.pq_writer is None:
+            return
+        self.pq_writer.close()
+        self.pq_writer = None
+        tmp = Path(str(self.shard_path()) + ".tmp")
+        tmp.replace(self.shard_path())
+        self.shard_no += 1
+        self.shard_rows = 0
+
+    def close(self):
+        """End of run: write what is buffered and finalise the open shard"""
+        self._flush_rows()
+        self._close_shard()
+
+    def for_worker(self, worker_id):
+        """Each worker process writes its own shard series"""
+        w = copy.copy(self)
+        w.run_id = f"{self.run_id}-w{worker_id:02d}-{os.getpid()}"
+        w.rows = {name: [] for name in self.schema.names}
+        return w
@@ -0,0 +1,238 @@
+"""
+Compressed, multi-document shards for the per-book text outputs.
+
+With OUTPUT_COMPRESSION=zstd (or gzip) the JSONL and markdown writers
+stop creating one file per book. Each document becomes one compressed
+frame (a gzip member) appended to a shard:
+
+    <out_dir>/<format>_<run>-w<worker>-<pid>_NNNN<suffix>.zst
+    <out_dir>/<format>_<run>-w<worker>-<pid>_NNNN<suffix>.zst.index.jsonl
+
+Concatenated frames are a valid stream, so `zstdcat shard.jsonl.zst` or
+`zcat shard.md.gz` read a whole shard. The index has one line per
+document, {"doc_id", "offset", "length", "bytes"}: the frame's position
+in the shard and its uncompressed size, so a single document can be
+decompressed without touching the rest.
+
+Text is buffered (BUFFER_BYTES) before it reaches the compressor and a
+shard rolls over after SHARD_BYTES of compressed output. As with Parquet
+shards, a shard and its index are written as .tmp and renamed when the
+shard is closed (full, or at the end of the run), so readers never see
+a half-written one.
+"""
+
+from contextlib import contextmanager
+from pathlib import Path
+import copy
+import gzip
+import io
+import json
+import os
+import time
+
+# Install: pip install zstandard
+try:
+    import zstandard
+    ZSTD_SUPPORT = True
+except ImportError:
+    ZSTD_SUPPORT = False
+
+CODECS = {"zstd": ".zst", "gzip": ".gz"}
+DEFAULT_LEVELS = {"zstd": 3, "gzip": 6}
+SHARD_BYTES = 256 << 20  # compressed bytes per shard
+BUFFER_BYTES = 1 << 20
+INDEX_SUFFIX = ".index.jsonl"
+
+def check_codec(codec):
+    if codec not in CODECS:
+        raise ValueError(f"unknown compression {codec!r} (choose from {', '.join(CODECS)})")
+    if codec == "zstd" and not ZSTD_SUPPORT:
+        raise ImportError("zstandard is not installed (pip install zstandard)")
+
+# -----------------------
+# Writer side
+# -----------------------
+
+class FrameWriter(io.RawIOBase):
+    """Raw byte sink feeding a compressor and counting uncompressed bytes
+
+    zstandard's writer reports compressed bytes from write(), which
+    BufferedWriter would take for a short write.
+    """
+
+    def __init__(self, compressor):
+        self.compressor = compressor
+        self.n_bytes = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.compressor.write(b)
+        self.n_bytes += len(b)
+        return len(b)
+
+class ShardSink:
+    """Append one compressed frame per document to size-capped shards"""
+
+    def __init__(self, out_dir, prefix, suffix, codec="zstd", level=None, shard_bytes=SHARD_BYTES):
+        check_codec(codec)
+        self.out_dir = Path(out_dir)
+        self.prefix = prefix
+        self.suffix = suffix + CODECS[codec]
+        self.codec = codec
+        self.level = level or DEFAULT_LEVELS[codec]
+        self.shard_bytes = shard_bytes
+        self.run_id = time.strftime("%Y%m%d-%H%M%S")
+        self.shard_no = 0
+        self.raw = None  # open shard (.tmp)
+        self.index = []
+        self.frame = None  # compressor of the open document
+        self.sink = None
+        self.f = None
+
+        # Leftovers from a run that died before closing its shard; the manifest
+        # only records documents once their shard is closed, so they run again
+        for tmp in self.out_dir.glob(f"{prefix}_*{self.suffix}*.tmp"):
+            tmp.unlink()
+
+    def config(self):
+        return {"compression": self.codec, "level": self.level}
+
+    def shard_path(self):
+        return self.out_dir / f"{self.prefix}_{self.run_id}_{self.shard_no:04d}{self.suffix}"
+
+    def for_worker(self, worker_id):
+        """Each worker process writes its own shard series"""
+        s = copy.copy(self)
+        s.run_id = f"{self.run_id}-w{worker_id:02d}-{os.getpid()}"
+        s.index = []
+        return s
+
+    def begin(self, name):
+        """Start a document's frame; returns the text stream to write it to"""
+        if self.raw is None:
+            self.raw = open(str(self.shard_path()) + ".tmp", "wb")
+        self.name = name
+        self.offset = self.raw.tell()
+        if self.codec == "zstd":
+            cctx = zstandard.ZstdCompressor(level=self.level)
+            self.frame = cctx.stream_writer(self.raw, closefd=False)
+        else:
+            self.frame = gzip.GzipFile(fileobj=self.raw, mode="wb", compresslevel=self.level)
+        self.sink = FrameWriter(self.frame)
+        self.f = io.TextIOWrapper(io.BufferedWriter(self.sink, BUFFER_BYTES), encoding="utf-8")
+        return self.f
+
+    def _end_frame(self):
+        # Detach rather than close the wrappers: closing would close the shard too
+        self.f.detach().detach()
+        self.frame.close()  # ends the zstd frame / gzip member; the shard stays open
+        self.f = self.frame = None
+
+    def end(self):
+        """Finish the document's frame and index it; returns the shard path"""
+        self._end_frame()
+        self.index.append({
+            "doc_id": self.name,
+            "offset": self.offset,
+            "length": self.raw.tell() - self.offset,
+            "bytes": self.sink.n_bytes
+        })
+        path = self.shard_path()
+        if self.raw.tell() >= self.shard_bytes:
+            self._close_shard()
+        return path
+
+    def abort(self):
+        """Drop the document's partial frame; earlier documents stay"""
+        if self.frame is None:
+            return
+        try:
+            self._end_frame()
+        except Exception:
+            self.f = self.frame = None  # the compressor itself failed; truncating is enough
+        self.raw.seek(self.offset)
+        self.raw.truncate()
+
+    def _close_shard(self):
+        if self.raw is None:
+            return
+        self.raw.close()
+        self.raw = None
+        path = self.shard_path()
+        index = Path(str(path) + INDEX_SUFFIX)
+        with open(str(index) + ".tmp", "w", encoding="utf-8") as f:
+            for entry in self.index:
+                f.write(json.dumps(entry) + "\n")
+        # Index first: a shard is never visible without it
+        Path(str(index) + ".tmp").replace(index)
+        Path(str(path) + ".tmp").replace(path)
+        self.index = []
+        self.shard_no += 1
+
+    def close(self):
+        """End of run: finalise the open shard"""
+        self._close_shard()
+
+# -----------------------
+# Reader side
+# -----------------------
+
+class FrameSlice(io.RawIOBase):
+    """Read-only view of length bytes at offset of a file"""
+
+    def __init__(self, f, offset, length):
+        self.f = f
+        self.f.seek(offset)
+        self.left = length
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = self.f.readinto(memoryview(b)[:min(len(b), self.left)])
+        self.left -= n
+        return n
+
+def shard_codec(path):
+    suffix = Path(path).suffix
+    return next((c for c, s in CODECS.items() if s == suffix), None)
+
+def is_shard(path):
+    return shard_codec(path) is not None and Path(str(path) + INDEX_SUFFIX).exists()
+
+def read_index(shard):
+    with open(str(shard) + INDEX_SUFFIX, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+class ShardDoc:
+    """One document inside a shard; open() streams its text"""
+
+    def __init__(self, shard, doc_id, offset, length):
+        self.shard = Path(shard)
+        self.doc_id = doc_id
+        self.offset = offset
+        self.length = length
+        # .jsonl or .md, like the per-book files
+        self.suffix = Path(self.shard.stem).suffix
+
+    def __repr__(self):
+        return f"ShardDoc({self.shard.name}#{self.doc_id})"
+
+    @contextmanager
+    def open(self):
+        """Text stream of the document, decompressed as it is read"""
+        with open(self.shard, "rb") as raw:
+            frame = FrameSlice(raw, self.offset, self.length)
+            if shard_codec(self.shard) == "zstd":
+                check_codec("zstd")
+                stream = zstandard.ZstdDecompressor().stream_reader(frame)
+            else:
+                stream = gzip.GzipFile(fileobj=io.BufferedReader(frame, BUFFER_BYTES), mode="rb")
+            with io.TextIOWrapper(io.BufferedReader(stream, BUFFER_BYTES), encoding="utf-8") as f:
+                yield f
+
+def shard_docs(shard):
+    """Documents of a shard, in the order they were written"""
+    return [ShardDoc(shard, e["doc_id"], e["offset"], e["length"]) for e in read_index(shard)]
@@ -0,0 +1,82 @@
+"""
+Readers for processed pipeline outputs.
+
+Post-processing tools (dedup, stats, tokenizer training) work over what
+the writers produced rather than re-extracting books. These helpers find
+the per-book outputs under a directory and stream their text without
+loading whole files.
+
+Compressed multi-document shards (compressed.py) hold many books per
+file; output_docs() lists the per-book files and every document inside
+shards alike, and the iter_* readers accept either.
+"""
+
+from pathlib import Path
+import json
+
+from compressed import ShardDoc, CODECS, is_shard, shard_docs
+
+OUTPUT_SUFFIXES = (".jsonl", ".md")
+
+def output_files(root):
+    """Per-book outputs (book_*.jsonl / book_*.md) under root, in a stable order"""
+    root = Path(root)
+    files = [
+        p for p in root.rglob("book_*")
+        if p.is_file() and p.suffix in OUTPUT_SUFFIXES and "." not in p.stem
+    ]
+    return sorted(files)
+
+def shard_files(root):
+    """Compressed output shards under root, in a stable order"""
+    root = Path(root)
+    return sorted(p for suffix in CODECS.values() for p in root.rglob(f"*{suffix}") if is_shard(p))
+
+def output_docs(root):
+    """Every output document under root: per-book file paths, then ShardDocs"""
+    return output_files(root) + [d for shard in shard_files(root) for d in shard_docs(shard)]
+
+def doc_id(path):
+    """Output stem, e.g. book_3fa2c91e0b7d4a55"""
+    if isinstance(path, ShardDoc):
+        return path.doc_id
+    return Path(path).stem
+
+def open_text(path):
+    """Text stream of a per-book output file or a document inside a shard"""
+    if isinstance(path, ShardDoc):
+        return path.open()
+    return open(path, "r", encoding="utf-8")
+
+def iter_chunks(path):
+    """Yield the text of each chunk of a JSONL output"""
+    with open_text(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)["text"]
+
+def iter_markdown(path):
+    """Yield the paragraphs of a markdown output, skipping the title/source header"""
+    with open_text(path) as f:
+        in_header = True
+        para = []
+        for line in f:
+            if in_header:
+                if line.strip() == "---":
+                    in_header = False
+                continue
+            if line.strip():
+                para.append(line.rstrip("\n"))
+            elif para:
+                yield "\n".join(para)
+                para = []
+        if para:
+            yield "\n".join(para)
+
+def iter_texts(path):
+    """Yield the text of an output file in pieces (chunks or paragraphs)"""
+    suffix = path.suffix if isinstance(path, ShardDoc) else Path(path).suffix
+    if suffix == ".jsonl":
+        return iter_chunks(path)
+    return iter_markdown(path)
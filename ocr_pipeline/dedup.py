@@ -0,0 +1,274 @@
+"""
+MinHash-LSH near-duplicate detection over processed book text.
+
+Metadata-level duplicate checks (AgentMemory title embeddings,
+WebDataTracker title fuzzing) miss different editions, reprints and
+copies saved under other titles. This stage works on the pipeline's
+outputs instead:
+
+1. Every document (or every JSONL chunk with --level chunk) is reduced
+   to a NUM_PERM-value MinHash signature of its word SHINGLE-grams.
+   Signatures are computed in parallel, vectorized with numpy.
+2. Signatures are split into BANDS bands and bucketed (LSH), so only
+   items sharing a bucket are ever compared: sub-quadratic in corpus size.
+3. An item whose estimated Jaccard similarity to an already kept item is
+   at least THRESHOLD is dropped; the first one seen is kept.
+
+Per-book files and documents inside compressed shards (compressed.py)
+are read alike. A document present in several directories (the jsonl/
+and md/ outputs of one run) is read once, from the first directory that
+has it, so every id gets exactly one decision. The index (kept
+signatures plus every decision) is saved in --index, so the next day's
+outputs are only checked against it incrementally, and each document's
+signatures are cached under its file's content hash: a re-run only
+hashes documents it has not seen.
+Decisions land in <index>/<level>/decisions.jsonl as the keep/drop manifest.
+
+Usage:
+    python dedup.py processed_dataset_all/Day2/jsonl --index dedup_index
+"""
+
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import json
+import os
+import re
+import zlib
+import numpy as np
+
+from corpus import output_docs, doc_id, iter_texts, iter_chunks
+from compressed import ShardDoc
+from manifest import DigestCache, config_hash
+
+NUM_PERM = 128
+BANDS = 16  # 16 bands x 8 rows: ~50% chance to become candidates at Jaccard 0.7
+SHINGLE = 5  # words per shingle
+THRESHOLD = 0.8  # estimated Jaccard at or above which an item is a duplicate
+SEED = 1234
+BLOCK = 16384  # shingles hashed per numpy block (bounds memory per worker)
+
+WORD_RE = re.compile(r"\w+")
+SHINGLE_MUL = np.uint64(0x100000001B3)  # FNV prime, combines word hashes into shingle hashes
+
+_rng = np.random.default_rng(SEED)
+PERM_A = _rng.integers(1, 2**63, NUM_PERM, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+PERM_B = _rng.integers(0, 2**63, NUM_PERM, dtype=np.uint64)
+EMPTY = np.iinfo(np.uint32).max
+
+# -----------------------
+# MinHash
+# -----------------------
+
+def word_hashes(text):
+    """Stable 32-bit hash of every lower-cased word"""
+    words = WORD_RE.findall(text.lower())
+    return np.fromiter((zlib.crc32(w.encode("utf-8")) for w in words), dtype=np.uint64, count=len(words))
+
+def shingle_hashes(words):
+    """64-bit hashes of every SHINGLE-word window"""
+    k = min(SHINGLE, len(words))
+    if k == 0:
+        return words
+    n = len(words) - k + 1
+    h = np.zeros(n, dtype=np.uint64)
+    for i in range(k):
+        h = h * SHINGLE_MUL + words[i:i + n]  # wraps mod 2^64 on purpose
+    return h
+
+def minhash(texts):
+    """MinHash signature (NUM_PERM uint32) of a stream of text pieces read as one document"""
+    sig = np.full(NUM_PERM, EMPTY, dtype=np.uint64)
+    carry = np.zeros(0, dtype=np.uint64)  # last SHINGLE-1 words, so shingles span pieces
+    with np.errstate(over="ignore"):
+        for text in texts:
+            words = np.concatenate([carry, word_hashes(text)])
+            if len(words) < SHINGLE:
+                carry = words
+                continue
+            shingles = shingle_hashes(words)
+            carry = words[-(SHINGLE - 1):]
+            for i in range(0, len(shingles), BLOCK):
+                block = shingles[i:i + BLOCK]
+                # Multiply-shift hashing: one universal hash per permutation
+                ph = (PERM_A[:, None] * block[None, :] + PERM_B[:, None]) >> np.uint64(32)
+                np.minimum(sig, ph.min(axis=1), out=sig)
+        if len(carry) and (sig == EMPTY).all():
+            # Document shorter than one shingle: hash what there is
+            ph = (PERM_A[:, None] * shingle_hashes(carry)[None, :] + PERM_B[:, None]) >> np.uint64(32)
+            np.minimum(sig, ph.min(axis=1), out=sig)
+    return sig.astype(np.uint32)
+
+def similarity(a, b):
+    """Estimated Jaccard similarity of two signatures"""
+    return float(np.mean(a == b))
+
+def file_signatures(args):
+    """Signatures of one output file, one row per item; runs in a worker process"""
+    path, level = args
+    if level == "doc":
+        sigs = [minhash(iter_texts(path))]
+    else:
+        sigs = [minhash([text]) for text in iter_chunks(path)]
+    return np.stack(sigs) if sigs else np.zeros((0, NUM_PERM), np.uint32)
+
+def item_ids(path, level, n):
+    """Ids of the n items of one output file: the document, or its chunks in order"""
+    if level == "doc":
+        return [doc_id(path)]
+    return [f"{doc_id(path)}#{i}" for i in range(n)]
+
+class SignatureCache:
+    """Signatures of every document seen, keyed by content hash and MinHash settings
+
+    Only signatures are stored: byte-identical files share an entry, and
+    each gets its own ids attached when it is read (item_ids).
+    """
+
+    def __init__(self, cache_dir, level):
+        self.hashes = DigestCache(Path(cache_dir) / "hashes.json")
+        config = config_hash({"level": level, "num_perm": NUM_PERM, "shingle": SHINGLE, "seed": SEED, "version": 2})
+        self.dir = Path(cache_dir) / config
+        self.dir.mkdir(parents=True, exist_ok=True)
+
+    def path(self, doc):
+        """Cache file of a per-book file, or of one document inside a shard"""
+        if isinstance(doc, ShardDoc):
+            return self.dir / f"{self.hashes.digest(doc.shard)[:32]}-{doc.doc_id}.npy"
+        return self.dir / f"{self.hashes.digest(doc)[:32]}.npy"
+
+    def get(self, path):
+        return np.load(path) if path.exists() else None
+
+    def put(self, path, sigs):
+        with open(f"{path}.tmp", "wb") as f:
+            np.save(f, sigs)
+        os.replace(f"{path}.tmp", path)
+
+# -----------------------
+# LSH index
+# -----------------------
+
+class LSHIndex:
+    def __init__(self, index_dir, num_perm=NUM_PERM, bands=BANDS):
+        self.dir = Path(index_dir)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.buckets = [{} for _ in range(bands)]  # band -> band bytes -> [kept item no]
+        self.kept_ids = []
+        self.kept_sigs = []
+        self.decided = set()
+        self._load()
+
+    def _band_keys(self, sig):
+        for b in range(self.bands):
+            yield b, sig[b * self.rows:(b + 1) * self.rows].tobytes()
+
+    def _index(self, item_id, sig):
+        n = len(self.kept_ids)
+        self.kept_ids.append(item_id)
+        self.kept_sigs.append(sig)
+        for b, key in self._band_keys(sig):
+            self.buckets[b].setdefault(key, []).append(n)
+
+    def _load(self):
+        sig_path = self.dir / "signatures.npy"
+        ids_path = self.dir / "kept.json"
+        if sig_path.exists() and ids_path.exists():
+            sigs = np.load(sig_path)
+            for item_id, sig in zip(json.loads(ids_path.read_text(encoding="utf-8")), sigs):
+                self._index(item_id, sig)
+        decisions = self.dir / "decisions.jsonl"
+        if decisions.exists():
+            with decisions.open("r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self.decided.add(json.loads(line)["id"])
+                    except json.JSONDecodeError:
+                        continue
+
+    def check(self, item_id, sig, threshold=THRESHOLD):
+        """Decide keep/drop for a new item against kept items sharing an LSH bucket"""
+        candidates = set()
+        for b, key in self._band_keys(sig):
+            candidates.update(self.buckets[b].get(key, ()))
+
+        best, best_sim = None, 0.0
+        for n in candidates:
+            sim = similarity(sig, self.kept_sigs[n])
+            if sim > best_sim:
+                best, best_sim = n, sim
+
+        self.decided.add(item_id)  # one decision per id, even if it shows up again this run
+        if best is not None and best_sim >= threshold:
+            return {"id": item_id, "keep": False, "dup_of": self.kept_ids[best], "similarity": round(best_sim, 4)}
+        self._index(item_id, sig)
+        return {"id": item_id, "keep": True, "dup_of": None, "similarity": round(best_sim, 4)}
+
+    def save(self, decisions):
+        """Persist kept signatures and append this run's decisions"""
+        self.dir.mkdir(parents=True, exist_ok=True)
+        sigs = np.stack(self.kept_sigs) if self.kept_sigs else np.zeros((0, self.bands * self.rows), np.uint32)
+        tmp = self.dir / "signatures.tmp.npy"
+        np.save(tmp, sigs)
+        os.replace(tmp, self.dir / "signatures.npy")
+        tmp = self.dir / "kept.json.tmp"
+        tmp.write_text(json.dumps(self.kept_ids), encoding="utf-8")
+        os.replace(tmp, self.dir / "kept.json")
+        with (self.dir / "decisions.jsonl").open("a", encoding="utf-8") as f:
+            for d in decisions:
+                f.write(json.dumps(d) + "\n")
+                self.decided.add(d["id"])
+
+# -----------------------
+# Run
+# -----------------------
+
+def dedup(out_dirs, index_dir, level="doc", workers=None, threshold=THRESHOLD):
+    """Check every new output under out_dirs against the index; returns this run's decisions"""
+    index = LSHIndex(Path(index_dir) / level)
+    cache = SignatureCache(Path(index_dir) / level / "signature_cache", level)
+    files = []
+    seen = set()
+    for p in (p for d in out_dirs for p in output_docs(d)):
+        # The same document in another format directory is one item, not a duplicate of itself
+        if doc_id(p) in seen or (level == "chunk" and p.suffix != ".jsonl"):
+            continue
+        seen.add(doc_id(p))
+        if level == "chunk" or doc_id(p) not in index.decided:
+            files.append(p)
+    paths = [cache.path(p) for p in files]
+    todo = {}  # cache path -> file; byte-identical files are hashed once
+    for p, c in zip(files, paths):
+        if not c.exists():
+            todo.setdefault(c, p)
+    print(f"🔍 Hashing {len(todo)} of {len(files)} files ({level} level, the rest are cached)...")
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for c, sigs in zip(todo, pool.map(file_signatures, [(p, level) for p in todo.values()], chunksize=4)):
+            cache.put(c, sigs)
+
+    # Files in their listed order, so which copy is kept is deterministic
+    decisions = []
+    for p, c in zip(files, paths):
+        sigs = cache.get(c)
+        for item_id, sig in zip(item_ids(p, level, len(sigs)), sigs):
+            if item_id in index.decided:
+                continue
+            decisions.append(index.check(item_id, sig, threshold))
+
+    cache.hashes.save()
+    index.save(decisions)
+    dropped = sum(1 for d in decisions if not d["keep"])
+    print(f"✅ {len(decisions) - dropped} kept, {dropped} near-duplicates dropped → {index.dir}/decisions.jsonl")
+    return decisions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MinHash-LSH near-duplicate detection over pipeline outputs")
+    parser.add_argument("out_dirs", nargs="+", help="directories holding book_*.jsonl / book_*.md outputs")
+    parser.add_argument("--index", default="dedup_index", help="persistent index directory")
+    parser.add_argument("--level", choices=["doc", "chunk"], default="doc")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    args = parser.parse_args()
+    dedup(args.out_dirs, args.index, args.level, args.workers, args.threshold)
@@ -0,0 +1,414 @@
+"""
+Single-pass extraction engine for the ocr_pipeline scripts.
+
+Each input file is extracted (and OCR'd if needed) exactly once into a
+page-level Document and handed to every configured writer (see
+writers.py). pipeline.py, pipeline_md.py and pipeline_md_latex.py are
+thin wrappers that pick one writer; pipeline_all.py produces every
+format from the same extraction.
+
+Everything streams one page at a time: extractors yield page texts,
+clean() runs per page, junk pages are dropped (quality.py), and writers
+consume pages as they arrive, so peak memory is O(page) rather than
+O(book) even for 2,000-page references.
+
+run() hashes and estimates every file up front and hands the new ones to
+a scheduler.WorkerPool; the manifest is only ever written by the main
+process, and only once a document's outputs are on disk: batching
+writers (Parquet, compressed shards) return the path of a shard that is
+still being written, and the document is recorded when that shard has
+been closed. Files the pool gives up on (time/memory limits breached in every
+retry mode) are listed in quarantine.jsonl and not tried again unless
+PIPELINE_RETRY_QUARANTINED=1.
+"""
+
+from pathlib import Path
+import json
+import os
+import time
+import fitz  # PyMuPDF - works on Windows without external tools
+import re
+from tqdm import tqdm
+
+from ocr import ocr_pages, write_ocr_sidecar, ocr_config
+from manifest import Manifest, output_name, entry_key, config_hash
+from running_lines import strip_running_lines, running_lines_config
+from epub_reader import epub_pages
+from docx_reader import docx_pages
+from math_md import markdown_pages, MATH_MD_SUPPORT
+from quality import filter_pages, write_quality_sidecar, quality_config
+from scheduler import WorkerPool, estimate, outputs_exist, SUPPORTED, WORKERS
+from telemetry import Timings, RunReport, timed_iter
+
+# Bump when extraction/cleaning changes so the manifest re-processes everything
+PIPELINE_VERSION = 4
+MIN_CHARS = 1000  # below this a PDF is treated as scanned, and any book is dropped
+RETRY_QUARANTINED = os.getenv("PIPELINE_RETRY_QUARANTINED", "0") == "1"
+
+# -----------------------
+# Document model
+# -----------------------
+
+class Page:
+    def __init__(self, number, text):
+        self.number = number  # 1-based page (PDF) or item (EPUB) number
+        self.text = text
+        self.stripped_lines = 0  # running header/footer lines removed
+        self.markdown = None  # math-aware markdown, if a writer asked for it (math_md.py)
+        self.quality = None  # quality scores, if the page was judged (quality.py)
+
+class Document:
+    def __init__(self, source, pages, ocr_stats=None, timings=None, quality_stats=None, digest=None):
+        self.source = Path(source)
+        self.digest = digest  # SHA-256 of the source file, when the caller knows it
+        self.key = None  # its manifest key, set by process()
+        self.title = get_book_title(self.source)
+        self.pages = pages  # iterator of cleaned Pages, consumed once
+        self.ocr_stats = ocr_stats if ocr_stats is not None else []
+        self.quality_stats = quality_stats if quality_stats is not None else []  # filled while streaming
+        self.timings = timings if timings is not None else Timings()
+        self.char_count = 0  # filled in while the pages are streamed
+        self.page_count = 0
+
+# -----------------------
+# Extractors (yield one string per page)
+# -----------------------
+
+def pdf_pages(pdf, sort=False):
+    """Yield page texts from a PDF using PyMuPDF (works on Windows)
+
+    sort=True returns blocks in reading order (top-left to bottom-right),
+    which markdown needs for multi-column pages but costs ~20x the time.
+    """
+    try:
+        doc = fitz.open(pdf)
+    except Exception as e:
+        print(f"   PyMuPDF error: {e}")
+        return
+    try:
+        for page in doc:
+            try:
+                yield page.get_text(sort=sort)
+            except Exception as e:
+                print(f"   PyMuPDF error on page {page.number + 1}: {e}")
+                yield ""
+    finally:
+        doc.close()
+
+def has_text_layer(pdf):
+    """True as soon as the text layer reaches MIN_CHARS (stops reading early)"""
+    total = 0
+    for text in pdf_pages(pdf):
+        total += len(text.strip())
+        if total >= MIN_CHARS:
+            return True
+    return False
+
+# -----------------------
+# Cleaning (preserve paragraphs; writers flatten further if they need to)
+# -----------------------
+
+def clean(text):
+    # Remove null characters
+    text = text.replace("\x00", "")
+
+    # Normalize whitespace within lines (but keep newlines)
+    text = re.sub(r'[^\S\n]+', ' ', text)
+
+    # Remove excessive blank lines (keep max 2)
+    text = re.sub(r'\n{3,}', '\n\n', text)
+
+    # Remove standalone page numbers (padded so numbers at page edges match too)
+    text = re.sub(r'\n\s*\d+\s*\n', '\n', f"\n{text}\n")
+
+    return text.strip()
+
+def clean_pages(raw):
+    """Clean a stream of page texts into Pages, one page at a time"""
+    # Page-boundary fix-up: printed page numbers sit on a page's first or
+    # last line. clean() pads each page with the newline the page break
+    # contributed when whole books were joined, so they are still dropped.
+    for i, text in enumerate(raw, start=1):
+        yield Page(i, clean(text))
+
+# -----------------------
+# Extract book title from filename
+# -----------------------
+
+def get_book_title(filepath):
+    """Extract clean title from filename"""
+    name = filepath.stem  # filename without extension
+    # Remove common patterns like "(Z-Library)", author names in parens
+    name = re.sub(r'\([^)]*\)', '', name)
+    name = name.strip(' -_')
+    return name
+
+# -----------------------
+# Extraction
+# -----------------------
+
+def with_markdown(pages, markdown):
+    """Attach each page's markdown to the cleaned Page of the same number"""
+    for page in pages:
+        page.markdown = next(markdown, None)
+        yield page
+
+def extract(file, digest=None, mode="full", markdown=False, sort=False):
+    """Extract and clean a file into a Document, or None if the type is unsupported
+
+    mode is "full", or one of the scheduler's degraded retry modes:
+    "reduced" (single REDUCED_DPI OCR pass) or "text" (text layer only,
+    no markdown conversion).
+    With markdown=True, text-layer PDF pages also carry Page.markdown;
+    with sort=True their text is read in reading order (pdf_pages).
+    """
+    ext = file.suffix.lower()
+    ocr_stats = []
+    quality_stats = []
+    timings = Timings()
+    stage = "extract"
+
+    if ext == ".pdf":
+        # If very little text → scanned → OCR it (never in "text" mode)
+        with timings.stage("probe"):
+            scanned = mode != "text" and not has_text_layer(file)
+        if scanned:
+            raw, stage = ocr_pages(file, ocr_stats, digest, reduced=mode == "reduced"), "ocr"
+        else:
+            raw = pdf_pages(file, sort)
+    elif ext == ".epub":
+        raw = epub_pages(file)
+    elif ext == ".docx":
+        raw = docx_pages(file)
+    else:
+        return None
+
+    # The first page of a text extractor includes opening/parsing the file
+    raw = timed_iter(raw, timings, stage, first_stage="open" if stage == "extract" else None)
+    pages = clean_pages(raw)
+    if ext == ".pdf":
+        # Reflowable formats have no running headers; their items start with real chapter headings
+        pages = strip_running_lines(pages)
+    if markdown and ext == ".pdf" and stage == "extract" and MATH_MD_SUPPORT and mode == "full":
+        # clean_pages numbers every page of the PDF, so the two streams stay aligned
+        pages = with_markdown(pages, timed_iter(markdown_pages(file, digest), timings, "markdown"))
+    # Junk pages go before any writer chunks or tokenizes them
+    pages = filter_pages(pages, quality_stats)
+    return Document(file, pages, ocr_stats, timings, quality_stats, digest)
+
+def run_config(writers):
+    """Everything that affects outputs, for the manifest key"""
+    config = {
+        "min_chars": MIN_CHARS,
+        "ocr": ocr_config(),
+        "running_lines": running_lines_config(),
+        "quality": quality_config(),
+        "writers": [w.config() for w in writers]
+    }
+    if not any(w.reading_order for w in writers):
+        config["pdf_text"] = "unsorted"  # only then, so markdown runs keep their manifest
+    return config
+
+# -----------------------
+# Main runner
+# -----------------------
+
+def file_record(file, name, doc, mode, started):
+    """Run report entry for one processed file (see telemetry.py)"""
+    record = {
+        "file": file.name,
+        "name": name,
+        "type": file.suffix.lower().lstrip("."),
+        "size_bytes": file.stat().st_size,
+        "mode": mode,
+        "seconds": round(time.perf_counter() - started, 4),
+    }
+    if doc is not None:
+        record.update({
+            "pages": doc.page_count,
+            "ocr": bool(doc.ocr_stats),
+            "ocr_pages": len(doc.ocr_stats),
+            "chars": doc.char_count,
+            "pages_failed_quality": sum(1 for p in doc.quality_stats if not p["ok"]),
+            "stages": doc.timings.result(),
+        })
+    return record
+
+def process(file, digest, writers, out_dir, mode="full", report=None):
+    """Extract once and hand the Document to every writer; returns written paths
+
+    If report is a dict it is filled with the file's run report record,
+    even when processing fails part way.
+    """
+    started = time.perf_counter()
+    name = output_name(digest)
+    doc = None
+    try:
+        doc = extract(file, digest, mode, any(w.wants_markdown for w in writers), any(w.reading_order for w in writers))
+        if doc is None:
+            return []
+        doc.key = entry_key(digest, PIPELINE_VERSION, config_hash(run_config(writers)))
+        return write_document(doc, name, writers, out_dir)
+    finally:
+        if report is not None:
+            report.update(file_record(file, name, doc, mode, started))
+
+def write_document(doc, name, writers, out_dir):
+    t = doc.timings
+    pages = timed_iter(doc.pages, t, "pages")
+
+    # Hold back the first pages until the book is known to be long enough,
+    # so too-short books never create output files
+    pending = []
+    try:
+        for page in pages:
+            doc.char_count += len(page.text)
+            doc.page_count += 1
+            if pending is None:
+                with t.stage("write"):
+                    for w in writers:
+                        w.write_page(page)
+                continue
+            pending.append(page)
+            if doc.char_count >= MIN_CHARS:
+                with t.stage("write"):
+                    for w in writers:
+                        w.begin(doc, name)
+                    for p in pending:
+                        for w in writers:
+                            w.write_page(p)
+                pending = None
+    except Exception:
+        if pending is None:
+            for w in writers:
+                w.abort()
+        raise
+
+    if pending is not None:
+        return []
+
+    outputs = []
+    with t.stage("write"):
+        for w in writers:
+            outputs.extend(w.end())
+
+        if doc.ocr_stats:
+            outputs.append(write_ocr_sidecar(Path(out_dir) / name, doc.source, doc.ocr_stats))
+        if doc.quality_stats:
+            outputs.append(write_quality_sidecar(Path(out_dir) / name, doc.source, doc.quality_stats))
+
+    print(f"   ✅ Saved: {name} ({doc.char_count:,} chars, {len(writers)} formats)")
+    return outputs
+
+def quarantine(out_dir, file, digest, errors):
+    """Append a file the pipeline gave up on to <out_dir>/quarantine.jsonl"""
+    with (Path(out_dir) / "quarantine.jsonl").open("a", encoding="utf-8") as f:
+        f.write(json.dumps({
+            "path": str(file),
+            "sha256": digest,
+            "errors": errors,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S")
+        }) + "\n")
+
+class Ingest:
+    """Manifest, report and bookkeeping shared by batch runs and the watch daemon (watch.py)"""
+
+    def __init__(self, out_dir, writers):
+        self.out_dir = Path(out_dir)
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self.writers = writers
+        self.manifest = Manifest(self.out_dir / "manifest.jsonl", PIPELINE_VERSION, run_config(writers))
+        self.report = RunReport(self.out_dir)
+        self.skipped = 0
+        self.success = 0
+        self.quarantined = 0
+        self.unflushed = {}  # digest -> (job, outputs): done, but a shard holding it is not closed yet
+
+    def plan(self, files, progress=False):
+        """Jobs for the files that are new or changed; unsupported files are recorded as skipped"""
+        jobs = []
+        planned = {}  # digest -> first file in this batch with that content
+        markdown = MATH_MD_SUPPORT and any(w.wants_markdown for w in self.writers)
+        for f in tqdm(files, desc="Estimating", unit="file", disable=not progress):
+            try:
+                digest = self.manifest.digest(f)
+                if digest in planned:
+                    # A copy of a file already in this batch: one worker writes it, once
+                    self.skipped += 1
+                    print(f"⏭️  Skipped: {f.name} - duplicate of {planned[digest].name}")
+                elif digest in self.unflushed:
+                    self.skipped += 1
+                elif self.manifest.is_done(digest) and not (RETRY_QUARANTINED and self.manifest.status(digest) == "quarantined"):
+                    self.skipped += 1
+                elif f.suffix.lower() not in SUPPORTED:
+                    self.manifest.record(f, digest, "skipped", [])
+                else:
+                    jobs.append(estimate(f, digest, markdown))
+                    planned[digest] = f
+            except Exception as e:
+                print(f"❌ Failed: {f.name} - {e}")
+        return jobs
+
+    def pool(self, workers=WORKERS):
+        return WorkerPool(process, self.writers, self.out_dir, workers=workers)
+
+    def on_done(self, job, status, outputs, error, seconds, record):
+        self.report.add({
+            "file": job.file.name,
+            "name": output_name(job.digest),
+            "size_bytes": job.size,
+            **record,
+            "status": status,
+            "error": error,
+            "estimated_seconds": round(job.cost, 2),
+            "seconds": round(seconds, 4),
+        })
+        if status == "done" and (outputs or job.mode == "full"):
+            # Recorded once every output exists; until then a crash must leave it to the next run
+            self.unflushed[job.digest] = (job, outputs)
+            self.record_flushed()
+        elif status == "done" or status == "quarantined":
+            # A degraded retry that produced nothing has failed as well
+            errors = job.errors if status == "quarantined" else job.errors + [f"{job.mode}: no usable text"]
+            self.manifest.record(job.file, job.digest, "quarantined", [], job.mode)
+            quarantine(self.out_dir, job.file, job.digest, errors)
+            self.quarantined += 1
+            print(f"🚧 Quarantined: {job.file.name} - {'; '.join(errors)}")
+        else:
+            print(f"❌ Failed: {job.file.name} - {error}")
+
+    def record_flushed(self):
+        """Record finished documents in the manifest once all their outputs are on disk"""
+        for digest, (job, outputs) in list(self.unflushed.items()):
+            if outputs_exist(outputs):
+                del self.unflushed[digest]
+                self.manifest.record(job.file, digest, "done" if outputs else "skipped", outputs, job.mode)
+                self.success += 1
+
+    def finish(self):
+        """Close the writers, record what they flushed and print the run summary"""
+        # Writers that batch several documents per file finalise them here
+        for w in self.writers:
+            w.close()
+        self.record_flushed()
+        if self.unflushed:
+            print(f"⚠️  {len(self.unflushed)} finished files never reached a closed shard; they run again next time")
+        if self.report.records:
+            self.report.finish()
+        print(f"\n⏭️  Skipped {self.skipped} unchanged files (see {self.manifest.path.name})")
+        if self.quarantined:
+            print(f"🚧 Quarantined {self.quarantined} files (see quarantine.jsonl)")
+        print(f"\n✅ Done! Processed {self.success} books → {self.out_dir}/")
+
+def run(data_dir, out_dir, writers, workers=WORKERS):
+    """Process every new or changed file under data_dir with the given writers"""
+    ingest = Ingest(out_dir, writers)
+    files = [f for f in Path(data_dir).rglob("*") if f.is_file()]
+    print(f"📚 Found {len(files)} files to process...\n")
+    jobs = ingest.plan(files, progress=True)
+    try:
+        if jobs:
+            ingest.pool(workers).run(jobs, ingest.on_done)
+    finally:
+        ingest.finish()
+    return ingest.success
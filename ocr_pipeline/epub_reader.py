@@ -0,0 +1,144 @@
+"""
+Streaming EPUB text extraction.
+
+An EPUB is a zip: META-INF/container.xml points at the OPF package file,
+whose manifest maps item ids to files and whose spine lists them in
+reading order. epub_pages() reads exactly that, straight from the zip,
+one spine item at a time, instead of loading the whole book with
+ebooklib and building a BeautifulSoup tree per item.
+
+Item text comes from lxml's (libxml2) HTML parser driven in target mode:
+parse events go straight into a TextCollector, no tree is built, and
+block elements (paragraphs, headings, list items, table rows) become
+blank-line breaks so the markdown writers keep the book's structure.
+<pre> blocks keep their line breaks and indentation.
+"""
+
+from pathlib import PurePosixPath
+from urllib.parse import unquote
+import re
+import zipfile
+from lxml import etree
+
+CONTAINER = "META-INF/container.xml"
+
+BLOCK_TAGS = {
+    "address", "article", "aside", "blockquote", "dd", "div", "dl", "dt", "figcaption",
+    "figure", "footer", "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "li", "ol",
+    "p", "pre", "section", "table", "tr", "ul",
+}
+SKIP_TAGS = {"head", "script", "style", "svg", "math"}  # math is MathML markup, not prose
+SPACES = re.compile(r"\s+")
+BLANK_LINES = re.compile(r"\n{3,}")
+XML_ENCODING = re.compile(rb"""^<\?xml[^>]*encoding=["']([A-Za-z0-9._-]+)["']""")
+
+# -----------------------
+# Package structure
+# -----------------------
+
+def local_name(tag):
+    return tag.rsplit("}", 1)[-1].lower() if isinstance(tag, str) else ""
+
+def spine_paths(zf):
+    """Zip paths of the spine items, in reading order"""
+    container = etree.fromstring(zf.read(CONTAINER))
+    rootfile = next(e for e in container.iter() if local_name(e.tag) == "rootfile")
+    opf_path = rootfile.get("full-path")
+    opf = etree.fromstring(zf.read(opf_path))
+    base = PurePosixPath(opf_path).parent
+
+    manifest = {}
+    for e in opf.iter():
+        if local_name(e.tag) == "item":
+            manifest[e.get("id")] = e.get("href")
+    paths = []
+    for e in opf.iter():
+        if local_name(e.tag) == "itemref" and e.get("idref") in manifest:
+            href = unquote(manifest[e.get("idref")].split("#", 1)[0])
+            paths.append(str(base / href) if str(base) != "." else href)
+    return paths
+
+# -----------------------
+# Item text
+# -----------------------
+
+class TextCollector:
+    """lxml parser target: text with a blank line around every block element"""
+
+    def __init__(self):
+        self.parts = []
+        self.blocks = []  # (text, inside <pre>), flushed at the outermost <pre> boundaries
+        self.skip = 0
+        self.pre = 0
+
+    def flush(self, pre):
+        self.blocks.append(("".join(self.parts), pre))
+        self.parts = []
+
+    def start(self, tag, attrib):
+        tag = local_name(tag)
+        if tag in SKIP_TAGS:
+            self.skip += 1
+        elif tag == "br":
+            self.parts.append("\n")
+        elif tag in BLOCK_TAGS:
+            if tag == "pre":
+                if not self.pre:
+                    self.flush(False)
+                self.pre += 1
+            else:
+                self.parts.append("\n\n")
+
+    def end(self, tag):
+        tag = local_name(tag)
+        if tag in SKIP_TAGS:
+            self.skip -= 1
+        elif tag in BLOCK_TAGS:
+            if tag == "pre" and self.pre:
+                self.pre -= 1
+                if not self.pre:
+                    self.flush(True)
+            else:
+                self.parts.append("\n\n")
+
+    def data(self, data):
+        if not self.skip:
+            # Source line breaks inside a paragraph are just spaces (except in <pre>)
+            self.parts.append(data if self.pre else SPACES.sub(" ", data))
+
+    def comment(self, text):
+        pass
+
+    def close(self):
+        self.flush(self.pre > 0)  # an unclosed <pre> runs to the end of the item
+        out = []
+        for text, pre in self.blocks:
+            if pre:
+                text = text.strip("\n")  # verbatim, but the block itself gets blank lines around it
+            else:
+                lines = text.split("\n")
+                text = BLANK_LINES.sub("\n\n", "\n".join(l.strip() for l in lines)).strip()
+            if text.strip():
+                out.append(text)
+        return "\n\n".join(out)
+
+def item_encoding(data):
+    """EPUB content documents are UTF-8 or UTF-16; libxml2's HTML parser would assume Latin-1"""
+    if data[:2] in (b"\xff\xfe", b"\xfe\xff"):
+        return "utf-16"
+    m = XML_ENCODING.match(data.lstrip(b"\xef\xbb\xbf"))
+    return m.group(1).decode("ascii") if m else "utf-8"
+
+def item_text(data):
+    """Text of one (X)HTML spine item"""
+    parser = etree.HTMLParser(target=TextCollector(), remove_comments=True, encoding=item_encoding(data))
+    parser.feed(data)
+    return parser.close()
+
+def epub_pages(path):
+    """Yield the text of every spine item of an EPUB, in reading order"""
+    with zipfile.ZipFile(path) as zf:
+        names = set(zf.namelist())
+        for name in spine_paths(zf):
+            if name in names:
+                yield item_text(zf.read(name))
@@ -0,0 +1,138 @@
+"""
+Content-hash manifest for incremental, resumable pipeline runs.
+
+Every input file is identified by the SHA-256 of its bytes. A file counts
+as done once the manifest holds an entry for
+(content hash, pipeline version, extractor config), so unchanged inputs
+are skipped on the next run and a crashed run resumes where it stopped.
+Outputs are named from the content hash, so adding or removing files
+never renames anything else.
+
+The manifest is an append-only JSONL log: one line per finished file,
+flushed and fsync'd before moving on. A torn last line from a crash is
+simply ignored on load.
+"""
+
+from pathlib import Path
+import hashlib
+import json
+import os
+
+HASH_BLOCK = 1 << 20  # read inputs in 1 MB blocks while hashing
+
+def file_sha256(path):
+    """SHA-256 hex digest of a file's contents, read in blocks"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+class DigestCache:
+    """File content hashes kept in a JSON file, reused while size and mtime are unchanged
+
+    For post-processing tools that re-read the same outputs every run;
+    the manifest does the same for inputs from its own entries.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        # str(path) -> [size, mtime_ns, sha256]
+        self.hashes = json.loads(self.path.read_text(encoding="utf-8")) if self.path.exists() else {}
+
+    def digest(self, path):
+        st = Path(path).stat()
+        cached = self.hashes.get(str(path))
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            return cached[2]
+        digest = file_sha256(path)
+        self.hashes[str(path)] = [st.st_size, st.st_mtime_ns, digest]
+        return digest
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = Path(f"{self.path}.tmp")
+        tmp.write_text(json.dumps(self.hashes), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+def config_hash(config):
+    """Short stable hash of a JSON-serialisable config dict"""
+    blob = json.dumps(config, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(blob).hexdigest()[:12]
+
+def entry_key(digest, pipeline_version, config_hash):
+    """Manifest key: the content hash plus everything that produced its outputs"""
+    return f"{digest}:{pipeline_version}:{config_hash}"
+
+def output_name(digest):
+    """Stable output stem for a content hash, e.g. book_3fa2c91e0b7d4a55"""
+    return f"book_{digest[:16]}"
+
+class Manifest:
+    def __init__(self, path, pipeline_version, config):
+        self.path = Path(path)
+        self.pipeline_version = str(pipeline_version)
+        self.config = config
+        self.config_hash = config_hash(config)
+        self.entries = {}  # key -> entry
+        self.stat_cache = {}  # str(path) -> (size, mtime_ns, digest)
+        self._load()
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        with self.path.open("r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn write from an interrupted run
+                self.entries[entry["key"]] = entry
+                self.stat_cache[entry["path"]] = (entry["size"], entry["mtime_ns"], entry["sha256"])
+
+    def key(self, digest):
+        return entry_key(digest, self.pipeline_version, self.config_hash)
+
+    def digest(self, file):
+        """Content hash of a file, reusing the recorded one if size and mtime are unchanged"""
+        st = file.stat()
+        cached = self.stat_cache.get(str(file))
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            return cached[2]
+        digest = file_sha256(file)
+        self.stat_cache[str(file)] = (st.st_size, st.st_mtime_ns, digest)
+        return digest
+
+    def is_done(self, digest):
+        return self.key(digest) in self.entries
+
+    def status(self, digest):
+        entry = self.entries.get(self.key(digest))
+        return entry["status"] if entry else None
+
+    def record(self, file, digest, status, outputs=(), mode="full"):
+        """Append a finished file; status is 'done', 'skipped' (e.g. too little text) or 'quarantined'
+
+        mode is the extraction mode the outputs came from ("full" unless a
+        retry after a breached time/memory limit degraded it).
+        """
+        st = file.stat()
+        entry = {
+            "key": self.key(digest),
+            "sha256": digest,
+            "pipeline_version": self.pipeline_version,
+            "config_hash": self.config_hash,
+            "path": str(file),
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "status": status,
+            "mode": mode,
+            "outputs": [Path(o).name for o in outputs]
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.entries[entry["key"]] = entry
+        return entry
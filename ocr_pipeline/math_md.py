@@ -0,0 +1,133 @@
+"""
+Math-aware markdown for text-layer PDFs via pymupdf4llm.
+
+pymupdf4llm keeps headings, lists, tables and inline math that
+get_text(sort=True) flattens, but converting a thousand-page book in one
+call is slow and one bad page fails the whole conversion. Here:
+
+- pages are converted in ranges of PAGE_RANGE on MATH_MD_WORKERS
+  processes, results streamed back in page order;
+- a range that fails is retried page by page, and a page that still
+  fails falls back to its plain get_text(sort=True) text;
+- every converted page is stored in the persistent page cache
+  (ocr_cache.py) under its own key, so a re-run only converts pages it
+  has never seen. Fallback pages are not cached: a re-run tries them
+  again, e.g. after a pymupdf4llm fix or a transient failure.
+
+The engine asks for markdown only when a writer sets wants_markdown
+(MathMarkdownWriter) and attaches it to Page.markdown next to the plain
+text every other writer uses.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing as mp
+import os
+import re
+import fitz  # PyMuPDF
+
+from ocr_cache import get_ocr_cache, page_key
+
+# Install: pip install pymupdf4llm
+try:
+    import pymupdf4llm
+    MATH_MD_SUPPORT = True
+except ImportError:
+    MATH_MD_SUPPORT = False
+
+MATH_MD_WORKERS = int(os.getenv("MATH_MD_WORKERS", "4"))
+PAGE_RANGE = 16  # pages converted per task
+
+CONVERTED, FALLBACK = 1.0, 0.0  # stored as the cache entry's confidence
+
+BLANK_LINES = re.compile(r"\n{3,}")
+
+def md_engine():
+    return f"pymupdf4llm-{pymupdf4llm.__version__}" if MATH_MD_SUPPORT else None
+
+def clean_markdown(md):
+    """clean() would collapse indentation inside code and tables; markdown only loses blank runs"""
+    return BLANK_LINES.sub("\n\n", md.replace("\x00", "")).strip()
+
+# -----------------------
+# Conversion (runs in pool processes)
+# -----------------------
+
+def chunk_page_no(chunk):
+    meta = chunk["metadata"]
+    return meta.get("page_number") or meta.get("page")  # 1-based; the key differs between versions
+
+def convert(doc, pages):
+    """{page number (1-based): markdown} for 0-based pages"""
+    chunks = pymupdf4llm.to_markdown(doc, pages=pages, page_chunks=True, show_progress=False)
+    return {chunk_page_no(c): c["text"] for c in chunks}
+
+def convert_range(args):
+    """[(page_no, text, CONVERTED|FALLBACK)] for a range of 1-based page numbers"""
+    pdf, page_nos = args
+    with fitz.open(pdf) as doc:
+        try:
+            done = convert(doc, [n - 1 for n in page_nos])
+        except Exception:
+            done = {}
+        out = []
+        for n in page_nos:
+            if n not in done:
+                try:
+                    done.update(convert(doc, [n - 1]))
+                except Exception:
+                    pass
+            if n in done:
+                out.append((n, done[n], CONVERTED))
+            else:
+                out.append((n, doc[n - 1].get_text(sort=True), FALLBACK))
+        return out
+
+def can_fork():
+    # Daemonic processes may not have children
+    return not mp.current_process().daemon
+
+# -----------------------
+# Streaming, cached
+# -----------------------
+
+def markdown_pages(pdf, digest, workers=MATH_MD_WORKERS):
+    """Yield the markdown of every page of a PDF, in order"""
+    cache = get_ocr_cache()
+    engine = md_engine()
+    with fitz.open(pdf) as doc:
+        n_pages = doc.page_count
+
+    cached = {}
+    if cache is not None:
+        for n in range(1, n_pages + 1):
+            hit = cache.get(page_key(digest, n, "md", engine))
+            # FALLBACK entries from older runs count as misses
+            if hit is not None and hit[1] == CONVERTED:
+                cached[n] = hit
+    missing = [n for n in range(1, n_pages + 1) if n not in cached]
+    ranges = [(str(pdf), missing[i:i + PAGE_RANGE]) for i in range(0, len(missing), PAGE_RANGE)]
+
+    pool = None
+    if workers > 1 and len(ranges) > 1 and can_fork():
+        pool = ProcessPoolExecutor(max_workers=workers)
+        results = pool.map(convert_range, ranges)  # in order, computed ahead
+    else:
+        results = map(convert_range, ranges)
+
+    try:
+        converted = iter(())
+        for n in range(1, n_pages + 1):
+            if n in cached:
+                text = cached[n][0]
+            else:
+                item = next(converted, None)
+                if item is None:
+                    converted = iter(next(results))
+                    item = next(converted)
+                _, text, source = item
+                if cache is not None and source == CONVERTED:
+                    cache.put(page_key(digest, n, "md", engine), text, source)
+            yield clean_markdown(text)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
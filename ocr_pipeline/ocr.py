@@ -0,0 +1,167 @@
+"""
+Adaptive-DPI OCR shared by the ocr_pipeline scripts.
+
+Every page is OCR'd first at LOW_DPI with word-level confidences from
+tesseract. Only pages whose mean word confidence is below MIN_CONFIDENCE
+are re-rendered and re-OCR'd at HIGH_DPI, so clean scans never pay for
+the expensive high-resolution pass.
+
+Every (page, DPI) result is looked up in the persistent OCR cache
+(ocr_cache.py) before anything is rendered.
+
+With OCR_PREPROCESS=1 pages are rendered grayscale and binarized,
+deskewed and cropped (ocr_preprocess.py) before tesseract sees them.
+"""
+
+from pathlib import Path
+import json
+import pytesseract
+from pdf2image import convert_from_path, pdfinfo_from_path
+
+from ocr_cache import get_ocr_cache, page_key
+from manifest import file_sha256
+from ocr_preprocess import preprocess, preprocess_config, OCR_PREPROCESS, PREPROCESS_VERSION
+
+LOW_DPI = 200
+HIGH_DPI = 400  # what every page used to be rendered at
+REDUCED_DPI = 150  # retry mode for files that blew a time or memory limit
+MIN_CONFIDENCE = 80.0  # mean word confidence (0-100) below which we re-scan
+TESSERACT_CONFIG = "--oem 3 --psm 3"
+
+# -----------------------
+# Single page
+# -----------------------
+
+def render_page(pdf, page_no, dpi):
+    """Render one 1-based page of a PDF to a PIL image"""
+    images = convert_from_path(pdf, dpi=dpi, first_page=page_no, last_page=page_no, grayscale=OCR_PREPROCESS)
+    return images[0]
+
+def ocr_image(image):
+    """OCR an image, returning (text, mean word confidence or None if no words)"""
+    data = pytesseract.image_to_data(
+        image,
+        config=TESSERACT_CONFIG,
+        output_type=pytesseract.Output.DICT
+    )
+
+    # Rebuild the text layout from tesseract's block/paragraph/line numbering
+    lines = {}
+    confs = []
+    for i, word in enumerate(data["text"]):
+        conf = float(data["conf"][i])
+        if conf < 0 or not word.strip():
+            continue
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        lines.setdefault(key, []).append(word)
+        confs.append(conf)
+
+    out = []
+    prev_par = None
+    for (block, par, _), words in lines.items():
+        if prev_par is not None and (block, par) != prev_par:
+            out.append("")  # blank line between paragraphs
+        out.append(" ".join(words))
+        prev_par = (block, par)
+
+    mean_conf = sum(confs) / len(confs) if confs else None
+    return "\n".join(out), mean_conf
+
+def ocr_engine():
+    """Identifies the OCR engine and settings for cache keys"""
+    global _engine
+    if _engine is None:
+        _engine = f"tesseract-{pytesseract.get_tesseract_version()}|{TESSERACT_CONFIG}"
+        if OCR_PREPROCESS:
+            settings = ",".join(f"{k}={v}" for k, v in preprocess_config().items() if k != "version")
+            _engine += f"|pre-v{PREPROCESS_VERSION}:{settings}"
+    return _engine
+
+_engine = None
+
+def ocr_at(pdf, digest, page_no, dpi):
+    """OCR one page at one DPI through the cache; returns (text, conf, cached)"""
+    cache = get_ocr_cache()
+    key = page_key(digest, page_no, dpi, ocr_engine())
+    if cache is not None:
+        hit = cache.get(key)
+        if hit is not None:
+            return hit[0], hit[1], True
+
+    image = render_page(pdf, page_no, dpi)
+    if OCR_PREPROCESS:
+        image = preprocess(image, dpi)
+    text, conf = ocr_image(image)
+    if cache is not None:
+        cache.put(key, text, conf)
+    return text, conf, False
+
+def ocr_page(pdf, page_no, digest, reduced=False):
+    """OCR one page at LOW_DPI, re-scanning at HIGH_DPI if confidence is low (one REDUCED_DPI pass if reduced)"""
+    if reduced:
+        text, conf, cached = ocr_at(pdf, digest, page_no, REDUCED_DPI)
+        return text, REDUCED_DPI, conf, cached
+
+    text, conf, cached = ocr_at(pdf, digest, page_no, LOW_DPI)
+    dpi = LOW_DPI
+
+    # Blank pages (no words at all) are not worth a second pass
+    if conf is not None and conf < MIN_CONFIDENCE:
+        hi_text, hi_conf, hi_cached = ocr_at(pdf, digest, page_no, HIGH_DPI)
+        cached = cached and hi_cached
+        if hi_conf is not None and hi_conf >= conf:
+            text, conf, dpi = hi_text, hi_conf, HIGH_DPI
+
+    return text, dpi, conf, cached
+
+# -----------------------
+# Whole document
+# -----------------------
+
+def ocr_pages(pdf, page_stats=None, digest=None, reduced=False):
+    """Yield the OCR text of each page of a PDF; per-page DPI/confidence go into page_stats if given"""
+    if digest is None:
+        digest = file_sha256(pdf)
+    n_pages = pdfinfo_from_path(pdf)["Pages"]
+    for page_no in range(1, n_pages + 1):
+        t, dpi, conf, cached = ocr_page(pdf, page_no, digest, reduced)
+        if page_stats is not None:
+            page_stats.append({
+                "page": page_no,
+                "dpi": dpi,
+                "confidence": None if conf is None else round(conf, 2),
+                "cached": cached
+            })
+        yield t
+
+def ocr_pdf(pdf, page_stats=None, digest=None):
+    """OCR a whole PDF into one string"""
+    return "\n".join(ocr_pages(pdf, page_stats, digest))
+
+def write_ocr_sidecar(out, source, page_stats):
+    """Write per-page OCR stats next to an output file as <stem>.ocr.json"""
+    sidecar = Path(out).with_suffix(".ocr.json")
+    rescanned = sum(1 for p in page_stats if p["dpi"] == HIGH_DPI)
+    with sidecar.open("w", encoding="utf-8") as f:
+        json.dump({
+            "source": Path(source).name,
+            "low_dpi": LOW_DPI,
+            "high_dpi": HIGH_DPI,
+            "min_confidence": MIN_CONFIDENCE,
+            "pages_rescanned": rescanned,
+            "pages": page_stats
+        }, f, indent=2)
+    return sidecar
+
+def ocr_config():
+    """OCR settings that affect output, for manifest/cache keys"""
+    config = {
+        "low_dpi": LOW_DPI,
+        "high_dpi": HIGH_DPI,
+        "min_confidence": MIN_CONFIDENCE,
+        "tesseract": TESSERACT_CONFIG
+    }
+    if OCR_PREPROCESS:
+        # Only when on, so manifests of raw-render runs stay valid
+        config["preprocess"] = preprocess_config()
+    return config
@@ -0,0 +1,133 @@
+"""
+Persistent page-level OCR cache.
+
+Raw OCR text and mean confidence are stored per
+(document hash, page number, DPI, OCR engine/config) in a single SQLite
+file, zlib-compressed. When the store grows past OCR_CACHE_MAX_MB the
+least recently used pages are evicted, so re-running the pipeline after
+a change to cleaning or chunking never pays for OCR twice.
+
+Every worker process shares the file. A connection's own idea of the
+store's size is only an estimate between syncs: eviction re-reads
+SUM(size) inside a write transaction, and runs every SYNC_PUTS puts
+or when the estimate passes the limit. Hits do not commit one by one;
+their last_used updates are written in batches (TOUCH_BATCH hits or
+TOUCH_SECONDS) and with the next put or eviction, so an LRU order at
+most that stale is all a crash can lose.
+
+Set OCR_CACHE_MAX_MB=0 to disable the cache.
+"""
+
+from pathlib import Path
+import os
+import sqlite3
+import time
+import zlib
+
+OCR_CACHE_PATH = Path(os.getenv("OCR_CACHE_PATH", ".ocr_cache/ocr_pages.sqlite"))
+OCR_CACHE_MAX_MB = int(os.getenv("OCR_CACHE_MAX_MB", "2048"))
+EVICT_TO = 0.9  # after eviction the store is at most this fraction of the limit
+SYNC_PUTS = 64  # puts between re-reading the store's real size
+TOUCH_BATCH = 256  # hits whose last_used is written in one transaction
+TOUCH_SECONDS = 60.0
+
+def page_key(digest, page_no, dpi, engine):
+    """Cache key for one OCR'd page"""
+    return f"{digest}:{page_no}:{dpi}:{engine}"
+
+class OcrCache:
+    def __init__(self, path, max_bytes):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Pipeline workers each open their own connection; WAL lets them share the file
+        self.conn = sqlite3.connect(self.path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                key TEXT PRIMARY KEY,
+                text BLOB NOT NULL,
+                conf REAL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON pages(last_used)")
+        self.conn.commit()
+        self.total_bytes = self.stored_bytes()  # estimate, re-read by evict()
+        self.puts = 0  # since the last re-read
+        self.touched = {}  # key -> last hit, not written yet
+        self.touched_at = time.time()
+
+    def stored_bytes(self):
+        return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+
+    def _write_touches(self):
+        """Write buffered last_used updates (inside the caller's transaction)"""
+        if self.touched:
+            self.conn.executemany(
+                "UPDATE pages SET last_used = ? WHERE key = ?",
+                [(t, key) for key, t in self.touched.items()]
+            )
+            self.touched = {}
+        self.touched_at = time.time()
+
+    def get(self, key):
+        """Return (text, conf) for a cached page, or None"""
+        row = self.conn.execute("SELECT text, conf FROM pages WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self.touched[key] = time.time()
+        if len(self.touched) >= TOUCH_BATCH or time.time() - self.touched_at >= TOUCH_SECONDS:
+            with self.conn:
+                self._write_touches()
+        return zlib.decompress(row[0]).decode("utf-8"), row[1]
+
+    def put(self, key, text, conf):
+        blob = zlib.compress(text.encode("utf-8"), 6)
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO pages (key, text, conf, size, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, blob, conf, len(blob), time.time())
+            )
+            self._write_touches()
+        # Other workers grow the store too, and a replaced row is counted twice:
+        # the estimate only decides when to look at the real size
+        self.total_bytes += len(blob)
+        self.puts += 1
+        if self.puts >= SYNC_PUTS or self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """Re-read the store's size; if over the limit, drop least recently used pages down to EVICT_TO of it"""
+        target = int(self.max_bytes * EVICT_TO)
+        doomed = []
+        with self.conn:
+            # No other worker writes between reading the size and deleting
+            self.conn.execute("BEGIN IMMEDIATE")
+            self._write_touches()
+            remaining = self.stored_bytes()
+            if remaining > self.max_bytes:
+                for key, size in self.conn.execute("SELECT key, size FROM pages ORDER BY last_used"):
+                    if remaining <= target:
+                        break
+                    doomed.append((key,))
+                    remaining -= size
+                self.conn.executemany("DELETE FROM pages WHERE key = ?", doomed)
+        self.total_bytes = remaining
+        self.puts = 0
+        return len(doomed)
+
+_cache = None
+_cache_pid = None
+
+def get_ocr_cache():
+    """Get or create this process's OCR cache (None if disabled)"""
+    global _cache, _cache_pid
+    if OCR_CACHE_MAX_MB <= 0:
+        return None
+    # sqlite connections must not cross a fork
+    if _cache is None or _cache_pid != os.getpid():
+        _cache = OcrCache(OCR_CACHE_PATH, OCR_CACHE_MAX_MB * 1024 * 1024)
+        _cache_pid = os.getpid()
+    return _cache
@@ -0,0 +1,132 @@
+"""
+Vectorized page-image pre-processing before OCR.
+
+Scanned pages used to reach tesseract as full-colour renders, margins,
+speckle and skew included. With OCR_PREPROCESS=1 every rendered page
+goes through preprocess() first, all numpy over the pixel buffer:
+
+1. grayscale    pages are rendered grayscale; RGB input is reduced with
+                integer luma weights
+2. binarize     adaptive (Bradley) threshold: a pixel is ink when it is
+                THRESHOLD darker than the mean of the WINDOW_INCH box
+                around it; isolated specks are dropped. Box means come
+                from separable cumulative sums, so the cost is
+                O(pixels) whatever the window.
+3. deskew       projection-profile search: sampled ink pixels are
+                sheared by every candidate angle at once and the angle
+                whose row histogram is sharpest wins. Pages skewed more
+                than MIN_SKEW degrees are rotated back.
+4. crop         blank margins are cut to MARGIN_INCH around the ink.
+
+tesseract then gets a small 1-bit-like image instead of a large noisy
+one. PREPROCESS_VERSION and the settings are part of the OCR cache key
+and of ocr_config(), so cached text from raw renders is never reused.
+"""
+
+import os
+import numpy as np
+from PIL import Image
+
+OCR_PREPROCESS = os.getenv("OCR_PREPROCESS", "0") == "1"
+PREPROCESS_VERSION = 1  # bump when the output images change
+
+WINDOW_INCH = 1 / 6  # local threshold window (33 px at 200 DPI)
+THRESHOLD = 0.2  # ink is this much darker than its surroundings
+MIN_NEIGHBOURS = 3  # ink pixels with fewer ink pixels in their 3x3 box are speckle
+MAX_SKEW = 5.0  # degrees searched either way
+SKEW_STEP = 0.1
+MIN_SKEW = 0.3  # below this tesseract copes and resampling is not worth it
+SKEW_POINTS = 50_000  # ink pixels sampled for the skew search
+MARGIN_INCH = 0.1
+
+INK, PAPER = 0, 255
+
+def to_gray(image):
+    """uint8 luminance array of a PIL image"""
+    if image.mode == "L":
+        return np.asarray(image)
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGB")
+    rgb = np.asarray(image)[..., :3].astype(np.uint16)
+    return ((rgb[..., 0] * 77 + rgb[..., 1] * 150 + rgb[..., 2] * 29) >> 8).astype(np.uint8)
+
+def box_sums(a, r):
+    """Sum of a over the (2r+1)-square window around every pixel, clipped at the edges"""
+    h, w = a.shape
+    rows = np.arange(h)
+    cols = np.arange(w)
+    c = np.zeros((h + 1, w), dtype=np.int32)
+    np.cumsum(a, axis=0, dtype=np.int32, out=c[1:])
+    v = c[np.minimum(rows + r + 1, h)] - c[np.maximum(rows - r, 0)]
+    c = np.zeros((h, w + 1), dtype=np.int32)
+    np.cumsum(v, axis=1, dtype=np.int32, out=c[:, 1:])
+    return c[:, np.minimum(cols + r + 1, w)] - c[:, np.maximum(cols - r, 0)]
+
+def binarize(gray, dpi):
+    """Boolean ink mask by Bradley's adaptive threshold"""
+    h, w = gray.shape
+    r = max(3, int(dpi * WINDOW_INCH) // 2)
+    sums = box_sums(gray, r)
+    rows = np.arange(h)
+    cols = np.arange(w)
+    heights = np.minimum(rows + r + 1, h) - np.maximum(rows - r, 0)
+    widths = np.minimum(cols + r + 1, w) - np.maximum(cols - r, 0)
+    area = heights[:, None].astype(np.int32) * widths[None, :]
+    # gray < mean * (1 - THRESHOLD), in integers
+    ink = gray.astype(np.int32) * area * 100 < sums * int(round(100 * (1 - THRESHOLD)))
+    # Despeckle: strokes are at least two pixels wide at OCR resolutions, noise is not
+    return ink & (box_sums(ink.view(np.uint8), 1) >= MIN_NEIGHBOURS)
+
+def estimate_skew(ink):
+    """Angle in degrees that straightens the text lines of an ink mask (0.0 if there is too little ink)"""
+    ys, xs = np.nonzero(ink)
+    if len(ys) < 100:
+        return 0.0
+    if len(ys) > SKEW_POINTS:
+        pick = np.linspace(0, len(ys) - 1, SKEW_POINTS).astype(np.int64)
+        ys, xs = ys[pick], xs[pick]
+    angles = np.arange(-MAX_SKEW, MAX_SKEW + SKEW_STEP / 2, SKEW_STEP)
+    slopes = np.tan(np.radians(angles)).astype(np.float32)
+    # Row every sampled pixel lands on after shearing by each angle: (angles, points)
+    rows = np.rint(ys.astype(np.float32) + xs.astype(np.float32) * slopes[:, None]).astype(np.int64)
+    rows -= rows.min()
+    height = int(rows.max()) + 1
+    rows += np.arange(len(angles))[:, None] * height
+    hist = np.bincount(rows.ravel(), minlength=len(angles) * height).reshape(len(angles), height)
+    # Aligned lines concentrate ink in few rows: maximise the sum of squares
+    sharpness = (hist.astype(np.float64) ** 2).sum(axis=1)
+    return round(float(angles[int(np.argmax(sharpness))]), 2)
+
+def crop(ink, dpi):
+    """Ink mask cut down to the ink's bounding box plus MARGIN_INCH (None if the page is blank)"""
+    rows = np.flatnonzero(ink.any(axis=1))
+    cols = np.flatnonzero(ink.any(axis=0))
+    if not len(rows):
+        return None
+    m = int(dpi * MARGIN_INCH)
+    h, w = ink.shape
+    return ink[max(rows[0] - m, 0):min(rows[-1] + m + 1, h), max(cols[0] - m, 0):min(cols[-1] + m + 1, w)]
+
+def preprocess(image, dpi):
+    """Grayscale, binarized, deskewed and cropped version of a rendered page"""
+    ink = binarize(to_gray(image), dpi)
+    angle = estimate_skew(ink)
+    if abs(angle) >= MIN_SKEW:
+        page = Image.fromarray(np.where(ink, INK, PAPER).astype(np.uint8))
+        page = page.rotate(-angle, resample=Image.NEAREST, fillcolor=PAPER)
+        ink = np.asarray(page) == INK
+    ink = crop(ink, dpi)
+    if ink is None:
+        return Image.new("L", (8, 8), PAPER)  # blank page: nothing for tesseract to find
+    return Image.fromarray(np.where(ink, INK, PAPER).astype(np.uint8))
+
+def preprocess_config():
+    return {
+        "version": PREPROCESS_VERSION,
+        "window_inch": round(WINDOW_INCH, 4),
+        "threshold": THRESHOLD,
+        "min_neighbours": MIN_NEIGHBOURS,
+        "max_skew": MAX_SKEW,
+        "min_skew": MIN_SKEW,
+        "margin_inch": MARGIN_INCH
+    }
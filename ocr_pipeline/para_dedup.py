@@ -0,0 +1,252 @@
+"""
+Exact paragraph-level dedup with a streaming, disk-spilling hash counter.
+
+Books share many identical paragraphs that clean() leaves in: licenses,
+prefaces, boilerplate and repeated running text. This stage counts, for
+every normalized paragraph, how many documents contain it and drops the
+ones found in more than --max-docs documents.
+
+Pass 1 (count, parallel): the outputs are split across worker processes.
+Each worker hashes normalized paragraphs to 64 bits, keeps one entry per
+paragraph per document in a flat numpy buffer, and whenever that buffer
+holds SPILL_HASHES entries it collapses it to sorted (hash, count) runs,
+partitioned by the hash's top bits, on disk.
+Merge (parallel): each partition's runs are concatenated and summed on
+their own, so memory is bounded by one partition, not the corpus.
+Pass 2 (filter, parallel): outputs are streamed again on the same
+workers and paragraphs whose hash is in the frequent set are dropped,
+writing cleaned copies to --out.
+
+Markdown outputs are read a paragraph at a time and JSONL ones a line
+at a time, so no pass holds a whole book in memory. Documents inside
+compressed shards (OUTPUT_COMPRESSION) are read the same way and their
+filtered copies go to new shards of the same format and codec.
+
+Usage:
+    python para_dedup.py Processed_dataset --out Processed_dataset_dedup
+"""
+
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import hashlib
+import json
+import re
+import shutil
+import numpy as np
+
+from corpus import output_docs, open_text, iter_chunks, iter_markdown
+from compressed import ShardDoc, ShardSink, shard_codec
+
+MIN_PARA_CHARS = 40  # shorter paragraphs (headings, captions) are never dropped
+MAX_DOCS = 5  # drop paragraphs that appear in more documents than this
+SPILL_HASHES = 1 << 22  # 4M entries (32 MB) buffered per worker before spilling
+PARTITION_BITS = 6  # 64 partitions for the merge
+
+WORD_RE = re.compile(r"\w+")
+PARA_SPLIT = re.compile(r"\n\s*\n")
+
+def normalize(paragraph):
+    return " ".join(WORD_RE.findall(paragraph.lower()))
+
+def para_hash(paragraph):
+    """64-bit hash of a normalized paragraph, or None if it is too short to count"""
+    norm = normalize(paragraph)
+    if len(norm) < MIN_PARA_CHARS:
+        return None
+    return int.from_bytes(hashlib.blake2b(norm.encode("utf-8"), digest_size=8).digest(), "little")
+
+def iter_paragraphs(text):
+    for p in PARA_SPLIT.split(text):
+        if p.strip():
+            yield p
+
+def doc_paragraph_hashes(path):
+    """Distinct paragraph hashes of one output file or shard document"""
+    hashes = set()
+    if path.suffix == ".jsonl":
+        for text in iter_chunks(path):
+            for p in iter_paragraphs(text):
+                h = para_hash(p)
+                if h is not None:
+                    hashes.add(h)
+    else:
+        for p in iter_markdown(path):
+            h = para_hash(p)
+            if h is not None:
+                hashes.add(h)
+    return hashes
+
+# -----------------------
+# Pass 1: count
+# -----------------------
+
+class SpillingCounter:
+    """Append-only uint64 buffer that spills sorted, partitioned (hash, count) runs to disk"""
+
+    def __init__(self, run_dir, prefix):
+        self.run_dir = Path(run_dir)
+        self.prefix = prefix
+        self.buf = np.empty(SPILL_HASHES, dtype=np.uint64)
+        self.n = 0
+        self.runs = 0
+
+    def add(self, hashes):
+        arr = np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+        while len(arr):
+            take = min(len(arr), SPILL_HASHES - self.n)
+            self.buf[self.n:self.n + take] = arr[:take]
+            self.n += take
+            arr = arr[take:]
+            if self.n == SPILL_HASHES:
+                self.spill()
+
+    def spill(self):
+        if not self.n:
+            return
+        hashes, counts = np.unique(self.buf[:self.n], return_counts=True)
+        parts = (hashes >> np.uint64(64 - PARTITION_BITS)).astype(np.int64)
+        # hashes are sorted, so each partition is one contiguous slice
+        bounds = np.searchsorted(parts, np.arange((1 << PARTITION_BITS) + 1))
+        for part in range(1 << PARTITION_BITS):
+            lo, hi = bounds[part], bounds[part + 1]
+            if hi > lo:
+                run = np.stack([hashes[lo:hi], counts[lo:hi].astype(np.uint64)], axis=1)
+                np.save(self.run_dir / f"p{part:03d}_{self.prefix}_{self.runs:04d}.npy", run)
+        self.runs += 1
+        self.n = 0
+
+def count_files(args):
+    """Worker: document-frequency runs for a slice of the output files"""
+    files, run_dir, worker = args
+    counter = SpillingCounter(run_dir, f"w{worker:03d}")
+    for path in files:
+        counter.add(doc_paragraph_hashes(path))
+    counter.spill()
+    return len(files)
+
+def merge_partition(args):
+    """Merge: sum one partition's runs and return hashes over max_docs"""
+    run_dir, part, max_docs = args
+    runs = [np.load(p) for p in sorted(Path(run_dir).glob(f"p{part:03d}_*.npy"))]
+    if not runs:
+        return np.zeros(0, dtype=np.uint64)
+    allruns = np.concatenate(runs)
+    order = np.argsort(allruns[:, 0], kind="stable")
+    hashes = allruns[order, 0]
+    counts = allruns[order, 1]
+    starts = np.flatnonzero(np.r_[True, hashes[1:] != hashes[:-1]])
+    totals = np.add.reduceat(counts, starts)
+    return hashes[starts][totals > max_docs]
+
+# -----------------------
+# Pass 2: filter
+# -----------------------
+
+def filter_text(text, frequent):
+    kept = [p for p in iter_paragraphs(text) if para_hash(p) not in frequent]
+    return "\n\n".join(kept), len(kept)
+
+def filter_doc(path, out, frequent):
+    """Write one output to the text stream out without its frequent paragraphs; returns paragraphs dropped"""
+    dropped = 0
+    if path.suffix == ".jsonl":
+        with open_text(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                row = json.loads(line)
+                before = sum(1 for _ in iter_paragraphs(row["text"]))
+                row["text"], n = filter_text(row["text"], frequent)
+                if n < before:
+                    dropped += before - n
+                    row.pop("n_tokens", None)  # stale once text is removed
+                if row["text"]:
+                    out.write(json.dumps(row) + "\n")
+    else:
+        with open_text(path) as f:
+            # The title/source header goes through as is, up to its --- rule
+            for line in f:
+                out.write(line)
+                if line.strip() == "---":
+                    out.write("\n")
+                    break
+        first = True
+        for p in iter_markdown(path):
+            if para_hash(p) in frequent:
+                dropped += 1
+                continue
+            out.write(p if first else "\n\n" + p)
+            first = False
+    return dropped
+
+def shard_key(doc, in_dir, out_dir):
+    """(out dir, prefix, suffix, codec) of the shards a shard document's filtered copy goes to"""
+    # <prefix>_<run>_NNNN<suffix><codec suffix>; run ids hold no underscore
+    prefix = doc.shard.name.rsplit("_", 2)[0]
+    return out_dir / doc.shard.parent.relative_to(in_dir), prefix, doc.suffix, shard_codec(doc.shard)
+
+def filter_files(args):
+    """Worker: filter a slice of the outputs; returns paragraphs dropped"""
+    files, in_dir, out_dir, frequent_path, sinks, worker = args
+    frequent = set(int(h) for h in np.load(frequent_path))
+    sinks = {key: sink.for_worker(worker) for key, sink in sinks.items()}
+    dropped = 0
+    for path in files:
+        if isinstance(path, ShardDoc):
+            sink = sinks[shard_key(path, in_dir, out_dir)]
+            dropped += filter_doc(path, sink.begin(path.doc_id), frequent)
+            sink.end()
+            continue
+        out_path = out_dir / path.relative_to(in_dir)
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(out_path, "w", encoding="utf-8") as out:
+            dropped += filter_doc(path, out, frequent)
+    for sink in sinks.values():
+        sink.close()
+    return dropped
+
+# -----------------------
+# Run
+# -----------------------
+
+def para_dedup(in_dir, out_dir, work_dir, workers=4, max_docs=MAX_DOCS):
+    in_dir, out_dir, work_dir = Path(in_dir), Path(out_dir), Path(work_dir)
+    files = output_docs(in_dir)
+    run_dir = work_dir / "runs"
+    if run_dir.exists():
+        shutil.rmtree(run_dir)
+    run_dir.mkdir(parents=True)
+    print(f"🔢 Counting paragraphs in {len(files)} documents with {workers} workers...")
+
+    frequent_path = work_dir / "frequent_paragraphs.npy"
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        slices = [(files[w::workers], run_dir, w) for w in range(workers)]
+        list(pool.map(count_files, slices))
+        parts = pool.map(merge_partition, [(run_dir, p, max_docs) for p in range(1 << PARTITION_BITS)])
+        frequent = np.sort(np.concatenate(list(parts)))
+        np.save(frequent_path, frequent)
+        shutil.rmtree(run_dir)
+        print(f"   {len(frequent):,} paragraphs appear in more than {max_docs} documents")
+
+        # One shard series per source format and codec, each worker writing its own
+        sinks = {}
+        for key in {shard_key(d, in_dir, out_dir) for d in files if isinstance(d, ShardDoc)}:
+            key[0].mkdir(parents=True, exist_ok=True)
+            sinks[key] = ShardSink(*key)
+
+        # Each worker loads the frequent set once for its slice of the files
+        slices = [(files[w::workers], in_dir, out_dir, frequent_path, sinks, w) for w in range(workers)]
+        dropped = sum(pool.map(filter_files, slices))
+    print(f"✅ Dropped {dropped:,} repeated paragraphs → {out_dir}/")
+    return dropped
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Drop paragraphs repeated across many documents")
+    parser.add_argument("in_dir", help="directory holding book_*.jsonl / book_*.md outputs")
+    parser.add_argument("--out", required=True, help="where to write the filtered copies")
+    parser.add_argument("--work", default="para_dedup_work", help="scratch dir for spilled runs")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--max-docs", type=int, default=MAX_DOCS)
+    args = parser.parse_args()
+    para_dedup(args.in_dir, args.out, args.work, args.workers, args.max_docs)
@@ -0,0 +1,39 @@
+"""
+Produce every output format from a single extraction pass.
+
+Each book is extracted/OCR'd once by the engine and written as JSONL
+chunks, markdown and math-aware markdown in the same run, plus Parquet
+chunk shards when pyarrow is installed.
+
+Math-aware markdown converts each book's pages on MATH_MD_WORKERS
+processes (see math_md.py), so fewer books run at once than in the
+plain pipelines, as in pipeline_md_latex.py.
+"""
+
+from pathlib import Path
+
+from engine import run
+from writers import JsonlChunkWriter, MarkdownWriter, MathMarkdownWriter
+from columnar import ParquetChunkWriter, PARQUET_SUPPORT
+from scheduler import WORKERS
+from math_md import MATH_MD_WORKERS
+
+DATA_DIR = Path("../Data/Day2")
+OUT_DIR = Path("processed_dataset_all/Day2")
+
+# -----------------------
+# Run
+# -----------------------
+
+if __name__ == "__main__":
+    writers = [
+        JsonlChunkWriter(OUT_DIR / "jsonl"),
+        MarkdownWriter(OUT_DIR / "md"),
+        MathMarkdownWriter(OUT_DIR / "latex_md"),
+    ]
+    if PARQUET_SUPPORT:
+        writers.append(ParquetChunkWriter(OUT_DIR / "parquet"))
+    workers = WORKERS
+    if any(isinstance(w, MathMarkdownWriter) for w in writers):
+        workers = max(1, WORKERS // MATH_MD_WORKERS)
+    run(DATA_DIR, OUT_DIR, writers, workers=workers)
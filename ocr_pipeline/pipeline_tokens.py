@@ -0,0 +1,30 @@
+"""
+JSONL chunks plus memory-mapped token shards for training, in one pass.
+
+Shards need a tokenizer with integer ids (see chunker.get_tokenizer);
+set SHARD_TOKENIZER, e.g. SHARD_TOKENIZER=hf:tokenizer.json.
+"""
+
+from pathlib import Path
+import os
+
+from engine import run
+from writers import JsonlChunkWriter
+from token_shards import TokenShardWriter
+
+DATA_DIR = Path("../Data/Day1/Books")
+OUT_DIR = Path("Processed_dataset")
+
+SHARD_TOKENIZER = os.getenv("SHARD_TOKENIZER", "tiktoken:cl100k_base")
+SEQ_TOKENS = int(os.getenv("SEQ_TOKENS", "2048"))
+
+# -----------------------
+# Run
+# -----------------------
+
+if __name__ == "__main__":
+    writers = [
+        JsonlChunkWriter(OUT_DIR),
+        TokenShardWriter(OUT_DIR / "token_shards", SHARD_TOKENIZER, SEQ_TOKENS),
+    ]
+    run(DATA_DIR, OUT_DIR, writers)
@@ -0,0 +1,196 @@
+"""
+Per-page text quality scoring and filtering.
+
+MIN_CHARS only rejects whole books that are too short. Garbage pages
+inside an accepted book (OCR symbol soup, fonts without a Unicode map
+that extract as private-use characters, pages in another script) were
+written out and tokenized like everything else.
+
+filter_pages() is a page-stream stage that runs right after cleaning,
+before any writer chunks a page. Each page's text is turned into a numpy
+array of code points and classified in one vectorized pass (ASCII lookup
+table, then sorted Unicode ranges) into a character-class histogram:
+
+    space, latin letter, other-script letter, digit, punctuation,
+    symbol, bad (control, U+FFFD, private use)
+
+Word lengths come from the gaps between whitespace positions. A page
+fails when a metric is outside its threshold:
+
+    alpha        letters + digits / non-space      < MIN_ALPHA
+    symbol       symbols + bad / non-space         > MAX_SYMBOL
+    latin        Latin letters / letters           < MIN_LATIN
+    word_length  mean word length                  outside MIN_WORD..MAX_WORD
+    short_words  share of one-character words      > MAX_SHORT_WORDS
+
+Digits count toward alpha: a page of results tables is mostly numbers
+(letters alone are ~40% of it) and is real text; digit-heavy OCR soup
+still fails on symbols and word length.
+
+Pages with fewer than MIN_JUDGED non-space characters (title pages, a
+lone heading) are never judged. QUALITY_ACTION decides what happens to
+a failing page: "drop" (default) removes it from the stream, "flag"
+keeps it with Page.quality["ok"] False, "off" skips the stage. Every
+judged page's scores end up in <name>.quality.json next to the outputs.
+"""
+
+from pathlib import Path
+import json
+import os
+import numpy as np
+
+QUALITY_VERSION = 2  # bump when a metric changes meaning
+QUALITY_ACTION = os.getenv("QUALITY_ACTION", "drop")  # drop | flag | off
+MIN_ALPHA = float(os.getenv("QUALITY_MIN_ALPHA", "0.5"))
+MAX_SYMBOL = float(os.getenv("QUALITY_MAX_SYMBOL", "0.3"))  # math-heavy pages sit around 0.1-0.2
+MIN_LATIN = float(os.getenv("QUALITY_MIN_LATIN", "0.5"))  # 0 keeps every script
+MIN_WORD, MAX_WORD = 2.0, 15.0
+MAX_SHORT_WORDS = 0.5
+MIN_JUDGED = 200
+
+SPACE, LATIN, LETTER, DIGIT, PUNCT, SYMBOL, BAD = range(7)
+N_CLASSES = 7
+
+def ascii_classes():
+    table = np.full(128, SYMBOL, dtype=np.uint8)
+    table[:32] = BAD
+    table[127] = BAD
+    for c in "\t\n\r ":
+        table[ord(c)] = SPACE
+    for lo, hi in (("a", "z"), ("A", "Z")):
+        table[ord(lo):ord(hi) + 1] = LATIN
+    table[ord("0"):ord("9") + 1] = DIGIT
+    for c in ".,;:!?'\"()-":
+        table[ord(c)] = PUNCT
+    return table
+
+ASCII = ascii_classes()
+
+# Non-ASCII: (first, last, class), sorted and non-overlapping; anything else is SYMBOL
+RANGES = [
+    (0x80, 0x9F, BAD),
+    (0xA0, 0xA0, SPACE),
+    (0xA1, 0xA1, PUNCT),
+    (0xAB, 0xAB, PUNCT),
+    (0xBB, 0xBB, PUNCT),
+    (0xBF, 0xBF, PUNCT),
+    (0xC0, 0xD6, LATIN),
+    (0xD8, 0xF6, LATIN),  # skips × (0xD7)
+    (0xF8, 0x24F, LATIN),  # skips ÷ (0xF7)
+    (0x370, 0x3FF, LETTER),  # Greek
+    (0x400, 0x52F, LETTER),  # Cyrillic
+    (0x530, 0x6FF, LETTER),  # Armenian, Hebrew, Arabic
+    (0x900, 0xDFF, LETTER),  # Indic scripts
+    (0x1E00, 0x1EFF, LATIN),
+    (0x2000, 0x200B, SPACE),
+    (0x2010, 0x2027, PUNCT),  # dashes, quotes, bullets, ellipsis
+    (0x3040, 0x30FF, LETTER),  # Kana
+    (0x4E00, 0x9FFF, LETTER),  # CJK
+    (0xAC00, 0xD7AF, LETTER),  # Hangul
+    (0xE000, 0xF8FF, BAD),  # private use: glyphs without a Unicode mapping
+    (0xFB00, 0xFB06, LATIN),  # ligatures
+    (0xFFFD, 0xFFFD, BAD),
+]
+RANGE_FIRST = np.array([r[0] for r in RANGES], dtype=np.uint32)
+RANGE_LAST = np.array([r[1] for r in RANGES], dtype=np.uint32)
+RANGE_CLASS = np.array([r[2] for r in RANGES], dtype=np.uint8)
+
+def char_classes(text):
+    """Class of every character of text, as a uint8 array"""
+    cp = np.frombuffer(text.encode("utf-32-le"), dtype="<u4")
+    classes = np.full(len(cp), SYMBOL, dtype=np.uint8)
+    ascii = cp < 128
+    classes[ascii] = ASCII[cp[ascii]]
+    rest = np.flatnonzero(~ascii)
+    if len(rest):
+        i = np.searchsorted(RANGE_FIRST, cp[rest], side="right") - 1
+        inside = (i >= 0) & (cp[rest] <= RANGE_LAST[np.maximum(i, 0)])
+        classes[rest[inside]] = RANGE_CLASS[i[inside]]
+    return classes
+
+def score_text(text):
+    """Quality metrics of one page of text (None if too short to judge)"""
+    classes = char_classes(text)
+    hist = np.bincount(classes, minlength=N_CLASSES)
+    chars = len(classes) - hist[SPACE]
+    if chars < MIN_JUDGED:
+        return None
+
+    # Words are the runs between whitespace
+    gaps = np.flatnonzero(np.concatenate(([True], classes == SPACE, [True])))
+    lengths = np.diff(gaps) - 1
+    lengths = lengths[lengths > 0]
+
+    letters = hist[LATIN] + hist[LETTER]
+    return {
+        "chars": int(chars),
+        "score": round(float((letters + hist[DIGIT] + hist[PUNCT]) / chars), 3),
+        "alpha": round(float((letters + hist[DIGIT]) / chars), 3),
+        "symbol": round(float((hist[SYMBOL] + hist[BAD]) / chars), 3),
+        "bad": round(float(hist[BAD] / chars), 3),
+        "latin": round(float(hist[LATIN] / letters), 3) if letters else 0.0,
+        "mean_word": round(float(lengths.mean()), 2) if len(lengths) else 0.0,
+        "short_words": round(float(np.mean(lengths == 1)), 3) if len(lengths) else 0.0,
+    }
+
+def failed_checks(s):
+    reasons = []
+    if s["alpha"] < MIN_ALPHA:
+        reasons.append("alpha")
+    if s["symbol"] > MAX_SYMBOL:
+        reasons.append("symbol")
+    if s["latin"] < MIN_LATIN:
+        reasons.append("latin")
+    if not MIN_WORD <= s["mean_word"] <= MAX_WORD:
+        reasons.append("word_length")
+    if s["short_words"] > MAX_SHORT_WORDS:
+        reasons.append("short_words")
+    return reasons
+
+def filter_pages(pages, stats, action=QUALITY_ACTION):
+    """Yield pages that pass the quality checks (all of them, flagged, with action="flag")
+
+    The scores of every judged page are appended to stats.
+    """
+    for page in pages:
+        if action == "off":
+            yield page
+            continue
+        s = score_text(page.text)
+        if s is None:
+            yield page
+            continue
+        reasons = failed_checks(s)
+        s.update({"page": page.number, "ok": not reasons, "reasons": reasons})
+        stats.append(s)
+        page.quality = s
+        if reasons and action == "drop":
+            continue
+        yield page
+
+def write_quality_sidecar(out, source, page_stats, action=QUALITY_ACTION):
+    """Write per-page quality scores next to an output file as <stem>.quality.json"""
+    sidecar = Path(out).with_suffix(".quality.json")
+    failed = [p["page"] for p in page_stats if not p["ok"]]
+    with sidecar.open("w", encoding="utf-8") as f:
+        json.dump({
+            "source": Path(source).name,
+            "action": action,
+            "config": quality_config(),
+            "pages_failed": failed,
+            "pages": page_stats
+        }, f)
+    return sidecar
+
+def quality_config():
+    """Quality settings that affect output, for the manifest key"""
+    return {
+        "version": QUALITY_VERSION,
+        "action": QUALITY_ACTION,
+        "min_alpha": MIN_ALPHA,
+        "max_symbol": MAX_SYMBOL,
+        "min_latin": MIN_LATIN,
+        "word_length": [MIN_WORD, MAX_WORD],
+        "max_short_words": MAX_SHORT_WORDS,
+        "min_judged": MIN_JUDGED
+    }
@@ -0,0 +1,80 @@
+"""
+Running header/footer stripping.
+
+Book titles, chapter titles and "Page 12 of 300" lines repeat on the top
+or bottom of almost every page. clean() only removes bare page numbers,
+so the rest ends up in every chunk and inflates token counts.
+
+strip_running_lines() is a page-stream stage: it hashes the first and
+last EDGE_LINES non-blank lines of each page (lower-cased, digits folded
+to '#', so changing page numbers still match) and drops any edge line
+whose hash occurs on at least MIN_FRACTION of the pages in a sliding
+window of WINDOW pages around it. Windowing catches chapter titles that
+only repeat within their chapter and keeps the stage O(pages) in time
+and O(WINDOW) in memory.
+"""
+
+from collections import Counter, deque
+import re
+
+EDGE_LINES = 2  # lines checked at the top and at the bottom of each page
+WINDOW = 24  # pages around the current one that vote
+MIN_FRACTION = 0.4  # low enough for headers that alternate between odd and even pages
+MIN_REPEATS = 3  # never strip a line seen on fewer pages than this
+
+DIGITS = re.compile(r"\d+")
+SPACES = re.compile(r"\s+")
+
+def line_key(line):
+    return hash(SPACES.sub(" ", DIGITS.sub("#", line.lower())).strip())
+
+def edge_indices(lines):
+    """Indices of the first and last EDGE_LINES non-blank lines (none on pages too short to have a body)"""
+    filled = [i for i, l in enumerate(lines) if l.strip()]
+    if len(filled) <= 2 * EDGE_LINES:
+        return set()
+    return set(filled[:EDGE_LINES] + filled[-EDGE_LINES:])
+
+def edge_keys(text):
+    lines = text.split("\n")
+    return {line_key(lines[i]) for i in edge_indices(lines)}
+
+def strip_page(page, counts, window_len):
+    threshold = max(MIN_REPEATS, MIN_FRACTION * window_len)
+    lines = page.text.split("\n")
+    drop = {i for i in edge_indices(lines) if counts[line_key(lines[i])] >= threshold}
+    if drop:
+        page.text = "\n".join(l for i, l in enumerate(lines) if i not in drop).strip()
+    page.stripped_lines = len(drop)
+    return page
+
+def strip_running_lines(pages):
+    """Yield pages with running headers/footers removed, looking WINDOW // 2 pages ahead"""
+    half = WINDOW // 2
+    window = deque()  # (page, edge keys), at most WINDOW + 1 pages
+    counts = Counter()
+    pos = 0  # position in window of the next page to yield
+
+    for page in pages:
+        keys = edge_keys(page.text)
+        window.append((page, keys))
+        counts.update(keys)
+        if len(window) - 1 - pos >= half:
+            yield strip_page(window[pos][0], counts, len(window))
+            pos += 1
+            if pos > half:
+                _, old = window.popleft()
+                counts.subtract(old)
+                pos -= 1
+
+    while pos < len(window):
+        yield strip_page(window[pos][0], counts, len(window))
+        pos += 1
+
+def running_lines_config():
+    return {
+        "edge_lines": EDGE_LINES,
+        "window": WINDOW,
+        "min_fraction": MIN_FRACTION,
+        "min_repeats": MIN_REPEATS
+    }
@@ -0,0 +1,357 @@
+"""
+Cost-aware scheduling of pipeline jobs across worker processes.
+
+A cheap pre-pass estimates what each file will cost before any of them
+is processed: PDFs are opened with PyMuPDF for their page count and a
+few sampled pages tell whether a text layer exists (OCR costs two orders
+of magnitude more per page than text extraction); EPUB/DOCX cost scales
+with file size.
+
+Jobs then run longest-first (LPT) on two lanes of worker processes:
+OCR workers take OCR jobs first and help with text jobs once no OCR is
+left, text workers only take text jobs, so a 900-page scan can never
+hold up the cheap files behind it. Progress is tracked in estimated
+seconds rather than files, which keeps the ETA honest when a few huge
+scans dominate the batch.
+
+Every file runs under a wall-clock limit (scaled from its estimate) and
+an RSS cap on the worker plus its tesseract/poppler children. A worker
+that breaches either, or dies, is killed and replaced, and the file is
+retried in the next mode of RETRY_MODES: one REDUCED_DPI OCR pass, then
+text layer only. Text PDFs converted to markdown (pymupdf4llm, much
+slower than the text layer) are retried without the conversion. Files
+that fail in every mode are quarantined.
+
+Besides batch runs, the pool can be kept running and fed as files
+arrive (start/submit/step, used by watch.py).
+"""
+
+import multiprocessing as mp
+import os
+import queue
+import signal
+import time
+import fitz  # PyMuPDF
+from tqdm import tqdm
+
+# Install: pip install psutil
+try:
+    import psutil
+    RSS_SUPPORT = True
+except ImportError:
+    RSS_SUPPORT = False
+
+# Rough single-core seconds; only their ratios matter for ordering
+TEXT_SEC_PER_PAGE = 0.01
+OCR_SEC_PER_PAGE = 2.0
+MD_SEC_PER_PAGE = 0.3  # pymupdf4llm markdown, on top of the text layer
+SEC_PER_MB = 0.5  # EPUB / DOCX
+SAMPLE_PAGES = 5  # pages probed for a text layer
+MIN_SAMPLE_CHARS = 100  # average chars per sampled page below which a PDF counts as scanned
+
+WORKERS = int(os.getenv("PIPELINE_WORKERS", str(os.cpu_count() or 2)))
+TEXT_WORKERS = int(os.getenv("PIPELINE_TEXT_WORKERS", str(max(1, WORKERS // 4))))
+
+SUPPORTED = (".pdf", ".epub", ".docx")
+
+# Limits per file; 0 disables
+MAX_FILE_SECONDS = float(os.getenv("PIPELINE_FILE_TIMEOUT", "3600"))
+MIN_FILE_SECONDS = 120.0  # no file is killed sooner than this
+TIMEOUT_FACTOR = 10.0  # x estimated cost
+MAX_RSS_MB = int(os.getenv("PIPELINE_MAX_RSS_MB", "4096"))
+POLL_SECONDS = 1.0
+FLUSH = "flush"  # inbox message: close batching writers, keep running
+
+# Degraded modes a file is retried in after breaching a limit, in order
+RETRY_MODES = {"ocr": ["full", "reduced", "text"], "text": ["full", "text"]}
+
+# -----------------------
+# Cost estimation
+# -----------------------
+
+class Job:
+    def __init__(self, file, digest, kind, pages, size, cost, markdown=False):
+        self.file = file
+        self.digest = digest
+        self.kind = kind  # "ocr" or "text"
+        self.pages = pages
+        self.size = size
+        self.cost = cost  # estimated seconds
+        self.markdown = markdown  # a text PDF that "full" mode also converts to markdown
+        self.mode = "full"  # extraction mode, see RETRY_MODES
+        self.errors = []  # one per failed attempt
+        self.outputs = []
+
+    def key(self):
+        return (self.digest, self.mode)
+
+    def timeout(self):
+        if not MAX_FILE_SECONDS:
+            return None
+        return min(MAX_FILE_SECONDS, max(MIN_FILE_SECONDS, TIMEOUT_FACTOR * self.cost))
+
+    def next_mode(self):
+        """The mode to retry in after a breached limit, or None if none is left"""
+        modes = RETRY_MODES[self.kind]
+        if self.kind == "text" and not self.markdown:
+            modes = modes[:1]  # "text" mode would repeat the same extraction
+        i = modes.index(self.mode) + 1
+        return modes[i] if i < len(modes) else None
+
+def estimate(file, digest, markdown=False):
+    """Cheap cost estimate for one supported input file
+
+    markdown=True when the run also converts text PDFs to markdown.
+    """
+    size = file.stat().st_size
+    if file.suffix.lower() != ".pdf":
+        return Job(file, digest, "text", 0, size, max(0.05, SEC_PER_MB * size / 1e6))
+
+    try:
+        with fitz.open(file) as doc:
+            pages = doc.page_count
+            step = max(1, pages // SAMPLE_PAGES)
+            sample = range(0, pages, step)[:SAMPLE_PAGES]
+            chars = sum(len(doc[i].get_text().strip()) for i in sample)
+            scanned = not sample or chars / len(sample) < MIN_SAMPLE_CHARS
+    except Exception:
+        # Unreadable here means it will likely end up in OCR (or fail) later
+        return Job(file, digest, "ocr", 0, size, OCR_SEC_PER_PAGE)
+
+    if scanned:
+        return Job(file, digest, "ocr", pages, size, max(OCR_SEC_PER_PAGE, pages * OCR_SEC_PER_PAGE))
+    if markdown:
+        return Job(file, digest, "text", pages, size, max(0.05, pages * (TEXT_SEC_PER_PAGE + MD_SEC_PER_PAGE)), markdown=True)
+    return Job(file, digest, "text", pages, size, max(0.05, pages * TEXT_SEC_PER_PAGE))
+
+# -----------------------
+# Worker processes
+# -----------------------
+
+def worker_main(worker_id, inbox, results, target, writers, out_dir):
+    """Worker loop: run target(file, digest, writers, out_dir, mode, report) for each job sent to this worker"""
+    # tesseract would otherwise start a thread per core in every worker
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+    # Ctrl-C reaches the whole process group; the parent decides how workers stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    writers = [w.for_worker(worker_id) for w in writers]
+    while True:
+        job = inbox.get()
+        if job is None:
+            break
+        if job == FLUSH:
+            # Idle in a long-running pool: finalise batched outputs (Parquet shards) now
+            for w in writers:
+                w.close()
+            continue
+        report = {}
+        try:
+            outputs = target(job.file, job.digest, writers, out_dir, job.mode, report)
+            results.put(("done", worker_id, job.key(), [str(o) for o in outputs], None, report))
+        except Exception as e:
+            results.put(("failed", worker_id, job.key(), [], f"{type(e).__name__}: {e}", report))
+    for w in writers:
+        w.close()
+
+def tree_rss_mb(pid):
+    """Resident memory of a process and all its children, in MB"""
+    try:
+        proc = psutil.Process(pid)
+        procs = [proc] + proc.children(recursive=True)
+    except psutil.Error:
+        return 0.0
+    rss = 0
+    for p in procs:
+        try:
+            rss += p.memory_info().rss
+        except psutil.Error:
+            pass  # exited in between
+    return rss / 1e6
+
+def outputs_exist(outputs):
+    return all(os.path.exists(o) for o in outputs)
+
+def kill_tree(proc):
+    """Kill a worker together with the tesseract/poppler processes it started"""
+    if RSS_SUPPORT:
+        try:
+            for child in psutil.Process(proc.pid).children(recursive=True):
+                child.kill()
+        except psutil.Error:
+            pass
+    proc.kill()
+    proc.join(timeout=10)
+
+class WorkerPool:
+    """Dispatches jobs longest-first to an OCR lane and a text lane of worker processes
+
+    run() processes one batch. A long-running caller (watch.py) uses
+    start(), then submit() and step() as work arrives, and shutdown().
+    """
+
+    def __init__(self, target, writers, out_dir, workers=WORKERS, text_workers=TEXT_WORKERS):
+        self.target = target
+        self.writers = writers
+        self.out_dir = out_dir
+        workers = max(1, workers)
+        # At least one OCR lane; it takes text jobs too once no OCR is left
+        text_workers = min(text_workers, workers - 1)
+        self.lanes = ["text"] * text_workers + ["ocr"] * (workers - text_workers)
+        self.ctx = mp.get_context()
+        self.results = self.ctx.Queue()
+        self.procs = {}
+        self.inboxes = {}
+        self.pending = {"ocr": [], "text": []}  # each longest first
+        self.busy = {}  # worker_id -> (job, started)
+        self.unflushed = {w: [] for w in range(len(self.lanes))}  # finished jobs whose outputs are not on disk yet
+        self.n_jobs = 0
+        self.finished = 0
+        self.last_check = time.time()
+        self.bar = None
+        self.on_done = None
+
+    def _start(self, worker_id):
+        inbox = self.ctx.Queue()
+        proc = self.ctx.Process(
+            target=worker_main,
+            args=(worker_id, inbox, self.results, self.target, self.writers, self.out_dir)
+        )  # not daemonic: extractors may start page-parallel pools of their own (math_md.py)
+        proc.start()
+        self.procs[worker_id] = proc
+        self.inboxes[worker_id] = inbox
+
+    def _next_job(self, lane):
+        if self.pending[lane]:
+            return self.pending[lane].pop(0)
+        if lane == "ocr" and self.pending["text"]:
+            return self.pending["text"].pop(0)
+        return None
+
+    def _breach(self, worker_id, job, started):
+        """Why a busy worker must be stopped (limit breached or died), or None"""
+        proc = self.procs[worker_id]
+        if not proc.is_alive():
+            return f"worker died (exit code {proc.exitcode})"
+        elapsed = time.time() - started
+        if job.timeout() and elapsed > job.timeout():
+            return f"timed out after {elapsed:.0f}s"
+        if RSS_SUPPORT and MAX_RSS_MB:
+            rss = tree_rss_mb(proc.pid)
+            if rss > MAX_RSS_MB:
+                return f"RSS {rss:.0f} MB over the {MAX_RSS_MB} MB cap"
+        return None
+
+    def start(self, on_done):
+        """Start the workers; on_done(job, status, outputs, error, seconds, report) is called in this process as each job finishes
+
+        status is "done", "failed" (an exception, retried next run) or
+        "quarantined" (limits breached in every retry mode); report is the
+        dict the target filled in (empty if the worker was killed).
+        """
+        self.on_done = on_done
+        for worker_id in range(len(self.lanes)):
+            self._start(worker_id)
+        self.bar = tqdm(total=0, unit="est-s", smoothing=0.05, bar_format="{l_bar}{bar}| {n:.0f}/{total:.0f} est-s [{elapsed}<{remaining}{postfix}]")
+
+    def submit(self, jobs):
+        """Queue more jobs, keeping each lane longest-first"""
+        for job in jobs:
+            lane = self.pending[job.kind]
+            i = next((i for i, j in enumerate(lane) if j.cost < job.cost), len(lane))
+            lane.insert(i, job)
+            self.n_jobs += 1
+            self.bar.total += job.cost
+        self.bar.refresh()
+
+    @property
+    def idle(self):
+        return not (self.pending["ocr"] or self.pending["text"] or self.busy)
+
+    def _finish(self, worker_id, status, outputs, error, report):
+        job, started = self.busy.pop(worker_id)
+        self.finished += 1
+        self.bar.update(job.cost)
+        self.bar.set_postfix(files=f"{self.finished}/{self.n_jobs}")
+        # Batching writers (Parquet) only create their file when a shard closes
+        self.unflushed[worker_id] = [j for j in self.unflushed[worker_id] if not outputs_exist(j.outputs)]
+        if status == "done" and not outputs_exist(outputs):
+            job.outputs = outputs
+            self.unflushed[worker_id].append(job)
+        self.on_done(job, status, outputs, error, time.time() - started, report)
+
+    def _requeue_unflushed(self, worker_id):
+        """Jobs a killed worker finished but never flushed are lost with it: run them again"""
+        for job in self.unflushed[worker_id]:
+            if not outputs_exist(job.outputs):
+                self.pending[job.kind].insert(0, job)
+                self.n_jobs += 1
+                self.bar.total += job.cost
+        self.unflushed[worker_id] = []
+
+    def _check_limits(self):
+        for worker_id, (job, started) in list(self.busy.items()):
+            reason = self._breach(worker_id, job, started)
+            if reason is None:
+                continue
+            kill_tree(self.procs[worker_id])
+            self._start(worker_id)
+            self._requeue_unflushed(worker_id)
+            job.errors.append(f"{job.mode}: {reason}")
+            mode = job.next_mode()
+            if mode is None:
+                self._finish(worker_id, "quarantined", [], "; ".join(job.errors), {})
+                continue
+            # Retry first, in the degraded mode, on whichever worker frees up
+            print(f"⏱️  {job.file.name}: {reason}, retrying in {mode!r} mode")
+            self.busy.pop(worker_id)
+            job.mode = mode
+            self.pending[job.kind].insert(0, job)
+
+    def step(self, timeout=POLL_SECONDS):
+        """Dispatch to free workers and handle at most one result (waiting up to timeout)"""
+        for worker_id, lane in enumerate(self.lanes):
+            if worker_id not in self.busy:
+                job = self._next_job(lane)
+                if job is not None:
+                    self.inboxes[worker_id].put(job)
+                    self.busy[worker_id] = (job, time.time())
+
+        try:
+            status, worker_id, key, outputs, error, report = self.results.get(timeout=timeout)
+            # Not the current job if the worker was killed just as it finished
+            if worker_id in self.busy and self.busy[worker_id][0].key() == key:
+                self._finish(worker_id, status, outputs, error, report)
+        except queue.Empty:
+            pass
+        if time.time() - self.last_check >= POLL_SECONDS:
+            self._check_limits()
+            self.last_check = time.time()
+
+    def flush(self):
+        """Ask every worker to finalise batched outputs (call when idle)"""
+        for inbox in self.inboxes.values():
+            inbox.put(FLUSH)
+
+    def run(self, jobs, on_done):
+        """Run all jobs to completion (see start() for on_done)"""
+        total = sum(j.cost for j in jobs)
+        n_ocr = sum(1 for j in jobs if j.kind == "ocr")
+        print(f"🗓️  {len(jobs)} jobs ({n_ocr} OCR, {len(jobs) - n_ocr} text), "
+              f"~{total / 60:.1f} CPU-min estimated, {len(self.lanes)} workers")
+        self.start(on_done)
+        try:
+            self.submit(jobs)
+            while not self.idle:
+                self.step()
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        if self.bar is not None:
+            self.bar.close()
+        for inbox in self.inboxes.values():
+            inbox.put(None)
+        for proc in self.procs.values():
+            proc.join(timeout=30)
+            if proc.is_alive():
+                kill_tree(proc)
@@ -0,0 +1,132 @@
+"""
+Per-file stage timings and the run report.
+
+Every processed file gets a record with its size, page counts, whether
+it was OCR'd and the seconds spent in each of STAGES:
+
+    open      opening/parsing the file and probing for a text layer
+    extract   reading the text layer, EPUB items or DOCX body
+    ocr       rendering and OCR'ing scanned pages
+    markdown  math-aware markdown conversion (math_md.py), when a writer wants it
+    clean     clean(), running header/footer stripping and quality scoring
+    chunk     token chunking inside the writers
+    write     the writers' own work (formatting, file I/O)
+
+Pages stream through the stages, so time is measured around each next()
+of the page iterators (timed_iter) rather than per stage in sequence.
+
+RunReport appends the records to <out_dir>/reports/run_<time>.jsonl as
+files finish and writes run_<time>.summary.json at the end: the slowest
+files, total OCR pages and throughput.
+"""
+
+from contextlib import contextmanager
+from pathlib import Path
+import json
+import time
+
+STAGES = ("open", "extract", "ocr", "markdown", "clean", "chunk", "write")
+SLOWEST = 10  # files listed in the summary
+
+class Timings:
+    def __init__(self):
+        # "pages" is everything spent producing cleaned pages, clean is derived from it;
+        # "probe" is opening done before the pages start to stream
+        self.seconds = dict.fromkeys(STAGES + ("pages", "probe"), 0.0)
+
+    def add(self, stage, seconds):
+        self.seconds[stage] += seconds
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def result(self):
+        """Exclusive seconds per stage"""
+        s = dict(self.seconds)
+        # Cleaning pulls pages through extraction, and writers chunk as they write
+        s["clean"] = max(0.0, s.pop("pages") - s["open"] - s["extract"] - s["ocr"] - s["markdown"])
+        s["open"] += s.pop("probe")
+        s["write"] = max(0.0, s["write"] - s["chunk"])
+        return {k: round(v, 4) for k, v in s.items()}
+
+def timed_iter(iterable, timings, stage, first_stage=None):
+    """Yield from iterable, adding the time spent in each next() to stage (the first one to first_stage)"""
+    it = iter(iterable)
+    target = first_stage or stage
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(it)
+        except StopIteration:
+            timings.add(target, time.perf_counter() - start)
+            return
+        timings.add(target, time.perf_counter() - start)
+        target = stage
+        yield item
+
+class RunReport:
+    def __init__(self, out_dir):
+        self.run_id = time.strftime("%Y%m%d-%H%M%S")
+        self.dir = Path(out_dir) / "reports"
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.path = self.dir / f"run_{self.run_id}.jsonl"
+        self.records = []
+        self.started = time.time()
+
+    def add(self, record):
+        self.records.append(record)
+        with self.path.open("a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def summary(self):
+        wall = time.time() - self.started
+        done = [r for r in self.records if r.get("status") == "done"]
+        pages = sum(r.get("pages", 0) for r in done)
+        size = sum(r.get("size_bytes", 0) for r in done)
+        stages = {s: round(sum(r.get("stages", {}).get(s, 0.0) for r in self.records), 2) for s in STAGES}
+        slowest = sorted(self.records, key=lambda r: r.get("seconds", 0.0), reverse=True)[:SLOWEST]
+        return {
+            "run_id": self.run_id,
+            "wall_seconds": round(wall, 1),
+            "files": len(self.records),
+            "files_done": len(done),
+            "pages": pages,
+            "ocr_pages": sum(r.get("ocr_pages", 0) for r in done),
+            "pages_failed_quality": sum(r.get("pages_failed_quality", 0) for r in done),
+            "input_mb": round(size / 1e6, 2),
+            "pages_per_sec": round(pages / wall, 2) if wall else None,
+            "mb_per_sec": round(size / 1e6 / wall, 3) if wall else None,
+            "stage_seconds": stages,
+            "slowest": [
+                {
+                    "file": r["file"],
+                    "seconds": r.get("seconds"),
+                    "pages": r.get("pages"),
+                    "ocr_pages": r.get("ocr_pages"),
+                    "slowest_stage": max(r["stages"], key=r["stages"].get) if r.get("stages") else None,
+                }
+                for r in slowest
+            ]
+        }
+
+    def finish(self):
+        """Write and print the end-of-run summary"""
+        summary = self.summary()
+        path = self.dir / f"run_{self.run_id}.summary.json"
+        path.write_text(json.dumps(summary, indent=2), encoding="utf-8")
+
+        print(f"\n📈 {summary['pages']:,} pages ({summary['ocr_pages']:,} OCR) in {summary['wall_seconds']:.0f}s: "
+              f"{summary['pages_per_sec']} pages/s, {summary['mb_per_sec']} MB/s")
+        busiest = sorted(summary["stage_seconds"].items(), key=lambda kv: kv[1], reverse=True)
+        print("   CPU-seconds by stage: " + ", ".join(f"{s} {v:.1f}" for s, v in busiest))
+        if summary["slowest"]:
+            print("   Slowest files:")
+            for r in summary["slowest"][:5]:
+                print(f"   {r['seconds']:>8.1f}s  {r['file']}  ({r['pages']} pages, mostly {r['slowest_stage']})")
+        print(f"   Report: {self.path}")
+        return summary
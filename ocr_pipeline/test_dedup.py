@@ -0,0 +1,45 @@
+"""Near-duplicate detection (dedup.py) over byte-identical and distinct outputs"""
+
+import json
+import random
+
+from dedup import dedup
+
+def write_book(path, seed):
+    rng = random.Random(seed)
+    words = [f"w{i}" for i in range(500)]
+    with open(path, "w", encoding="utf-8") as f:
+        for _ in range(4):
+            f.write(json.dumps({"text": " ".join(rng.choice(words) for _ in range(200))}) + "\n")
+
+def decisions_by_id(decisions):
+    return {d["id"]: d for d in decisions}
+
+def test_identical_files_each_get_their_own_decision(tmp_path):
+    out = tmp_path / "jsonl"
+    out.mkdir()
+    # aaaa/bbbb and cccc/dddd are byte-identical pairs; eeee is distinct
+    for name, seed in (("aaaa", 1), ("bbbb", 1), ("cccc", 2), ("dddd", 2), ("eeee", 3)):
+        write_book(out / f"book_{name}.jsonl", seed)
+
+    decided = decisions_by_id(dedup([out], tmp_path / "index", workers=2))
+    assert sorted(decided) == ["book_aaaa", "book_bbbb", "book_cccc", "book_dddd", "book_eeee"]
+    assert decided["book_aaaa"]["keep"] and decided["book_cccc"]["keep"] and decided["book_eeee"]["keep"]
+    assert decided["book_bbbb"]["dup_of"] == "book_aaaa"
+    assert decided["book_dddd"]["dup_of"] == "book_cccc"
+    assert all(d["dup_of"] != d["id"] for d in decided.values())
+
+    # A re-run finds everything decided
+    assert dedup([out], tmp_path / "index", workers=2) == []
+
+def test_identical_files_from_cache_at_chunk_level(tmp_path):
+    out = tmp_path / "jsonl"
+    out.mkdir()
+    write_book(out / "book_aaaa.jsonl", 1)
+    dedup([out], tmp_path / "index", level="chunk", workers=2)
+
+    # A copy arriving later reuses the cached signatures under its own ids
+    write_book(out / "book_bbbb.jsonl", 1)
+    decided = decisions_by_id(dedup([out], tmp_path / "index", level="chunk", workers=2))
+    assert sorted(decided) == [f"book_bbbb#{i}" for i in range(4)]
+    assert all(decided[f"book_bbbb#{i}"]["dup_of"] == f"book_aaaa#{i}" for i in range(4))
@@ -0,0 +1,35 @@
+"""Paragraph dedup (para_dedup.py) over per-book files and compressed shards"""
+
+import json
+
+from compressed import ShardSink
+from corpus import output_docs, doc_id, iter_chunks, iter_markdown
+from para_dedup import para_dedup
+
+LICENSE = "This book is distributed under a license that permits copying for any purpose."
+
+def body(i):
+    return f"Chapter {i} opens with a paragraph that no other book in this corpus contains at all."
+
+def test_drops_repeated_paragraphs_in_compressed_shards(tmp_path):
+    src = tmp_path / "in"
+    src.mkdir()
+    sink = ShardSink(src, "jsonl", ".jsonl", codec="gzip")
+    for i in range(3):
+        f = sink.begin(f"book_{i}")
+        f.write(json.dumps({"text": f"{LICENSE}\n\n{body(i)}"}) + "\n")
+        sink.end()
+    sink.close()
+    md = ShardSink(src, "md", ".md", codec="gzip")
+    md.begin("book_3").write(f"# Book 3\n\nSource: book_3.pdf\n\n---\n\n{LICENSE}\n\n{body(3)}\n")
+    md.end()
+    md.close()
+    (src / "book_4.jsonl").write_text(json.dumps({"text": f"{LICENSE}\n\n{body(4)}"}) + "\n", encoding="utf-8")
+
+    assert para_dedup(src, tmp_path / "out", tmp_path / "work", workers=2, max_docs=2) == 5
+
+    docs = {doc_id(d): d for d in output_docs(tmp_path / "out")}
+    assert sorted(docs) == [f"book_{i}" for i in range(5)]
+    for i in (0, 1, 2, 4):
+        assert list(iter_chunks(docs[f"book_{i}"])) == [body(i)]
+    assert list(iter_markdown(docs["book_3"])) == [body(3)]
@@ -0,0 +1,37 @@
+"""Page quality checks (quality.py): real pages pass, junk pages fail"""
+
+from engine import Page
+from quality import score_text, failed_checks, filter_pages
+
+RESULTS_TABLE = """Table 4: BLEU and accuracy on the held-out sets (mean of 5 seeds).
+
+Model BLEU ROUGE-L Acc. Params (M) Time (s)
+Transformer-base 27.30 0.412 81.2 65 12.4
+Transformer-big 28.41 0.425 82.0 213 31.8
+LSTM-4x1024 24.95 0.391 78.6 148 20.3
+ConvS2S 25.16 0.398 79.1 216 18.7
+Ours-small 28.02 0.431 82.9 71 13.1
+Ours-large 29.37 0.446 84.3 238 33.5
+Ours-large+LM 29.81 0.452 84.8 238 35.2
+Ablation (no gate) 27.88 0.427 82.1 69 12.9
+Ablation (no mix) 27.45 0.419 81.6 69 12.7
+Baseline [12] 23.10 0.374 76.4 61 11.8
+"""
+
+JUNK = "~|^ \\\\ }{ ]] %% @@ ## $$ <> <<>> ~~`` ^^ ** ++ == ||~ 1l| |1 {{ }} ;; :: " * 10
+
+def test_results_table_page_passes():
+    s = score_text(RESULTS_TABLE)
+    assert s is not None
+    assert failed_checks(s) == []
+
+def test_symbol_soup_fails():
+    s = score_text(JUNK)
+    assert "symbol" in failed_checks(s)
+
+def test_drop_keeps_table_and_drops_junk():
+    pages = [Page(1, RESULTS_TABLE), Page(2, JUNK), Page(3, "Contents")]
+    stats = []
+    kept = [p.number for p in filter_pages(pages, stats, action="drop")]
+    assert kept == [1, 3]  # page 3 is too short to judge
+    assert [s["page"] for s in stats] == [1, 2]
@@ -0,0 +1,40 @@
+"""Token shards (token_shards.py): documents re-sharded across worker parts"""
+
+import numpy as np
+
+from chunker import get_tokenizer
+from engine import Document, Page
+from token_shards import TokenShardWriter, TokenShards
+
+def shard(root, worker_id, name, key, text):
+    writer = root.for_worker(worker_id)
+    doc = Document(f"{name}.pdf", None)
+    doc.key = key
+    writer.begin(doc, name)
+    writer.write_page(Page(1, text))
+    touched = writer.end()
+    writer.close()
+    return touched
+
+def text_of(shards, name):
+    return bytes(np.concatenate(shards.document(name)).tolist()).decode("utf-8")
+
+def test_reshard_through_another_worker(tmp_path):
+    root = TokenShardWriter(tmp_path, get_tokenizer("bytes"), seq_tokens=16)
+    shard(root, 1, "a", "k1", "old text of a" * 4)
+    shard(root, 0, "b", "kb", "text of b" * 4)
+    old = TokenShards(tmp_path)
+    before, old_a = len(old), len(old.document("a"))
+
+    # "a" changed and is picked up by worker 0 this time
+    new_a = "new a" * 8
+    shard(root, 0, "a", "k2", new_a)
+    shards = TokenShards(tmp_path)
+    assert text_of(shards, "a") == new_a
+    assert len(shards) == before - old_a + len(shards.document("a"))
+    assert shards.total_tokens == len(new_a) + len("text of b" * 4)
+
+    # Same key through the old worker is already sharded; its stale copy is dropped on open
+    assert shard(root, 1, "a", "k2", new_a) == []
+    assert (tmp_path / "part_01" / "index.bin").stat().st_size == 0
+    assert text_of(TokenShards(tmp_path), "a") == new_a
@@ -0,0 +1,20 @@
+"""Token statistics (token_stats.py) over cached, byte-identical outputs"""
+
+import json
+
+import pytest
+
+from token_stats import token_stats
+
+def test_identical_files_keep_their_own_ids(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    out = tmp_path / "jsonl"
+    out.mkdir()
+    for name in ("book_aaaa", "book_bbbb"):
+        (out / f"{name}.jsonl").write_text(json.dumps({"text": "the same book twice"}) + "\n", encoding="utf-8")
+
+    for run in range(2):  # tokenized once, then both from the cache
+        token_stats([out], "bytes", tmp_path / "cache", workers=1, parquet=tmp_path / f"docs{run}.parquet")
+        rows = pq.read_table(tmp_path / f"docs{run}.parquet").to_pylist()
+        assert sorted(r["doc_id"] for r in rows) == ["book_aaaa", "book_bbbb"]
+        assert all(r["tokens"] == len("the same book twice") for r in rows)
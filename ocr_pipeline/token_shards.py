@@ -0,0 +1,339 @@
+"""
+Memory-mapped binary token shards for training.
+
+TokenShardWriter is an engine writer: it chunks each document with the
+TokenChunker and appends the token ids of every sequence to flat
+`tokens_NNNNN.bin` shards (uint16 when the vocab fits, else uint32).
+A shard is closed once it reaches `shard_tokens`; a sequence never
+straddles two shards. Alongside the shards:
+
+    index.bin    int64 records (shard, start, length, doc_no, chunk_no),
+                 one per sequence, appended after the tokens are on disk
+    docs.jsonl   doc_no -> output name, source file, manifest key and
+                 the time it was written; the newest entry of a name wins
+    meta.json    tokenizer, dtype and shard size
+
+A document already in the store is skipped only if its manifest key
+(content, pipeline version and config) matches; otherwise it is written
+again under a new doc_no, and the sequences of the entry it replaces
+are dropped from the index (their tokens stay in the shards as dead
+space).
+
+When the pipeline runs with several worker processes, each worker keeps
+its own store of that layout in part_NN/ under the output directory.
+A document is not tied to a part: it may be re-sharded by another
+worker. The newest entry of a name across all parts is the live one;
+readers ignore the others, and a part drops them from its index the
+next time its writer opens it.
+
+TokenShards is the reader: it memory-maps the index and shards (of every
+part) so any sequence or document is a zero-copy numpy view, and
+dataloaders can start instantly and page data straight from disk.
+"""
+
+from pathlib import Path
+import json
+import os
+import time
+import numpy as np
+
+from chunker import TokenChunker, get_tokenizer
+from telemetry import timed_iter
+
+SHARD_TOKENS = 1 << 28  # 256M tokens: 512 MB per shard as uint16
+INDEX_FIELDS = 5  # shard, start, length, doc_no, chunk_no
+
+def shard_path(out_dir, shard_no):
+    return Path(out_dir) / f"tokens_{shard_no:05d}.bin"
+
+def token_dtype(vocab_size):
+    return np.uint16 if vocab_size <= 1 << 16 else np.uint32
+
+def load_docs(docs_path):
+    """name -> (doc_no, manifest key, written) from docs.jsonl; later entries replace earlier ones"""
+    docs = {}
+    if docs_path.exists():
+        with docs_path.open("r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    d = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn write from a crash
+                docs[d["name"]] = (d["doc_no"], d.get("key"), d.get("written", 0.0))
+    return docs
+
+def newest_docs(stores):
+    """name -> (store no, written) of the newest entry of every name across stores' docs dicts"""
+    newest = {}
+    for k, docs in enumerate(stores):
+        for name, d in docs.items():
+            if name not in newest or d[2] > newest[name][1]:
+                newest[name] = (k, d[2])
+    return newest
+
+def write_index(index_path, records):
+    """Replace index.bin atomically"""
+    tmp = Path(str(index_path) + ".tmp")
+    records.tofile(tmp)
+    tmp.replace(index_path)
+
+# -----------------------
+# Writer
+# -----------------------
+
+class TokenShardWriter:
+    format = "token_shards"
+    wants_markdown = False
+    reading_order = False
+
+    def __init__(self, out_dir, tokenizer, seq_tokens=2048, shard_tokens=SHARD_TOKENS):
+        self.out_dir = Path(out_dir)
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self.tokenizer = get_tokenizer(tokenizer) if isinstance(tokenizer, str) else tokenizer
+        if self.tokenizer.vocab_size is None:
+            raise ValueError(f"{self.tokenizer.name} has no token ids; use bytes, tiktoken or hf")
+        self.seq_tokens = seq_tokens
+        self.shard_tokens = shard_tokens
+        self.dtype = token_dtype(self.tokenizer.vocab_size)
+        self.parts_dir = None  # set on part_NN stores: the directory holding every part
+        self.opened = False  # the store is opened by whichever process writes to it
+
+    def config(self):
+        return {
+            "format": self.format,
+            "tokenizer": self.tokenizer.name,
+            "seq_tokens": self.seq_tokens,
+            "shard_tokens": self.shard_tokens
+        }
+
+    def _open_store(self):
+        """Load existing index/docs, drop replaced or orphaned sequences and cut unindexed tokens"""
+        meta = self.out_dir / "meta.json"
+        if meta.exists():
+            old = json.loads(meta.read_text(encoding="utf-8"))
+            if old["tokenizer"] != self.tokenizer.name:
+                raise ValueError(f"{self.out_dir} holds {old['tokenizer']} tokens, not {self.tokenizer.name}")
+        else:
+            meta.write_text(json.dumps({
+                "tokenizer": self.tokenizer.name,
+                "vocab_size": self.tokenizer.vocab_size,
+                "dtype": np.dtype(self.dtype).name,
+                "shard_tokens": self.shard_tokens
+            }, indent=2), encoding="utf-8")
+
+        self.docs = load_docs(self.out_dir / "docs.jsonl")  # name -> (doc_no, manifest key, written)
+        self.next_doc = max((d[0] for d in self.docs.values()), default=-1) + 1
+        self.replaced = False
+
+        # Entries re-sharded by another part since are superseded here
+        self.elsewhere = {}  # name -> newest entry in another part
+        if self.parts_dir is not None:
+            others = [load_docs(p / "docs.jsonl") for p in sorted(self.parts_dir.glob("part_*")) if p != self.out_dir]
+            for name, (k, _) in newest_docs(others).items():
+                self.elsewhere[name] = others[k][name]
+            for name, d in list(self.docs.items()):
+                if name in self.elsewhere and self.elsewhere[name][2] > d[2]:
+                    del self.docs[name]
+
+        index_path = self.out_dir / "index.bin"
+        records = np.fromfile(index_path, dtype=np.int64) if index_path.exists() else np.zeros(0, np.int64)
+        whole = len(records) // INDEX_FIELDS * INDEX_FIELDS
+        records = records[:whole].reshape(-1, INDEX_FIELDS)
+        if index_path.exists():
+            os.truncate(index_path, whole * 8)
+
+        # Sequences whose doc never made it into docs.jsonl are orphans from a
+        # crash; those of a replaced entry, here or in another part, are superseded
+        keep = np.isin(records[:, 3], self.live_doc_nos())
+        if not keep.all():
+            records = records[keep]
+            write_index(index_path, records)
+
+        if len(records):
+            self.shard_no = int(records[-1, 0])
+            self.shard_len = int(records[-1, 1] + records[-1, 2])
+        else:
+            self.shard_no = 0
+            self.shard_len = 0
+
+        shard = shard_path(self.out_dir, self.shard_no)
+        if shard.exists():
+            os.truncate(shard, self.shard_len * np.dtype(self.dtype).itemsize)
+        for stale in self.out_dir.glob("tokens_*.bin"):
+            if int(stale.stem.split("_")[1]) > self.shard_no:
+                stale.unlink()
+
+    def live_doc_nos(self):
+        return np.array([d[0] for d in self.docs.values()], dtype=np.int64)
+
+    def for_worker(self, worker_id):
+        """Each worker process appends to its own part_NN store"""
+        w = TokenShardWriter(self.out_dir / f"part_{worker_id:02d}", self.tokenizer, self.seq_tokens, self.shard_tokens)
+        w.parts_dir = self.out_dir
+        return w
+
+    def begin(self, doc, name):
+        if not self.opened:
+            self._open_store()
+            self.opened = True
+        self.timings = doc.timings
+        self.name = name
+        self.source = doc.source.name
+        self.key = doc.key
+        # Already sharded (by any part) from the same content and config by a run that crashed before the manifest
+        entries = [d for d in (self.docs.get(name), self.elsewhere.get(name)) if d is not None]
+        self.skip = bool(entries) and max(entries, key=lambda d: d[2])[1] == self.key
+        self.chunker = TokenChunker(self.tokenizer, self.seq_tokens, overlap_tokens=0)
+        self.records = []
+        self.touched = set()
+        self.f = None
+
+    def _write_sequence(self, tokens):
+        if not tokens or self.skip:
+            return
+        if self.shard_len and self.shard_len + len(tokens) > self.shard_tokens:
+            if self.f is not None:
+                self.f.close()
+                self.f = None
+            self.shard_no += 1
+            self.shard_len = 0
+        if self.f is None:
+            self.f = shard_path(self.out_dir, self.shard_no).open("ab")
+        np.asarray(tokens, dtype=self.dtype).tofile(self.f)
+        self.records.append((self.shard_no, self.shard_len, len(tokens), self.next_doc, len(self.records)))
+        self.touched.add(self.shard_no)
+        self.shard_len += len(tokens)
+
+    def write_page(self, page):
+        for _, tokens, _ in timed_iter(self.chunker.feed(page.text, page.number), self.timings, "chunk"):
+            self._write_sequence(tokens)
+
+    def end(self):
+        for _, tokens, _ in timed_iter(self.chunker.flush(), self.timings, "chunk"):
+            self._write_sequence(tokens)
+        if self.f is not None:
+            self.f.flush()
+            os.fsync(self.f.fileno())
+            self.f.close()
+            self.f = None
+        if self.skip:
+            return []
+
+        # Tokens first, then index, then docs: the doc entry is the commit point
+        with (self.out_dir / "index.bin").open("ab") as f:
+            np.asarray(self.records, dtype=np.int64).reshape(-1, INDEX_FIELDS).tofile(f)
+        written = time.time()
+        with (self.out_dir / "docs.jsonl").open("a", encoding="utf-8") as f:
+            f.write(json.dumps({
+                "doc_no": self.next_doc,
+                "name": self.name,
+                "source": self.source,
+                "key": self.key,
+                "written": written,
+                "sequences": len(self.records)
+            }) + "\n")
+        self.replaced = self.replaced or self.name in self.docs
+        self.docs[self.name] = (self.next_doc, self.key, written)
+        self.next_doc += 1
+        return [shard_path(self.out_dir, n) for n in sorted(self.touched)]
+
+    def abort(self):
+        # Tokens past the last indexed sequence are cut on the next open
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+
+    def close(self):
+        """End of run: drop the sequences of replaced entries from the index"""
+        if not (self.opened and self.replaced):
+            return
+        index_path = self.out_dir / "index.bin"
+        records = np.fromfile(index_path, dtype=np.int64).reshape(-1, INDEX_FIELDS)
+        write_index(index_path, records[np.isin(records[:, 3], self.live_doc_nos())])
+        self.replaced = False
+
+# -----------------------
+# Reader
+# -----------------------
+
+class ShardStore:
+    """One index/docs/shards directory, memory-mapped"""
+
+    def __init__(self, out_dir):
+        self.out_dir = Path(out_dir)
+        self.meta = json.loads((self.out_dir / "meta.json").read_text(encoding="utf-8"))
+        self.dtype = np.dtype(self.meta["dtype"])
+        index_path = self.out_dir / "index.bin"
+        n = index_path.stat().st_size // (8 * INDEX_FIELDS) if index_path.exists() else 0
+        self.index = (
+            np.memmap(index_path, dtype=np.int64, mode="r", shape=(n, INDEX_FIELDS))
+            if n else np.zeros((0, INDEX_FIELDS), np.int64)
+        )
+        self.shards = {}
+        self.entries = load_docs(self.out_dir / "docs.jsonl")
+        self.docs = {name: d[0] for name, d in self.entries.items()}
+        self.select()
+
+    def drop(self, names):
+        """Forget documents whose newest entry lives in another store"""
+        for name in names:
+            del self.docs[name]
+        self.select()
+
+    def select(self):
+        # Entries replaced since the writer last compacted the index are not live
+        live = np.isin(self.index[:, 3], list(self.docs.values()))
+        if not live.all():
+            self.index = self.index[live]
+
+    def shard(self, shard_no):
+        if shard_no not in self.shards:
+            self.shards[shard_no] = np.memmap(shard_path(self.out_dir, shard_no), dtype=self.dtype, mode="r")
+        return self.shards[shard_no]
+
+    def sequence(self, i):
+        shard_no, start, length = (int(x) for x in self.index[i, :3])
+        return self.shard(shard_no)[start:start + length]
+
+class TokenShards:
+    """Zero-copy random access to sequences and documents in a shard directory"""
+
+    def __init__(self, out_dir):
+        self.out_dir = Path(out_dir)
+        if (self.out_dir / "meta.json").exists():
+            self.stores = [ShardStore(self.out_dir)]
+        else:
+            self.stores = [ShardStore(p) for p in sorted(self.out_dir.glob("part_*")) if (p / "meta.json").exists()]
+        if not self.stores:
+            raise FileNotFoundError(f"No token shards under {self.out_dir}")
+        # A document re-sharded by another worker is live only in the newest part
+        newest = newest_docs([s.entries for s in self.stores])
+        for k, store in enumerate(self.stores):
+            store.drop([name for name in store.docs if newest[name][0] != k])
+        self.meta = self.stores[0].meta
+        # Global sequence i lives in store k where starts[k] <= i < starts[k + 1]
+        self.starts = np.cumsum([0] + [len(s.index) for s in self.stores])
+
+    def __len__(self):
+        return int(self.starts[-1])
+
+    def __getitem__(self, i):
+        """Token ids of sequence i as a read-only view into its shard"""
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        k = int(np.searchsorted(self.starts, i, side="right")) - 1
+        return self.stores[k].sequence(i - int(self.starts[k]))
+
+    def document(self, name):
+        """All sequences of one document (by output name), in order"""
+        for store in self.stores:
+            if name in store.docs:
+                rows = np.flatnonzero(store.index[:, 3] == store.docs[name])
+                return [store.sequence(int(i)) for i in rows]
+        raise KeyError(name)
+
+    @property
+    def total_tokens(self):
+        return int(sum(s.index[:, 2].sum() for s in self.stores))
@@ -0,0 +1,371 @@
+"""
+Token statistics over processed pipeline outputs.
+
+Answers "how many tokens do we have, and where from" for the outputs
+the writers produced: per-book book_*.jsonl / book_*.md files,
+compressed shards (compressed.py) and Parquet chunk shards
+(columnar.py). Point it at one format's directory: the same book in
+jsonl/ and md/ would be counted twice.
+
+Every output file is a scan unit. Units are tokenized in parallel
+worker processes (one tokenizer per worker, ENCODE_BATCH pieces per
+call) into per-document counts and one id histogram per unit. Each
+result is cached under --cache, keyed by the SHA-256 of the unit's
+bytes plus the tokenizer, so a re-run only tokenizes new or changed
+files. The content hashes themselves are reused while a file's size
+and mtime are unchanged.
+
+The JSON report (--out) has
+    totals          documents, tokens, chars, bytes, bytes per token
+    unknown_byte_rate
+                    share of tokens that are a bare non-ASCII byte
+                    (byte fallback) or the unknown token: text the
+                    vocab does not cover
+    vocab           ids used, coverage of the vocab, ids covering 99%
+                    of the tokens
+    doc_tokens      length percentiles and a power-of-two histogram
+    by_source, by_topic, by_day, by_dir
+                    documents and tokens per source file, per source
+                    directory, per day the output was written and per
+                    output directory
+Sources come from the manifest.jsonl next to (or above) the outputs.
+With --parquet one row per document is written there as well.
+
+The default tokenizer (STATS_TOKENIZER) is tiktoken:cl100k_base, the same
+as the token shards' (pipeline_tokens.py); tiktoken is in
+requirements.txt. Any bytes or hf:<path> spec works as well.
+
+Usage:
+    python token_stats.py processed_dataset_all/*/jsonl --tokenizer hf:tokenizer/tokenizer.json
+"""
+
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import json
+import os
+import re
+import time
+import numpy as np
+from tqdm import tqdm
+
+from chunker import get_tokenizer, ByteTokenizer, TiktokenTokenizer, HFTokenizer
+from compressed import shard_docs
+from corpus import output_files, shard_files, iter_texts
+from manifest import DigestCache, file_sha256, config_hash, output_name
+from bpe_train import BYTE_CHARS
+
+# Install: pip install pyarrow
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_SUPPORT = True
+except ImportError:
+    PARQUET_SUPPORT = False
+
+STATS_TOKENIZER = os.getenv("STATS_TOKENIZER", "tiktoken:cl100k_base")
+STATS_VERSION = 2  # bump when cached unit results change
+ENCODE_BATCH = 64  # text pieces per encode_batch call
+DOC_FIELDS = ("doc_id", "source", "tokens", "chars", "bytes", "unknown_tokens")
+
+BYTE_FALLBACK = re.compile(r"<0x[89A-F][0-9A-F]>")  # sentencepiece-style byte tokens
+
+# -----------------------
+# Tokenizer facts
+# -----------------------
+
+def unknown_token_mask(tokenizer):
+    """Boolean array over token ids: True where a token is a bare non-ASCII byte or the unknown token"""
+    mask = np.zeros(tokenizer.vocab_size, dtype=bool)
+    if isinstance(tokenizer, ByteTokenizer):
+        mask[0x80:] = True
+    elif isinstance(tokenizer, TiktokenTokenizer):
+        for i in range(tokenizer.vocab_size):
+            try:
+                b = tokenizer.enc.decode_single_token_bytes(i)
+            except KeyError:
+                continue  # unused id
+            mask[i] = len(b) == 1 and b[0] >= 0x80
+    elif isinstance(tokenizer, HFTokenizer):
+        tok = tokenizer.tok
+        byte_level = type(tok.decoder).__name__ == "ByteLevel"
+        high_bytes = {c for b, c in BYTE_CHARS.items() if b >= 0x80}
+        unk = getattr(tok.model, "unk_token", None)
+        for token, i in tok.get_vocab().items():
+            mask[i] = (byte_level and token in high_bytes) or token == unk or bool(BYTE_FALLBACK.fullmatch(token))
+    return mask
+
+# -----------------------
+# Scanning (worker processes)
+# -----------------------
+
+def unit_documents(path):
+    """(doc_id, source or None, text pieces) of every document in a scan unit
+
+    A per-book file's doc_id is None: its result is cached by content and
+    shared by identical files, so the id comes from the unit's own name.
+    """
+    path = Path(path)
+    if path.suffix == ".parquet":
+        yield from parquet_documents(path)
+    elif path.suffix in (".jsonl", ".md"):
+        yield None, None, iter_texts(path)
+    else:
+        for doc in shard_docs(path):
+            yield doc.doc_id, None, iter_texts(doc)
+
+def parquet_documents(path):
+    """Chunk rows of a Parquet shard grouped into documents (rows of a document are consecutive)"""
+    current = None
+    pieces = []
+    for batch in pq.ParquetFile(path).iter_batches(columns=["doc_id", "source", "text"]):
+        for doc_id, source, text in zip(*(batch.column(c).to_pylist() for c in ("doc_id", "source", "text"))):
+            if current is not None and doc_id != current[0]:
+                yield current[0], current[1], pieces
+                pieces = []
+            current = (doc_id, source)
+            pieces.append(text)
+    if current is not None:
+        yield current[0], current[1], pieces
+
+def batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+_tokenizer = None
+_unknown = None
+
+def init_worker(spec):
+    global _tokenizer, _unknown
+    _tokenizer = get_tokenizer(spec)
+    _unknown = unknown_token_mask(_tokenizer)
+
+def scan_unit(path):
+    """Per-document counts and the sparse id histogram of one scan unit"""
+    counts = np.zeros(_tokenizer.vocab_size, dtype=np.int64)
+    docs = {}
+    for doc_id, source, pieces in unit_documents(path):
+        d = docs.setdefault(doc_id, dict.fromkeys(DOC_FIELDS, 0))
+        d.update(doc_id=doc_id, source=source)
+        for batch in batches(pieces, ENCODE_BATCH):
+            ids = np.concatenate([np.asarray(e, dtype=np.int64) for e in _tokenizer.encode_batch(batch)] + [np.zeros(0, np.int64)])
+            counts += np.bincount(ids, minlength=len(counts))
+            d["tokens"] += len(ids)
+            d["unknown_tokens"] += int(_unknown[ids].sum())
+            d["chars"] += sum(len(t) for t in batch)
+            d["bytes"] += sum(len(t.encode("utf-8")) for t in batch)
+    ids = np.flatnonzero(counts)
+    return {"docs": list(docs.values())}, ids, counts[ids]
+
+# -----------------------
+# Per-unit cache
+# -----------------------
+
+class StatsCache:
+    """Scan results per unit, keyed by content hash and tokenizer"""
+
+    def __init__(self, cache_dir, tokenizer_id):
+        self.dir = Path(cache_dir)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.config = config_hash({"tokenizer": tokenizer_id, "version": STATS_VERSION})
+        self.hashes = DigestCache(self.dir / "hashes.json")
+
+    def digest(self, path):
+        return self.hashes.digest(path)
+
+    def paths(self, digest):
+        stem = self.dir / f"{digest[:32]}-{self.config}"
+        return Path(f"{stem}.json"), Path(f"{stem}.npz")
+
+    def get(self, digest):
+        meta, arrays = self.paths(digest)
+        if not meta.exists() or not arrays.exists():
+            return None
+        with np.load(arrays) as a:
+            return json.loads(meta.read_text(encoding="utf-8")), a["ids"], a["counts"]
+
+    def put(self, digest, result):
+        meta, arrays = self.paths(digest)
+        stats, ids, counts = result
+        with open(f"{arrays}.tmp", "wb") as f:
+            np.savez(f, ids=ids, counts=counts)
+        os.replace(f"{arrays}.tmp", arrays)
+        # The .json goes last: a unit counts as cached only once both exist
+        Path(f"{meta}.tmp").write_text(json.dumps(stats), encoding="utf-8")
+        os.replace(f"{meta}.tmp", meta)
+
+    def save(self):
+        self.hashes.save()
+
+# -----------------------
+# Report
+# -----------------------
+
+def scan_units(root):
+    """Per-book files, compressed shards and Parquet chunk shards under root"""
+    root = Path(root)
+    return output_files(root) + shard_files(root) + sorted(root.rglob("chunks_*.parquet"))
+
+def manifest_sources(roots):
+    """output stem -> source path, from the manifests in, under or above the output directories"""
+    manifests = set()
+    for root in map(Path, roots):
+        manifests.update(root.rglob("manifest.jsonl"))
+        above = next((p / "manifest.jsonl" for p in root.resolve().parents if (p / "manifest.jsonl").exists()), None)
+        if above is not None:
+            manifests.add(above)
+    sources = {}
+    for m in sorted(manifests):  # the same book in several manifests: the last one wins, every run
+        with m.open("r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn write from an interrupted run
+                sources[output_name(entry["sha256"])] = entry["path"]
+    return sources
+
+def percentiles(values):
+    if not len(values):
+        return {}
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return {"min": int(values.min()), "p50": float(p50), "p90": float(p90), "p99": float(p99),
+            "max": int(values.max()), "mean": round(float(values.mean()), 1)}
+
+def length_histogram(values):
+    """Documents per power-of-two token-count bucket [2^k, 2^(k+1))"""
+    if not len(values):
+        return []
+    buckets = np.bincount(np.floor(np.log2(np.maximum(values, 1))).astype(np.int64))
+    return [{"min": 1 << k if k else 0, "max": (1 << (k + 1)) - 1, "docs": int(n)} for k, n in enumerate(buckets) if n]
+
+def group_totals(rows, key):
+    groups = {}
+    for r in rows:
+        g = groups.setdefault(r[key] or "unknown", {"docs": 0, "tokens": 0, "bytes": 0})
+        g["docs"] += 1
+        g["tokens"] += r["tokens"]
+        g["bytes"] += r["bytes"]
+    return dict(sorted(groups.items(), key=lambda kv: -kv[1]["tokens"]))
+
+def vocab_stats(counts):
+    used = int(np.count_nonzero(counts))
+    total = counts.sum()
+    ranked = np.sort(counts)[::-1].cumsum()
+    return {
+        "used": used,
+        "coverage": round(used / len(counts), 4) if len(counts) else 0.0,
+        "ids_for_99pct": int(np.searchsorted(ranked, 0.99 * total) + 1) if total else 0
+    }
+
+def write_parquet(rows, path):
+    if not PARQUET_SUPPORT:
+        raise ImportError("pyarrow is not installed (pip install pyarrow)")
+    columns = ("doc_id", "unit", "source", "topic", "day", "dir", "tokens", "chars", "bytes", "unknown_tokens")
+    table = pa.table({c: [r[c] for r in rows] for c in columns})
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    pq.write_table(table, path, compression="zstd")
+
+def token_stats(out_dirs, tokenizer=STATS_TOKENIZER, cache_dir="token_stats_cache", workers=None, parquet=None):
+    """Scan every output under out_dirs (cached units are not re-tokenized); returns the report"""
+    started = time.perf_counter()
+    tok = get_tokenizer(tokenizer)
+    if tok.vocab_size is None:
+        raise ValueError(f"{tok.name} has no token ids; use bytes, tiktoken or hf")
+    tokenizer_id = tok.name
+    if isinstance(tok, HFTokenizer):
+        tokenizer_id += f"@{file_sha256(tok.name.partition(':')[2])}"  # retrained in place: new cache key
+    cache = StatsCache(cache_dir, tokenizer_id)
+    units = [u for d in out_dirs for u in scan_units(d)]
+    digests = [cache.digest(u) for u in units]
+    results = {digest: cache.get(digest) for digest in set(digests)}
+    todo = {}  # digest -> unit; identical files are tokenized once
+    for digest, unit in zip(digests, units):
+        if results[digest] is None:
+            todo.setdefault(digest, unit)
+    print(f"📊 {len(units)} output files: {len(units) - len(todo)} cached, {len(todo)} to tokenize with {tok.name}")
+
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(tokenizer,)) as pool:
+            scanned = pool.map(scan_unit, todo.values())
+            for digest, result in tqdm(zip(todo, scanned), total=len(todo), desc="Tokenizing", unit="file"):
+                cache.put(digest, result)
+                results[digest] = result
+    cache.save()
+
+    sources = manifest_sources(out_dirs)
+    counts = np.zeros(tok.vocab_size, dtype=np.int64)
+    rows = []
+    for unit, digest in zip(units, digests):
+        stats, ids, unit_counts = results[digest]
+        np.add.at(counts, ids, unit_counts)
+        day = time.strftime("%Y-%m-%d", time.localtime(unit.stat().st_mtime))
+        for d in stats["docs"]:
+            if d["doc_id"] is None:
+                d = {**d, "doc_id": unit.stem}
+            path = sources.get(d["doc_id"])  # Parquet rows carry the source name, but not its directory
+            source = path or d["source"]
+            rows.append({
+                **d,
+                "unit": str(unit),
+                "source": Path(source).name if source else None,
+                "topic": Path(path).parent.name or None if path else None,
+                "day": day,
+                "dir": str(unit.parent)
+            })
+
+    lengths = np.array([r["tokens"] for r in rows], dtype=np.int64)
+    tokens = int(lengths.sum())
+    n_bytes = sum(r["bytes"] for r in rows)
+    unknown = sum(r["unknown_tokens"] for r in rows)
+    report = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "tokenizer": tok.name,
+        "vocab_size": tok.vocab_size,
+        "dirs": [str(d) for d in out_dirs],
+        "files": len(units),
+        "files_tokenized": len(todo),
+        "totals": {
+            "docs": len(rows),
+            "tokens": tokens,
+            "chars": sum(r["chars"] for r in rows),
+            "bytes": n_bytes,
+            "bytes_per_token": round(n_bytes / tokens, 3) if tokens else None
+        },
+        "unknown_tokens": unknown,
+        "unknown_byte_rate": round(unknown / tokens, 6) if tokens else None,
+        "vocab": vocab_stats(counts),
+        "doc_tokens": {**percentiles(lengths), "histogram": length_histogram(lengths)},
+        "by_source": group_totals(rows, "source"),
+        "by_topic": group_totals(rows, "topic"),
+        "by_day": group_totals(rows, "day"),
+        "by_dir": group_totals(rows, "dir"),
+        "seconds": round(time.perf_counter() - started, 2)
+    }
+    if parquet:
+        write_parquet(rows, parquet)
+    print(f"✅ {report['totals']['docs']} documents, {tokens:,} tokens "
+          f"({report['totals']['bytes_per_token']} bytes/token, unknown-byte rate {report['unknown_byte_rate']}) "
+          f"in {report['seconds']}s")
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Token statistics over pipeline outputs")
+    parser.add_argument("out_dirs", nargs="+", help="directories holding book_*.jsonl / book_*.md outputs or shards")
+    parser.add_argument("--tokenizer", default=STATS_TOKENIZER, help="tokenizer spec (bytes, tiktoken:<enc>, hf:<path>)")
+    parser.add_argument("--out", default="token_stats.json", help="write the JSON report here")
+    parser.add_argument("--parquet", help="also write one row per document to this Parquet file")
+    parser.add_argument("--cache", default="token_stats_cache", help="per-file result cache directory")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    report = token_stats(args.out_dirs, args.tokenizer, args.cache, args.workers, args.parquet)
+    Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+    Path(args.out).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"📄 Report → {args.out}")
@@ -0,0 +1,298 @@
+"""
+Watch-folder ingestion daemon.
+
+Instead of a manual batch over a fixed folder, watch one or more input
+directories and process books as they arrive:
+
+    python watch.py ../Data/Day2 ../Data/Incoming --out processed_dataset_all/Day2
+
+- Changes are picked up with inotify (Linux, via libc) or, where inotify
+  is unavailable or WATCH_POLL=1 (network mounts do not deliver inotify
+  events for remote writes), by rescanning every WATCH_POLL_SECONDS.
+- A file is only queued once its size and mtime have not changed for
+  WATCH_SETTLE_SECONDS, so half-copied uploads are never read. Dotfiles
+  (rsync's and most downloaders' temporary names) are ignored.
+- Ready files go through the same manifest as batch runs: unchanged
+  content is skipped, a file rewritten with new content is processed
+  again. Jobs are fed into one long-running WorkerPool, so limits,
+  retries and quarantine work exactly as in engine.run().
+- Per-document outputs (JSONL, markdown, token shards) appear as each
+  book finishes; Parquet and compressed shards are finalised once the
+  pool has been idle for WATCH_FLUSH_SECONDS, and only then are the
+  books they hold recorded in the manifest.
+
+Ctrl-C stops the workers, closes the writers and prints the run report.
+"""
+
+from pathlib import Path
+import argparse
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import time
+
+from engine import Ingest
+from scheduler import SUPPORTED, WORKERS, POLL_SECONDS
+from writers import JsonlChunkWriter, MarkdownWriter, MathMarkdownWriter
+
+SETTLE_SECONDS = float(os.getenv("WATCH_SETTLE_SECONDS", "10"))
+POLL_INTERVAL = float(os.getenv("WATCH_POLL_SECONDS", "30"))
+FLUSH_SECONDS = float(os.getenv("WATCH_FLUSH_SECONDS", "60"))
+FORCE_POLL = os.getenv("WATCH_POLL", "0") == "1"
+
+FORMATS = ("jsonl", "md", "latex_md", "parquet", "tokens")
+
+def wanted(path):
+    return path.suffix.lower() in SUPPORTED and not path.name.startswith(".")
+
+def scan(dirs):
+    """Every file under dirs, with its (size, mtime_ns)"""
+    found = {}
+    for d in dirs:
+        for f in Path(d).rglob("*"):
+            try:
+                if f.is_file() and wanted(f):
+                    st = f.stat()
+                    found[f] = (st.st_size, st.st_mtime_ns)
+            except OSError:
+                pass  # deleted while scanning
+    return found
+
+# -----------------------
+# Watchers
+# -----------------------
+
+# <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT = struct.Struct("iIII")  # wd, mask, cookie, len; followed by the name
+
+class PollingWatcher:
+    """Rescan the directories every POLL_INTERVAL seconds and report what changed"""
+
+    def __init__(self, dirs):
+        self.dirs = dirs
+        self.seen = {}
+        self.next_scan = 0.0
+
+    def poll(self, timeout):
+        """Changed paths, waiting up to timeout for the next scan"""
+        wait = self.next_scan - time.time()
+        if wait > 0:
+            time.sleep(min(wait, timeout))
+            if wait > timeout:
+                return set()
+        self.next_scan = time.time() + POLL_INTERVAL
+        found = scan(self.dirs)
+        changed = {f for f, stat in found.items() if self.seen.get(f) != stat}
+        self.seen = found
+        return changed
+
+    def close(self):
+        pass
+
+class InotifyWatcher:
+    """inotify watches on every directory below the roots; new subdirectories are watched as they appear"""
+
+    def __init__(self, dirs):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.add_watch = libc.inotify_add_watch
+        self.add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.dirs = dirs
+        self.wds = {}  # watch descriptor -> directory
+        self.first = True
+        for d in dirs:
+            self._watch_tree(Path(d))
+
+    def _watch(self, d):
+        wd = self.add_watch(self.fd, os.fsencode(d), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                raise OSError(err, "inotify watch limit reached (raise fs.inotify.max_user_watches or set WATCH_POLL=1)")
+            if err != errno.ENOENT:  # removed before we got to it
+                raise OSError(err, f"inotify_add_watch failed for {d}")
+            return
+        self.wds[wd] = d
+
+    def _watch_tree(self, root):
+        """Watch root and its subdirectories; return the files already in them"""
+        self._watch(root)
+        files = set()
+        for p in root.rglob("*"):
+            if p.is_dir():
+                self._watch(p)
+            elif wanted(p):
+                files.add(p)
+        return files
+
+    def poll(self, timeout):
+        """Paths created, written or moved in since the last call, waiting up to timeout"""
+        if self.first:
+            # Everything already there counts as new on start-up
+            self.first = False
+            return set(scan(self.dirs))
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        changed = set()
+        while True:
+            try:
+                buf = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            pos = 0
+            while pos < len(buf):
+                wd, mask, _, size = EVENT.unpack_from(buf, pos)
+                name = buf[pos + EVENT.size:pos + EVENT.size + size].rstrip(b"\0")
+                pos += EVENT.size + size
+                if mask & IN_Q_OVERFLOW:
+                    # Events were dropped: fall back to a full scan
+                    changed |= set(scan(self.dirs))
+                    continue
+                if wd not in self.wds or not name:
+                    continue
+                path = self.wds[wd] / os.fsdecode(name)
+                if mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        # Files may have landed before the watch existed
+                        changed |= self._watch_tree(path)
+                elif wanted(path):
+                    changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+def make_watcher(dirs):
+    if not FORCE_POLL:
+        try:
+            return InotifyWatcher(dirs)
+        except (OSError, AttributeError, TypeError) as e:
+            # No inotify (not Linux, no libc symbol) or out of watches
+            print(f"⚠️  inotify unavailable ({e}), polling every {POLL_INTERVAL:.0f}s")
+    return PollingWatcher(dirs)
+
+# -----------------------
+# Debounce
+# -----------------------
+
+class Debouncer:
+    """Hold changed files until their size and mtime have been stable for SETTLE_SECONDS"""
+
+    def __init__(self, settle=SETTLE_SECONDS):
+        self.settle = settle
+        self.pending = {}  # path -> ((size, mtime_ns), stable since)
+
+    def touch(self, paths):
+        now = time.time()
+        for p in paths:
+            self.pending[p] = (None, now)
+
+    def ready(self):
+        """Files that have stopped changing; they leave the pending set"""
+        now = time.time()
+        out = []
+        for p, (last, since) in list(self.pending.items()):
+            try:
+                st = p.stat()
+            except OSError:
+                del self.pending[p]  # gone (or renamed away) before it settled
+                continue
+            stat = (st.st_size, st.st_mtime_ns)
+            if stat != last:
+                self.pending[p] = (stat, now)
+            elif now - since >= self.settle:
+                del self.pending[p]
+                out.append(p)
+        return out
+
+# -----------------------
+# Daemon
+# -----------------------
+
+def make_writers(out_dir, formats):
+    out_dir = Path(out_dir)
+    writers = []
+    for fmt in formats:
+        if fmt == "jsonl":
+            writers.append(JsonlChunkWriter(out_dir / "jsonl"))
+        elif fmt == "md":
+            writers.append(MarkdownWriter(out_dir / "md"))
+        elif fmt == "latex_md":
+            writers.append(MathMarkdownWriter(out_dir / "latex_md"))
+        elif fmt == "parquet":
+            from columnar import ParquetChunkWriter
+            writers.append(ParquetChunkWriter(out_dir / "parquet"))
+        elif fmt == "tokens":
+            from pipeline_tokens import SHARD_TOKENIZER, SEQ_TOKENS
+            from token_shards import TokenShardWriter
+            writers.append(TokenShardWriter(out_dir / "token_shards", SHARD_TOKENIZER, SEQ_TOKENS))
+        else:
+            raise ValueError(f"unknown format {fmt!r} (choose from {', '.join(FORMATS)})")
+    return writers
+
+def watch(dirs, out_dir, writers, workers=WORKERS):
+    """Process files arriving under dirs until interrupted"""
+    dirs = [Path(d) for d in dirs]
+    for d in dirs:
+        if not d.is_dir():
+            raise NotADirectoryError(f"not a directory: {d}")
+    ingest = Ingest(out_dir, writers)
+    watcher = make_watcher(dirs)
+    debouncer = Debouncer()
+    pool = ingest.pool(workers)
+    queued = set()  # content hashes submitted and not finished yet
+
+    def on_done(job, *args):
+        queued.discard(job.digest)
+        ingest.on_done(job, *args)
+
+    print(f"👀 Watching {', '.join(map(str, dirs))} ({type(watcher).__name__}) → {ingest.out_dir}/")
+    pool.start(on_done)
+    idle_since = time.time()
+    unflushed = False
+    try:
+        while True:
+            debouncer.touch(watcher.poll(0 if not pool.idle else POLL_SECONDS))
+            if ingest.unflushed:
+                ingest.record_flushed()  # shards closed by a flush since the last poll
+            jobs = [j for j in ingest.plan(debouncer.ready()) if j.digest not in queued]
+            if jobs:
+                queued.update(j.digest for j in jobs)
+                print(f"📥 Queued {', '.join(j.file.name for j in jobs)}")
+                pool.submit(jobs)
+            if not pool.idle:
+                pool.step()
+                idle_since = time.time()
+                unflushed = True
+            elif unflushed and time.time() - idle_since >= FLUSH_SECONDS:
+                pool.flush()
+                unflushed = False
+    except KeyboardInterrupt:
+        print("\n🛑 Stopping...")
+    finally:
+        watcher.close()
+        pool.shutdown()
+        ingest.finish()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Watch input directories and process new or changed books")
+    parser.add_argument("dirs", nargs="+", help="input directories to watch (recursively)")
+    parser.add_argument("--out", required=True, help="output directory (manifest, reports and one subdirectory per format)")
+    parser.add_argument("--formats", default="jsonl,md", help=f"comma-separated, from {', '.join(FORMATS)}")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    args = parser.parse_args()
+    watch(args.dirs, args.out, make_writers(args.out, args.formats.split(",")), args.workers)
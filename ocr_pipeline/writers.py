@@ -0,0 +1,202 @@
+"""
+Output writers for the extraction engine.
+
+A writer streams one Document at a time into files under its own output
+directory. The engine drives every writer through:
+    config()                -> dict of settings that affect its output
+    begin(doc, name)        -> open outputs for stem `name`
+    write_page(page)        -> called once per cleaned page, in order
+    end()                   -> close outputs, return the paths written
+    abort()                 -> close and delete partial outputs
+    close()                 -> end of run, for writers that batch documents
+    for_worker(worker_id)   -> the instance a worker process should use
+    wants_markdown          -> True to get Page.markdown filled for PDFs
+    reading_order           -> True if PDF text must come in reading order
+so any number of them can consume the same extraction in one run
+without the book ever being held in memory.
+
+With OUTPUT_COMPRESSION=zstd|gzip (or compression=...) the file writers
+append each document to compressed multi-document shards instead of
+writing one file per book (see compressed.py).
+"""
+
+from pathlib import Path
+import copy
+import json
+import os
+
+from chunker import TokenChunker, get_tokenizer, CHUNK_TOKENIZER, CHUNK_TOKENS, CHUNK_OVERLAP
+from telemetry import timed_iter
+from math_md import md_engine, MATH_MD_SUPPORT
+from compressed import ShardSink
+from chunk_index import ChunkIndexBuilder
+
+OUTPUT_COMPRESSION = os.getenv("OUTPUT_COMPRESSION") or None  # zstd | gzip
+OUTPUT_LEVEL = int(os.getenv("OUTPUT_LEVEL", "0")) or None  # codec default when unset
+CHUNK_INDEX = os.getenv("CHUNK_INDEX", "0") == "1"  # per-book offset index (chunk_index.py); stores a second copy of the text
+
+# -----------------------
+# Writers
+# -----------------------
+
+class FileWriter:
+    """One output file per document: <out_dir>/<name><suffix>, or one frame per document in compressed shards"""
+    format = None
+    suffix = None
+    wants_markdown = False
+    reading_order = False
+
+    def __init__(self, out_dir, compression=OUTPUT_COMPRESSION, level=OUTPUT_LEVEL):
+        self.out_dir = Path(out_dir)
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self.shards = ShardSink(self.out_dir, self.format, self.suffix, compression, level) if compression else None
+        self.out = None
+        self.f = None
+
+    def config(self):
+        config = {"format": self.format}
+        if self.shards is not None:
+            config.update(self.shards.config())
+        return config
+
+    def begin(self, doc, name):
+        self.timings = doc.timings
+        if self.shards is not None:
+            self.f = self.shards.begin(name)
+            return
+        self.out = self.out_dir / f"{name}{self.suffix}"
+        self.f = self.out.open("w", encoding="utf-8")
+
+    def end(self):
+        if self.shards is not None:
+            self.f = None
+            return [self.shards.end()]
+        self.f.close()
+        self.f = None
+        return [self.out]
+
+    def abort(self):
+        if self.shards is not None:
+            self.shards.abort()
+            self.f = None
+            return
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+        if self.out is not None:
+            self.out.unlink(missing_ok=True)
+
+    def close(self):
+        if self.shards is not None:
+            self.shards.close()
+
+    def for_worker(self, worker_id):
+        if self.shards is None:
+            # One file per document: workers never write the same file
+            return self
+        w = copy.copy(self)
+        w.shards = self.shards.for_worker(worker_id)
+        return w
+
+class JsonlChunkWriter(FileWriter):
+    """Token-budget chunks, one {"text": ..., "n_tokens": ...} JSON object per line
+
+    With index=True (per-book files only) each output gets a
+    <name>.pages.txt and <name>.idx mapping chunks to pages and offsets.
+    """
+    format = "jsonl"
+    suffix = ".jsonl"
+
+    def __init__(self, out_dir, tokenizer=CHUNK_TOKENIZER, max_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP,
+                 compression=OUTPUT_COMPRESSION, level=OUTPUT_LEVEL, index=CHUNK_INDEX):
+        super().__init__(out_dir, compression, level)
+        self.tokenizer = get_tokenizer(tokenizer) if isinstance(tokenizer, str) else tokenizer
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        # Offsets into a shard's compressed stream are no use for random access
+        self.index = index and self.shards is None
+        self.builder = None
+
+    def config(self):
+        config = {
+            **super().config(),
+            "tokenizer": self.tokenizer.name,
+            "max_tokens": self.max_tokens,
+            "overlap_tokens": self.overlap_tokens
+        }
+        if self.index:
+            config["index"] = True
+        return config
+
+    def begin(self, doc, name):
+        super().begin(doc, name)
+        self.chunker = TokenChunker(self.tokenizer, self.max_tokens, self.overlap_tokens)
+        if self.index:
+            self.builder = ChunkIndexBuilder(self.out, doc.source, doc.digest)
+
+    def write_chunk(self, text, tokens, pages):
+        line = json.dumps({"text": text, "n_tokens": len(tokens)}) + "\n"
+        self.f.write(line)
+        if self.builder is not None:
+            self.builder.add_chunk(len(line), self.chunker.span)  # ASCII: chars == bytes
+
+    def write_page(self, page):
+        if self.builder is not None:
+            self.builder.add_page(page.number, page.text)
+        for c in timed_iter(self.chunker.feed(page.text, page.number), self.timings, "chunk"):
+            self.write_chunk(*c)
+
+    def end(self):
+        for c in timed_iter(self.chunker.flush(), self.timings, "chunk"):
+            self.write_chunk(*c)
+        outputs = super().end()
+        if self.builder is not None:
+            outputs += self.builder.write()
+            self.builder = None
+        return outputs
+
+    def abort(self):
+        super().abort()
+        if self.builder is not None:
+            self.builder.abort()
+            self.builder = None
+
+class MarkdownWriter(FileWriter):
+    """Whole book as markdown with a title/source header"""
+    format = "md"
+    suffix = ".md"
+    reading_order = True  # the markdown is read as a book; chunk-level writers do not need it
+
+    def header(self, doc):
+        md = f"# {doc.title}\n\n"
+        md += f"**Source:** `{doc.source.name}`\n\n"
+        md += "---\n\n"
+        return md
+
+    def begin(self, doc, name):
+        super().begin(doc, name)
+        self.f.write(self.header(doc))
+        self.first = True
+
+    def page_text(self, page):
+        return page.text
+
+    def write_page(self, page):
+        text = self.page_text(page)
+        if not text:
+            return
+        if not self.first:
+            self.f.write("\n\n")
+        self.f.write(text)
+        self.first = False
+
+class MathMarkdownWriter(MarkdownWriter):
+    """Math-aware markdown (pymupdf4llm) for the LaTeX/math dataset, plain text where unavailable"""
+    format = "latex_md"
+    wants_markdown = MATH_MD_SUPPORT
+
+    def config(self):
+        return {**super().config(), "markdown": md_engine()}
+
+    def page_text(self, page):
+        return page.markdown if page.markdown is not None else page.text